@@ -0,0 +1,200 @@
+import os
+import threading
+import time
+import zipfile
+
+# An archived trunk or journal is this file beside where its directory was
+ARCHIVE_SUFFIX = ".archive.zip"
+
+
+def archive_path(node):
+    """Return the path of the archive of a trunk or journal."""
+    return node + ARCHIVE_SUFFIX
+
+
+def holder(journal):
+    """Return the journal or trunk whose archive holds a journal, or None if it is not archived."""
+    for node in (journal, os.path.dirname(journal)):
+        if os.path.isfile(archive_path(node)):
+            return node
+    return None
+
+
+class Archive:
+    """Read-only, compressed copy of a trunk or journal in a zip file.
+
+    Every note is its own deflated member, so one can be read without decompressing the rest, and
+    the zip's central directory is the index the tree is listed from. Each member's comment holds
+    the note's exact mtime. Paths inside map onto the paths the notes had on disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.node = path[:-len(ARCHIVE_SUFFIX)]
+        self._base = os.path.dirname(self.node)
+        self._zip = zipfile.ZipFile(path)
+        st = os.stat(path)
+        # Children rows per node, and member info per note path, from the central directory
+        self._children = {}
+        self._notes = {}
+        journals = set()
+        for info in self._zip.infolist():
+            parts = info.filename.rstrip("/").split("/")
+            if ".notes" not in parts:
+                continue
+            journal = os.path.join(self._base, *parts[:parts.index(".notes")])
+            if journal not in journals:
+                journals.add(journal)
+                self._children.setdefault(os.path.dirname(journal), []).append(
+                    (journal, "journal", os.path.basename(journal), st.st_mtime, 0)
+                )
+            if info.is_dir() or not parts[-1].endswith(".txt"):
+                continue
+            path = os.path.join(self._base, *parts)
+            self._notes[path] = info
+            self._children.setdefault(journal, []).append((path, "note", parts[-1], self.mtime(info), info.file_size))
+        for rows in self._children.values():
+            rows.sort(key=lambda row: row[2])
+
+    def close(self):
+        """Close the zip file."""
+        self._zip.close()
+
+    @staticmethod
+    def mtime(info):
+        """Return the mtime recorded for a member."""
+        try:
+            return float(info.comment)
+        except ValueError:
+            return time.mktime(info.date_time + (0, 0, -1))
+
+    def children(self, node):
+        """Return (path, kind, name, mtime, size) rows for the children of a node in the archive."""
+        return list(self._children.get(node, []))
+
+    def notes(self):
+        """Return the path of every note in the archive."""
+        return list(self._notes)
+
+    def stat(self, path):
+        """Return (mtime, size) of a note."""
+        info = self._info(path)
+        return self.mtime(info), info.file_size
+
+    def read(self, path):
+        """Return the text of a note."""
+        return self._zip.read(self._info(path)).decode("utf-8")
+
+    def read_file(self, path):
+        """Return the bytes of any member, such as a journal's metadata file."""
+        try:
+            return self._zip.read(os.path.relpath(path, self._base).replace(os.sep, "/"))
+        except KeyError:
+            raise FileNotFoundError(path) from None
+
+    def _info(self, path):
+        info = self._notes.get(path)
+        if info is None:
+            raise FileNotFoundError(path)
+        return info
+
+    def extract(self, task=None):
+        """Write every member back out under the archived node's parent, with its mtime.
+
+        Returns the paths written, or None if task was cancelled, after removing them again.
+        """
+        written = []
+        for info in self._zip.infolist():
+            if task is not None and task.cancelled:
+                for path in reversed(written):
+                    if os.path.isdir(path):
+                        os.rmdir(path)
+                    else:
+                        os.remove(path)
+                return None
+            path = os.path.join(self._base, *info.filename.rstrip("/").split("/"))
+            _make_dirs(path if info.is_dir() else os.path.dirname(path), written)
+            if info.is_dir():
+                continue
+            with self._zip.open(info) as src, open(path, "xb") as dst:
+                while True:
+                    chunk = src.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+            mtime = self.mtime(info)
+            os.utime(path, (mtime, mtime))
+            written.append(path)
+            if task is not None and path in self._notes:
+                task.advance(os.path.basename(path))
+        return written
+
+
+def _make_dirs(path, written):
+    """Create path and any missing parents, adding each one created to written."""
+    missing = []
+    while not os.path.isdir(path):
+        missing.append(path)
+        path = os.path.dirname(path)
+    for path in reversed(missing):
+        os.mkdir(path)
+        written.append(path)
+
+
+def create(node, members, task=None):
+    """Write the archive of node from (path, text, mtime) members. Returns False if task was cancelled.
+
+    Paths are the ones the files have under node; a path ending in os.sep adds an empty directory.
+    The archive is built beside its final name and only then moved into place.
+    """
+    base = os.path.dirname(node)
+    tmp_path = archive_path(node) + ".tmp"
+    with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for path, text, mtime in members:
+            if task is not None and task.cancelled:
+                break
+            name = os.path.relpath(path, base).replace(os.sep, "/")
+            if path.endswith(os.sep):
+                zf.writestr(name + "/", b"")
+                continue
+            info = zipfile.ZipInfo(name, time.localtime(max(mtime, 315532800))[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.comment = repr(mtime).encode()
+            zf.writestr(info, text.encode("utf-8", "surrogatepass"))
+            if task is not None and name.endswith(".txt"):
+                task.advance(os.path.basename(path))
+    if task is not None and task.cancelled:
+        os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, archive_path(node))
+    return True
+
+
+# Open archives, shared by every caller in the process
+_archives = {}
+_archives_lock = threading.Lock()
+
+
+def get_archive(node):
+    """Return the open Archive of an archived trunk or journal."""
+    path = archive_path(node)
+    with _archives_lock:
+        opened = _archives.get(path)
+        if opened is None:
+            opened = _archives[path] = Archive(path)
+        return opened
+
+
+def release(node):
+    """Close the archive of node, and of anything archived below it, before it is moved or deleted."""
+    with _archives_lock:
+        for path in [p for p in _archives if p == archive_path(node) or p.startswith(node + os.sep)]:
+            _archives.pop(path).close()
+
+
+def close_all():
+    """Close every open archive."""
+    with _archives_lock:
+        for opened in _archives.values():
+            opened.close()
+        _archives.clear()
@@ -0,0 +1,343 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from packstore import PACK_FILE
+
+# Layout of a backup folder: the current manifest, plus for versioned backups one manifest per
+# run and every file version stored once under its SHA-256
+MANIFEST_FILE = "manifest.json"
+SNAPSHOTS_DIR = "snapshots"
+OBJECTS_DIR = "objects"
+MIRROR_DIR = "mirror"
+
+COPY_CHUNK = 1024 * 1024
+
+# Backups read at most this many bytes a second, so they stay out of the way of the editor
+BACKUP_BYTES_PER_SEC = 8 * 1024 * 1024
+
+# Files under the trunk root that are never backed up: half-written temporaries
+SKIP_SUFFIXES = (".tmp", ".migrating")
+
+
+def _lower_priority():
+    """Lower the CPU and, where the OS ties it to CPU niceness, I/O priority of the calling thread."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (AttributeError, OSError):
+        pass  # Not available on this platform; the read throttle still applies
+
+
+class Backup:
+    """Incremental backup of a trunk root into a folder, driven by a manifest of (size, mtime_ns, sha256).
+
+    A file whose size and mtime match the manifest is not read at all. A versioned backup stores
+    each distinct file content once under its digest and keeps a manifest per run, so a renamed
+    or moved note costs only a manifest entry and any run can be restored. A mirror keeps a plain
+    copy of the tree instead, renaming its own copy when a note moved. Packs are copied through
+    SQLite's backup API so a copy taken mid-write is still consistent.
+    """
+
+    def __init__(self, trunk_root, dest, versioned=True):
+        self.trunk_root = trunk_root
+        self.dest = dest
+        self.versioned = versioned
+        self.copied = 0
+        self.reused = 0
+        self.failed = []
+        self._budget_start = time.monotonic()
+        self._budget_bytes = 0
+
+    # Manifests
+
+    def manifest(self):
+        """Return the current manifest, {relative path: [size, mtime_ns, digest]}."""
+        return self._load(os.path.join(self.dest, MANIFEST_FILE))
+
+    def snapshots(self):
+        """Return the names of the versioned backups kept, oldest first."""
+        try:
+            return sorted(name[:-5] for name in os.listdir(os.path.join(self.dest, SNAPSHOTS_DIR)) if name.endswith(".json"))
+        except FileNotFoundError:
+            return []
+
+    def _load(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save(self, path, manifest):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+
+    def _scan(self):
+        """Return {relative path: (size, mtime_ns)} for every file under the trunk root.
+
+        Empty folders, such as a journal without notes, are listed too, with a trailing separator.
+        """
+        files = {}
+        for dir_path, dir_names, file_names in os.walk(self.trunk_root):
+            dir_names.sort()
+            if not dir_names and not file_names and dir_path != self.trunk_root:
+                files[os.path.relpath(dir_path, self.trunk_root) + os.sep] = (0, 0)
+            for name in file_names:
+                if name.endswith(SKIP_SUFFIXES):
+                    continue
+                path = os.path.join(dir_path, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files[os.path.relpath(path, self.trunk_root)] = (st.st_size, st.st_mtime_ns)
+        return files
+
+    # Backing up
+
+    def run(self, task=None):
+        """Back up everything new or changed since the last run. Returns False if task was cancelled."""
+        _lower_priority()
+        old = self.manifest()
+        files = self._scan()
+        changed = [rel for rel, stat in files.items() if rel not in old or tuple(old[rel][:2]) != stat]
+        if task is not None:
+            task.total = len(changed)
+        # Where each content already is in the backup, so moved and copied notes are not copied again
+        by_digest = {entry[2]: rel for rel, entry in old.items()}
+        new = {rel: old[rel] for rel in files if rel not in changed}
+        # Paths whose stored copy holds what the new manifest says: unchanged ones, then each one done
+        intact = set(new)
+        for rel in changed:
+            if task is not None and task.cancelled:
+                return False
+            try:
+                new[rel] = self._back_up(rel, files[rel], by_digest, files, intact)
+                intact.add(rel)
+            except FileNotFoundError:
+                pass  # Deleted since the scan
+            except OSError:
+                # Changing under us; the next run picks it up, and meanwhile the last copy stands
+                self.failed.append(rel)
+                if rel in old:
+                    new[rel] = old[rel]
+                    intact.add(rel)
+            if task is not None:
+                task.advance(os.path.basename(rel))
+        if not self.versioned:
+            self._prune_mirror(old, new)
+        if self.versioned and (new != old or not self.snapshots()):
+            self._save(self._snapshot_path(), new)
+        self._save(os.path.join(self.dest, MANIFEST_FILE), new)
+        return True
+
+    def _snapshot_path(self):
+        """Return a free snapshot file name for now."""
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.dest, SNAPSHOTS_DIR, stamp + ".json")
+        counter = 2
+        while os.path.exists(path):
+            path = os.path.join(self.dest, SNAPSHOTS_DIR, f"{stamp}_{counter}.json")
+            counter += 1
+        return path
+
+    def _back_up(self, rel, stat, by_digest, files, intact):
+        """Store one changed file, returning its manifest entry."""
+        if rel.endswith(os.sep):
+            if not self.versioned:
+                os.makedirs(os.path.join(self.dest, MIRROR_DIR, rel), exist_ok=True)
+            return [0, 0, ""]
+        src = os.path.join(self.trunk_root, rel)
+        tmp_path = os.path.join(self.dest, OBJECTS_DIR if self.versioned else MIRROR_DIR, rel.replace(os.sep, "_") + ".tmp")
+        os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+        if os.path.basename(rel) == PACK_FILE:
+            digest = self._copy_pack(src, tmp_path)
+        else:
+            digest = self._digest(src)
+        if digest in by_digest:
+            known = by_digest[digest]
+            if self.versioned or self._move_in_mirror(known, rel, files, intact):
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                by_digest[digest] = rel
+                self.reused += 1
+                return [stat[0], stat[1], digest]
+        if not os.path.exists(tmp_path) and self._throttled_copy(src, tmp_path) != digest:
+            os.remove(tmp_path)
+            raise OSError(f"{rel} changed while it was backed up")
+        os.replace(tmp_path, self._stored_path(rel, digest))
+        by_digest[digest] = rel
+        self.copied += 1
+        return [stat[0], stat[1], digest]
+
+    def _stored_path(self, rel, digest):
+        """Return where the backup keeps a file's content, creating its folder."""
+        if self.versioned:
+            path = os.path.join(self.dest, OBJECTS_DIR, digest[:2], digest)
+        else:
+            path = os.path.join(self.dest, MIRROR_DIR, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def _move_in_mirror(self, known, rel, files, intact):
+        """Give rel the mirror's copy of known, moving it if known is gone from the source. Returns False if it cannot."""
+        src = os.path.join(self.dest, MIRROR_DIR, known)
+        if (known in files and known not in intact) or not os.path.isfile(src):
+            return False  # Already overwritten this run, or moved away
+        dst = self._stored_path(rel, None)
+        if known in files:
+            shutil.copy2(src, dst)
+        else:
+            os.replace(src, dst)
+        return True
+
+    def _prune_mirror(self, old, new):
+        """Delete mirror files and empty folders whose source is gone."""
+        for rel in sorted(set(old) - set(new), reverse=True):
+            path = os.path.join(self.dest, MIRROR_DIR, rel)
+            try:
+                if rel.endswith(os.sep):
+                    os.rmdir(path)
+                else:
+                    os.remove(path)
+            except OSError:
+                pass  # Already moved, or a folder that has files again
+
+    def _digest(self, path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(COPY_CHUNK), b""):
+                self._throttle(len(chunk))
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _throttled_copy(self, src, dst):
+        """Copy a file and return the digest of what was copied."""
+        digest = hashlib.sha256()
+        with open(src, "rb") as fin, open(dst, "wb") as fout:
+            for chunk in iter(lambda: fin.read(COPY_CHUNK), b""):
+                self._throttle(len(chunk))
+                digest.update(chunk)
+                fout.write(chunk)
+        shutil.copystat(src, dst)
+        return digest.hexdigest()
+
+    def _copy_pack(self, src, dst):
+        """Copy a pack as one consistent SQLite snapshot and return the copy's digest."""
+        if os.path.exists(dst):
+            os.remove(dst)
+        source = sqlite3.connect(src)
+        target = sqlite3.connect(dst)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        return self._digest(dst)
+
+    def _throttle(self, size):
+        """Sleep as needed to keep reads under BACKUP_BYTES_PER_SEC."""
+        self._budget_bytes += size
+        ahead = self._budget_bytes / BACKUP_BYTES_PER_SEC - (time.monotonic() - self._budget_start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+    # Checking and restoring
+
+    def verify(self, task=None):
+        """Re-hash every stored file of the current manifest and return the paths whose copy is missing or damaged."""
+        manifest = self.manifest()
+        if task is not None:
+            task.total = len(manifest)
+        bad = []
+        checked = set()
+        for rel, (_, _, digest) in sorted(manifest.items()):
+            if task is not None and task.cancelled:
+                break
+            if not digest:
+                continue
+            stored = self._stored_path(rel, digest)
+            if stored not in checked:
+                checked.add(stored)
+                try:
+                    ok = self._digest(stored) == digest
+                except FileNotFoundError:
+                    ok = False
+                if not ok:
+                    bad.append(rel)
+            if task is not None:
+                task.advance(os.path.basename(rel))
+        return bad
+
+    def restore(self, target, snapshot=None, task=None):
+        """Write the backed-up tree, or a versioned backup's snapshot, into target, which must not exist yet.
+
+        Each file is checked against its digest and given back its mtime. Returns the paths that
+        could not be restored intact, or None if task was cancelled.
+        """
+        if snapshot is None:
+            manifest = self.manifest()
+        else:
+            manifest = self._load(os.path.join(self.dest, SNAPSHOTS_DIR, snapshot + ".json"))
+        os.makedirs(target)
+        if task is not None:
+            task.total = len(manifest)
+        bad = []
+        for rel, (_, mtime_ns, digest) in sorted(manifest.items()):
+            if task is not None and task.cancelled:
+                return None
+            path = os.path.join(target, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if not digest:
+                continue
+            try:
+                shutil.copyfile(self._stored_path(rel, digest), path)
+                if self._digest(path) != digest:
+                    bad.append(rel)
+                os.utime(path, ns=(mtime_ns, mtime_ns))
+            except FileNotFoundError:
+                bad.append(rel)
+            if task is not None:
+                task.advance(os.path.basename(rel))
+        return bad
+
+
+class BackupScheduler:
+    """Run a Backup on its own thread every interval minutes until stopped.
+
+    on_done(backup, error) is called on that thread after each run.
+    """
+
+    def __init__(self, make_backup, interval, on_done=None):
+        self.make_backup = make_backup
+        self.interval = interval
+        self.on_done = on_done
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """Start the schedule; the first backup runs after one interval."""
+        self._thread.start()
+
+    def stop(self):
+        """Stop after the current run, if any."""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval * 60):
+            backup = self.make_backup()
+            error = None
+            try:
+                backup.run()
+            except Exception as e:
+                error = e
+            if self.on_done is not None:
+                self.on_done(backup, error)
@@ -0,0 +1,102 @@
+"""Benchmark quick-open name lookups on a synthetic set of trunks, journals and notes.
+
+Each query is typed one keystroke at a time, the way the palette sees it.
+Example: python bench_names.py --notes 100000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import string
+import time
+
+from nameindex import NameIndex
+
+QUERIES = [
+    "a",
+    "meet",
+    "meeting notes",
+    "jo 4",
+    "q z",
+    "trunk 7",
+    "nosuchname",
+]
+
+
+def generate_rows(notes, journals, trunks, seed):
+    """Return (path, kind, name) rows like the catalog's for a synthetic tree."""
+    rng = random.Random(seed)
+    words = ["meeting", "notes", "plan", "todo", "draft", "ideas"]
+    words += ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(5000)]
+    rows = []
+    for t in range(trunks):
+        trunk = os.path.join(os.sep, "trunks", f"trunk_{t}")
+        rows.append((trunk, "trunk", f"trunk_{t}"))
+        for j in range(journals):
+            journal = os.path.join(trunk, f"journal_{j}")
+            rows.append((journal, "journal", f"journal_{j}"))
+    journal_rows = [row for row in rows if row[1] == "journal"]
+    for i in range(notes):
+        journal = journal_rows[i % len(journal_rows)][0]
+        name = "_".join(rng.sample(words, rng.randint(1, 4))) + ".txt"
+        rows.append((os.path.join(journal, ".notes", name), "note", name))
+    return rows
+
+
+def time_queries(index, repeat):
+    """Type each query repeat times and return per-keystroke timings in milliseconds."""
+    results = {}
+    for query in QUERIES:
+        samples = []
+        hits = 0
+        for _ in range(repeat):
+            index.search("")
+            for end in range(1, len(query) + 1):
+                start = time.perf_counter()
+                hits = len(index.search(query[:end]))
+                samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        results[query] = {
+            "hits": hits,
+            "p50_ms": round(statistics.median(samples), 3),
+            "max_ms": round(samples[-1], 3),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=100000)
+    parser.add_argument("--journals", type=int, default=50, help="journals per trunk")
+    parser.add_argument("--trunks", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    rows = generate_rows(args.notes, args.journals, args.trunks, args.seed)
+    index = NameIndex()
+    start = time.perf_counter()
+    index.load(rows)
+    load_s = time.perf_counter() - start
+
+    note = next(row for row in reversed(rows) if row[1] == "note")
+    start = time.perf_counter()
+    index.move(note[0], os.path.join(os.path.dirname(note[0]), "renamed_note.txt"))
+    rename_ms = (time.perf_counter() - start) * 1000
+
+    results = {
+        "entries": len(index),
+        "load_s": round(load_s, 2),
+        "rename_one_ms": round(rename_ms, 3),
+        "queries": time_queries(index, args.repeat),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Benchmark the full-text search index on a synthetic set of notes.
+
+Example: python bench_search.py --notes 100000 --words 1700
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+from search_index import SearchIndex
+
+QUERIES = [
+    "w1",
+    "w7",
+    "w250",
+    "w9000",
+    "w1 w2",
+    "w50 w900",
+    '"w1 w2"',
+    '"w3 w4 w5"',
+    'w12 "w1 w2"',
+    "nosuchword",
+]
+
+
+def make_vocabulary(size):
+    """Return words and cumulative Zipf-like weights so a few words are common and most are rare."""
+    words = [f"w{rank}" for rank in range(1, size + 1)]
+    cum_weights = list(itertools.accumulate(1.0 / rank for rank in range(1, size + 1)))
+    return words, cum_weights
+
+
+def generate_notes(root, notes, words_per_note, vocabulary, seed):
+    """Write synthetic notes under root and return (path, mtime, size) for each."""
+    rng = random.Random(seed)
+    words, cum_weights = make_vocabulary(vocabulary)
+    result = []
+    per_dir = 1000
+    for i in range(notes):
+        dir_path = os.path.join(root, f"journal_{i // per_dir}", ".notes")
+        if i % per_dir == 0:
+            os.makedirs(dir_path, exist_ok=True)
+        path = os.path.join(dir_path, f"note_{i}.txt")
+        text = " ".join(rng.choices(words, cum_weights=cum_weights, k=words_per_note))
+        with open(path, "w") as f:
+            f.write(text)
+        st = os.stat(path)
+        result.append((path, st.st_mtime, st.st_size))
+    return result
+
+
+def time_queries(index, repeat):
+    """Run each query repeat times and return per-query timings in milliseconds."""
+    results = {}
+    for query in QUERIES:
+        samples = []
+        hits = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            hits = len(index.search(query))
+            samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        results[query] = {
+            "hits": hits,
+            "p50_ms": round(statistics.median(samples), 3),
+            "max_ms": round(samples[-1], 3),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=10000)
+    parser.add_argument("--words", type=int, default=300, help="words per note")
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="journa_bench_")
+    try:
+        root = os.path.join(work_dir, "notes")
+        start = time.perf_counter()
+        notes = generate_notes(root, args.notes, args.words, args.vocabulary, args.seed)
+        generate_s = time.perf_counter() - start
+        text_bytes = sum(size for _, _, size in notes)
+
+        index = SearchIndex(os.path.join(work_dir, "search.sqlite3"))
+        start = time.perf_counter()
+        index.sync(root, notes)
+        index.wait()
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        path = notes[len(notes) // 2][0]
+        with open(path, "a") as f:
+            f.write(" appended words")
+        index.update(path)
+        index.wait()
+        update_ms = (time.perf_counter() - start) * 1000
+
+        results = {
+            "notes": args.notes,
+            "text_mb": round(text_bytes / 1e6, 1),
+            "generate_s": round(generate_s, 2),
+            "build_s": round(build_s, 2),
+            "update_one_ms": round(update_ms, 2),
+            "queries": time_queries(index, args.repeat),
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
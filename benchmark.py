@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from largenote import LargeNote
+from notestore import NoteStore, notes_dir
+
+WORDS = (
+    "morning coffee meeting notes project idea garden river travel budget review draft letter "
+    "book chapter recipe dinner weekend plan call family friend weather walk music film update "
+    "server deploy release bug fix design sketch paper quote memory dream list task goal habit"
+).split()
+
+
+def make_text(rng, words):
+    """Return synthetic note text of about words words, in short lines."""
+    lines = []
+    while words > 0:
+        count = min(words, rng.randint(6, 14))
+        lines.append(" ".join(rng.choice(WORDS) for _ in range(count)))
+        words -= count
+    return "\n".join(lines) + "\n"
+
+
+def generate(root, trunks, journals, notes, huge, huge_mb, rng):
+    """Write a synthetic tree of trunks x journals x notes, plus huge notes in a journal of their own."""
+    for t in range(trunks):
+        for j in range(journals):
+            path = notes_dir(os.path.join(root, f"trunk_{t:03d}", f"journal_{j:03d}"))
+            os.makedirs(path)
+            for n in range(notes):
+                with open(os.path.join(path, f"note_{n:03d}.txt"), "w") as f:
+                    f.write(make_text(rng, rng.randint(50, 600)))
+    huge_paths = []
+    path = notes_dir(os.path.join(root, "trunk_000", "huge"))
+    os.makedirs(path)
+    block = make_text(rng, 200000).encode()
+    for h in range(huge):
+        huge_paths.append(os.path.join(path, f"huge_{h}.txt"))
+        with open(huge_paths[-1], "wb") as f:
+            for _ in range(max(1, huge_mb * 1024 * 1024 // len(block))):
+                f.write(block)
+    return huge_paths
+
+
+class Timings:
+    """Collect durations per operation."""
+
+    def __init__(self):
+        self.samples = {}
+
+    def time(self, name, fn, *args):
+        """Run fn(*args), record how long it took under name and return its result."""
+        start = time.perf_counter()
+        result = fn(*args)
+        self.samples.setdefault(name, []).append(time.perf_counter() - start)
+        return result
+
+    def summary(self):
+        """Return {name: stats} with times in milliseconds."""
+        out = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            out[name] = {
+                "count": len(ordered),
+                "total_ms": sum(ordered) * 1000,
+                "mean_ms": statistics.fmean(ordered) * 1000,
+                "median_ms": statistics.median(ordered) * 1000,
+                "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                "max_ms": ordered[-1] * 1000,
+            }
+        return out
+
+
+def open_large(path):
+    note = LargeNote(path)
+    note.load(note.line_count // 2)
+    note.close()
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    work = args.dir or tempfile.mkdtemp(prefix="journa-bench-")
+    root = os.path.join(work, "Trunks")
+    data_dir = os.path.join(work, "data")
+    os.makedirs(data_dir, exist_ok=True)
+    timings = Timings()
+    try:
+        huge = timings.time("generate", generate, root, args.trunks, args.journals, args.notes, args.huge, args.huge_mb, rng)
+        store = NoteStore(root, data_dir)
+        if args.packed:
+            # Huge notes stay files, since they are opened a window at a time
+            for trunk in sorted(os.listdir(root)):
+                for journal in sorted(os.listdir(os.path.join(root, trunk))):
+                    if journal != "huge":
+                        timings.time("pack", store.pack_journal, os.path.join(root, trunk, journal))
+
+        # Listing: a cold reconcile builds the catalog and index, a warm one only stats directories
+        timings.time("reconcile_cold", store.reconcile)
+        timings.time("index_build", store.search_index.wait)
+        timings.time("reconcile_warm", store.reconcile)
+        trunks = [path for path, kind, _ in store.children(root) if kind == "trunk" and path != store.unsaved_trunk]
+        journals = []
+        for trunk in trunks:
+            journals.extend(path for path, _, _ in store.children(trunk))
+        notes = []
+        for journal in journals:
+            notes.extend(path for path, _, _ in store.children(journal) if not os.path.basename(path).startswith("huge_"))
+        for _ in range(args.repeat):
+            timings.time("list_root", store.children, root)
+            timings.time("list_trunk", store.children, rng.choice(trunks))
+            timings.time("list_journal", store.children, rng.choice(journals))
+
+        for _ in range(args.repeat):
+            timings.time("open", store.read, rng.choice(notes))
+        for path in huge:
+            timings.time("open_large", open_large, path)
+
+        for _ in range(args.repeat):
+            path = rng.choice(notes)
+            timings.time("save", store.save, path, store.read(path) + make_text(rng, 20))
+        timings.time("index_updates", store.search_index.wait)
+
+        for _ in range(args.repeat):
+            timings.time("search_word", store.search, rng.choice(WORDS))
+            timings.time("search_words", store.search, " ".join(rng.sample(WORDS, 2)))
+            timings.time("search_phrase", store.search, '"' + " ".join(rng.sample(WORDS, 2)) + '"')
+
+        for _ in range(args.repeat):
+            path = notes.pop(rng.randrange(len(notes)))
+            notes.append(timings.time("move", store.move_note, path, rng.choice(journals)))
+        for i in range(args.repeat):
+            path = notes.pop(rng.randrange(len(notes)))
+            new_path = os.path.join(os.path.dirname(path), f"renamed_{i}.txt")
+            timings.time("rename", store.rename_note, path, new_path)
+            notes.append(new_path)
+        for _ in range(args.repeat):
+            timings.time("delete", store.delete, notes.pop(rng.randrange(len(notes))))
+        timings.time("delete_journal", store.delete, journals[-1])
+
+        timings.time("close", store.close)
+    finally:
+        if not args.keep and not args.dir:
+            shutil.rmtree(work, ignore_errors=True)
+    return timings.summary()
+
+
+def git_commit():
+    """Return the commit the benchmark ran against, or None outside a git checkout."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time storage operations on a synthetic tree and write the results as JSON.")
+    parser.add_argument("--trunks", type=int, default=10)
+    parser.add_argument("--journals", type=int, default=10, help="journals per trunk")
+    parser.add_argument("--notes", type=int, default=100, help="notes per journal")
+    parser.add_argument("--huge", type=int, default=2, help="number of huge notes")
+    parser.add_argument("--huge-mb", type=int, default=64, help="size of each huge note")
+    parser.add_argument("--repeat", type=int, default=50, help="samples per timed operation")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--packed", action="store_true", help="pack every journal into a single file first")
+    parser.add_argument("--dir", help="build the tree here instead of in a temporary directory")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary tree afterwards")
+    parser.add_argument("--out", default="benchmark.json", help="where to write the results")
+    args = parser.parse_args()
+
+    results = run(args)
+    report = {
+        "commit": git_commit(),
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "params": {key: value for key, value in vars(args).items() if key not in ("dir", "keep", "out")},
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=4)
+    for name, stats in results.items():
+        print(f"{name:16} {stats['count']:6}  median {stats['median_ms']:10.3f} ms  p95 {stats['p95_ms']:10.3f} ms")
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
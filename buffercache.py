@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import editlog
+import packstore
+from largenote import LARGE_NOTE_BYTES
+
+# Memory for cached note texts, by default; set from the "Cache MB" option
+BUFFER_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def stamp(path):
+    """Return what tells one version of a note on disk from another: its file's identity, size and
+    mtime, and its edit log's size and mtime."""
+    st = packstore.stat(path)
+    try:
+        log = os.stat(editlog.log_path(path))
+        log = (log.st_size, log.st_mtime_ns)
+    except OSError:
+        log = None
+    return st.st_ino, st.st_size, st.st_mtime, log
+
+
+class BufferCache:
+    """Texts of recently opened notes, each checked against the note on disk before it is used.
+
+    An entry holds the text, its digest and the stamp() of the note it was read from or written
+    to. Entries are evicted least recently used first once their total size passes budget, and a
+    text over a quarter of the budget is not kept, so one huge note cannot push out all the rest.
+    Nor is a large note, which opens a window at a time rather than whole. Safe to call from any
+    thread.
+    """
+
+    def __init__(self, budget=BUFFER_CACHE_BYTES):
+        self.budget = budget
+        self._lock = threading.Lock()
+        # {path: (stamp, text, digest, size)}, least recently used first
+        self._entries = OrderedDict()
+        self.size = 0
+
+    def __contains__(self, path):
+        with self._lock:
+            return path in self._entries
+
+    def get(self, path):
+        """Return (text, digest) of a note if cached and unchanged on disk since, else None. Costs a stat."""
+        entry = self.entry(path)
+        return entry and entry[1:]
+
+    def entry(self, path):
+        """Return (stamp, text, digest) of a note if cached and unchanged on disk since, else None."""
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None:
+            return None
+        try:
+            current = stamp(path)
+        except OSError:
+            current = None
+        with self._lock:
+            if current != entry[0]:
+                if self._entries.get(path) is entry:
+                    self._remove(path)
+                return None
+            if path in self._entries:
+                self._entries.move_to_end(path)
+        return entry[:3]
+
+    def put(self, path, version, text, digest):
+        """Cache the text of a note as of version, a stamp() taken no later than the text was read."""
+        size = sys.getsizeof(text)
+        with self._lock:
+            self._remove(path)
+            if size > self.budget // 4 or version[1] >= LARGE_NOTE_BYTES:
+                return
+            self._entries[path] = (version, text, digest, size)
+            self.size += size
+            self._evict()
+
+    def discard(self, path):
+        """Drop a note's entry, if any."""
+        with self._lock:
+            self._remove(path)
+
+    def set_budget(self, budget):
+        """Change the memory budget, evicting at once if it shrank."""
+        with self._lock:
+            self.budget = budget
+            for path in [p for p, entry in self._entries.items() if entry[3] > budget // 4]:
+                self._remove(path)
+            self._evict()
+
+    def _remove(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.size -= entry[3]
+
+    def _evict(self):
+        while self.size > self.budget and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self.size -= entry[3]
@@ -0,0 +1,296 @@
+import os
+import sqlite3
+import stat
+import threading
+
+import archive
+import packstore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent, name);
+CREATE TABLE IF NOT EXISTS listings (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+"""
+
+# Kind of the children listed under a node of each kind
+CHILD_KIND = {"root": "trunk", "trunk": "journal", "journal": "note"}
+
+
+# Kind of the tree parent of each kind
+PARENT_KIND = {"trunk": "root", "journal": "trunk", "note": "journal"}
+
+
+def listing_dir(node, kind):
+    """Return the directory whose entries are the children of a node."""
+    if kind == "journal":
+        return os.path.join(node, ".notes")
+    return node
+
+
+def listing_source(node, kind):
+    """Return (path, mtime_ns) of what lists the children of a node: its directory, or else the
+    pack or archive standing in for it. The directory is tried first, so plain nodes cost one stat.
+    """
+    candidates = [listing_dir(node, kind)]
+    if kind == "journal":
+        candidates += [packstore.pack_path(node), archive.archive_path(node), archive.archive_path(os.path.dirname(node))]
+    elif kind == "trunk":
+        candidates.append(archive.archive_path(node))
+    for path in candidates:
+        try:
+            return path, os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+    raise FileNotFoundError(candidates[0])
+
+
+def classify(root, path):
+    """Return (kind, node) for a trunk, journal or note path under root, node being its tree parent."""
+    rel = os.path.relpath(path, root)
+    if rel == os.curdir or rel.startswith(os.pardir):
+        return None
+    parts = rel.split(os.sep)
+    if len(parts) == 1:
+        return "trunk", root
+    if len(parts) == 2:
+        return "journal", os.path.dirname(path)
+    if len(parts) == 4 and parts[2] == ".notes" and parts[3].endswith(".txt"):
+        return "note", os.path.dirname(os.path.dirname(path))
+    return None
+
+
+def scan_dir(node, kind, source=None):
+    """List the children of a node as (path, kind, name, mtime, size) rows, sorted by name.
+
+    source is the directory, pack or archive from listing_source. Archived trunks and journals are
+    listed under their archive's file name, with the path their directory had.
+    """
+    child_kind = CHILD_KIND[kind]
+    source = source or listing_source(node, kind)[0]
+    if source.endswith(packstore.PACK_FILE):
+        notes = listing_dir(node, kind)
+        return [(os.path.join(notes, name), "note", name, mtime, size) for name, mtime, size in packstore.get_pack(node).entries()]
+    if source.endswith(archive.ARCHIVE_SUFFIX):
+        return archive.get_archive(source[:-len(archive.ARCHIVE_SUFFIX)]).children(node)
+    rows = []
+    with os.scandir(source) as it:
+        for entry in it:
+            path = entry.path
+            try:
+                if child_kind == "note":
+                    if not entry.name.endswith(".txt"):
+                        continue
+                elif entry.name.endswith(archive.ARCHIVE_SUFFIX):
+                    if not entry.is_file():
+                        continue
+                    path = path[:-len(archive.ARCHIVE_SUFFIX)]
+                elif not entry.is_dir():
+                    continue
+                st = entry.stat()
+            except OSError:
+                continue
+            rows.append((path, child_kind, entry.name, st.st_mtime, st.st_size))
+    rows.sort(key=lambda row: row[2])
+    return rows
+
+
+class Catalog:
+    """On-disk record of trunks, journals and notes so the tree can be painted without walking the save dir.
+
+    Every change is also passed on to observer, if set, such as the quick-open NameIndex.
+    """
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self.observer = None
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def children(self, node):
+        """Return cached (path, kind, name) rows under a node, or None if it was never listed."""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM listings WHERE path = ?", (node,)).fetchone() is None:
+                return None
+            return self._conn.execute(
+                "SELECT path, kind, name FROM entries WHERE parent = ? ORDER BY name", (node,)
+            ).fetchall()
+
+    def entries(self, root):
+        """Return every cached (path, kind, name) row below root."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT path, kind, name FROM entries WHERE path > ? AND path < ?",
+                (root + os.sep, root + chr(ord(os.sep) + 1)),
+            ).fetchall()
+
+    def notes(self, root):
+        """Return (path, mtime, size) for every cached note below root."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT path, mtime, size FROM entries WHERE kind = 'note' AND path > ? AND path < ?",
+                (root + os.sep, root + chr(ord(os.sep) + 1)),
+            ).fetchall()
+
+    def count_notes(self, root):
+        """Return how many cached notes are below root."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE kind = 'note' AND path > ? AND path < ?",
+                (root + os.sep, root + chr(ord(os.sep) + 1)),
+            ).fetchone()[0]
+
+    def rescan(self, node, kind):
+        """List a node from disk, store the result and return it as (path, kind, name) rows."""
+        try:
+            source, mtime_ns = listing_source(node, kind)
+            rows = scan_dir(node, kind, source)
+        except OSError:
+            self.forget(node)
+            return []
+        self.record(node, rows, mtime_ns)
+        return [row[:3] for row in rows]
+
+    def record(self, node, rows, mtime_ns):
+        """Replace the cached children of a node, dropping anything below children that disappeared."""
+        with self._lock, self._conn:
+            old = {path for (path,) in self._conn.execute("SELECT path FROM entries WHERE parent = ?", (node,))}
+            for path in old.difference(row[0] for row in rows):
+                self._delete_below(path)
+            self._conn.execute("DELETE FROM entries WHERE parent = ?", (node,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO entries (path, parent, kind, name, mtime, size) VALUES (?, ?, ?, ?, ?, ?)",
+                [(path, node, kind, name, mtime, size) for path, kind, name, mtime, size in rows],
+            )
+            self._conn.execute("INSERT OR REPLACE INTO listings (path, mtime_ns) VALUES (?, ?)", (node, mtime_ns))
+        if self.observer is not None:
+            self.observer.set_children(node, [row[:3] for row in rows])
+
+    def update_file(self, path):
+        """Refresh the mtime and size recorded for a single note after it was written."""
+        try:
+            st = packstore.stat(path)
+        except OSError:
+            return
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE entries SET mtime = ?, size = ? WHERE path = ?", (st.st_mtime, st.st_size, path))
+
+    def add(self, path, kind, node):
+        """Record one new entry under node. Returns False if path is not a valid entry of that kind."""
+        try:
+            st = packstore.stat(path) if kind == "note" else os.stat(path)
+        except OSError:
+            return False
+        if stat.S_ISDIR(st.st_mode) == (kind == "note"):
+            return False
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (path, parent, kind, name, mtime, size) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, node, kind, os.path.basename(path), st.st_mtime, st.st_size),
+            )
+            self._touch_listing(node, PARENT_KIND[kind])
+        if self.observer is not None:
+            self.observer.add(path, kind, os.path.basename(path))
+        return True
+
+    def remove(self, path, node):
+        """Drop one entry, and everything below it, from the listing of node."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries WHERE path = ?", (path,))
+            self._delete_below(path)
+            self._touch_listing(node, "trunk" if os.path.dirname(path) == node else "journal")
+        if self.observer is not None:
+            self.observer.remove(path)
+
+    def move(self, old, new, kind, node):
+        """Move an entry to a new path, carrying along everything cached below it."""
+        lo, hi = old + os.sep, old + chr(ord(os.sep) + 1)
+        cut = len(old) + 1
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE OR REPLACE entries SET path = ? || substr(path, ?), parent = ? || substr(parent, ?) "
+                "WHERE path > ? AND path < ?",
+                (new, cut, new, cut, lo, hi),
+            )
+            self._conn.execute(
+                "UPDATE OR REPLACE listings SET path = ? || substr(path, ?) WHERE path = ? OR (path > ? AND path < ?)",
+                (new, cut, old, lo, hi),
+            )
+            self._conn.execute("DELETE FROM entries WHERE path = ?", (old,))
+        if self.observer is not None:
+            self.observer.move(old, new)
+        self.add(new, kind, node)
+
+    def _touch_listing(self, node, kind):
+        """Mark a listed node as current with its directory's mtime. Caller holds the lock."""
+        try:
+            mtime_ns = listing_source(node, kind)[1]
+        except OSError:
+            return
+        self._conn.execute("UPDATE listings SET mtime_ns = ? WHERE path = ?", (mtime_ns, node))
+
+    def invalidate(self, root):
+        """Force the next reconcile to re-list every directory under root, e.g. after lost watcher events."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE listings SET mtime_ns = -1 WHERE path = ? OR (path > ? AND path < ?)",
+                (root, root + os.sep, root + chr(ord(os.sep) + 1)),
+            )
+
+    def forget(self, node):
+        """Drop a node and everything cached below it."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries WHERE path = ?", (node,))
+            self._delete_below(node)
+        if self.observer is not None:
+            self.observer.remove(node)
+
+    def _delete_below(self, path):
+        """Delete entries and listings at or below path. Caller holds the lock."""
+        lo, hi = path + os.sep, path + chr(ord(os.sep) + 1)
+        self._conn.execute("DELETE FROM entries WHERE path > ? AND path < ?", (lo, hi))
+        self._conn.execute("DELETE FROM listings WHERE path = ? OR (path > ? AND path < ?)", (path, lo, hi))
+
+    def reconcile(self, root):
+        """Bring the catalog in line with disk by re-listing only directories whose mtime changed.
+
+        Costs one stat per trunk and journal rather than one per note. Returns the nodes whose
+        children changed, parents before children.
+        """
+        changed = []
+        pending = [(root, "root")]
+        while pending:
+            node, kind = pending.pop()
+            try:
+                mtime_ns = listing_source(node, kind)[1]
+            except OSError:
+                continue
+            with self._lock:
+                row = self._conn.execute("SELECT mtime_ns FROM listings WHERE path = ?", (node,)).fetchone()
+            if row is None or row[0] != mtime_ns:
+                before = self.children(node)
+                after = self.rescan(node, kind)
+                if before is None or [r[0] for r in before] != [r[0] for r in after]:
+                    changed.append(node)
+                children = after
+            else:
+                children = self.children(node) or []
+            if kind != "journal":
+                child_kind = CHILD_KIND[kind]
+                pending.extend((path, child_kind) for path, _, _ in reversed(children))
+        return changed
@@ -0,0 +1,182 @@
+import json
+import os
+import zlib
+
+from saver import write_atomic
+
+# Compact a log once it is larger than this and larger than the note itself
+COMPACT_BYTES = 1024 * 1024
+
+
+class LogError(Exception):
+    """Raised when a log was started against different text than its note now holds."""
+
+
+def log_path(path):
+    """Return the path of the edit log kept next to a note."""
+    return path + ".log"
+
+
+def stale_path(path):
+    """Return where a log that no longer matches its note is set aside."""
+    return path + ".log.stale"
+
+
+def checksum(text):
+    """Return a checksum of note text."""
+    return zlib.crc32(text.encode("utf-8", "surrogatepass"))
+
+
+def read_note(path):
+    """Read the text of a note file."""
+    with open(path, "r", encoding="utf-8", errors="surrogatepass") as f:
+        return f.read()
+
+
+def to_ops(changes):
+    """Turn EditRecorder changes into log ops, merging runs of typing and of backspace or delete."""
+    ops = []
+    for change in changes:
+        last = ops[-1] if ops else None
+        if change.op == "insert":
+            line, col = change.start
+            if last and last[0] == "i" and "\n" not in last[3] and last[1] == line and last[2] + len(last[3]) == col:
+                last[3] += change.text
+            else:
+                ops.append(["i", line, col, change.text])
+        elif change.op == "delete":
+            (l1, c1), (l2, c2) = change.start, change.end
+            if last and last[0] == "d" and l1 == l2 == last[1] == last[3] and c2 == last[2]:
+                last[2] = c1
+            elif last and last[0] == "d" and l1 == l2 == last[1] == last[3] and c1 == last[2]:
+                last[4] += c2 - c1
+            else:
+                ops.append(["d", l1, c1, l2, c2])
+    return ops
+
+
+def _check(lines, line, col):
+    if not 1 <= line <= len(lines) or not 0 <= col <= len(lines[line - 1]):
+        raise LogError(f"position {line}.{col} is outside the note")
+
+
+def apply_ops(lines, ops):
+    """Apply log ops to a note held as a list of lines."""
+    for op in ops:
+        if op[0] == "i":
+            _, line, col, text = op
+            _check(lines, line, col)
+            current = lines[line - 1]
+            parts = text.split("\n")
+            parts[0] = current[:col] + parts[0]
+            parts[-1] += current[col:]
+            lines[line - 1:line] = parts
+        elif op[0] == "d":
+            _, l1, c1, l2, c2 = op
+            _check(lines, l1, c1)
+            _check(lines, l2, c2)
+            if (l1, c1) > (l2, c2):
+                raise LogError("delete range is reversed")
+            lines[l1 - 1:l2] = [lines[l1 - 1][:c1] + lines[l2 - 1][c2:]]
+        else:
+            raise LogError(f"unknown op {op[0]!r}")
+
+
+def _records(log):
+    """Yield the records of a log in order, stopping at a line torn by a crash."""
+    for line in log:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return
+        if isinstance(record, dict):
+            yield record
+
+
+def replay(path):
+    """Return the text of a note with its edit log applied.
+
+    Raises LogError if the log was started against different text, e.g. after the note was edited
+    elsewhere.
+    """
+    text = read_note(path)
+    try:
+        log = open(log_path(path), "r", encoding="utf-8")
+    except FileNotFoundError:
+        return text
+    with log:
+        records = list(_records(log))
+    if not records:
+        return text
+    base = checksum(text)
+    if records[0].get("base") != base or records[0].get("length") != len(text):
+        # A compaction that replaced the note but crashed before removing its log
+        if any(record.get("compacted") == base for record in records):
+            return text
+        raise LogError("the note changed since its edit log was started")
+    lines = text.split("\n")
+    for record in records[1:]:
+        apply_ops(lines, record.get("ops", ()))
+    return "\n".join(lines)
+
+
+def _append_records(path, records):
+    """Durably append JSON records to a log, starting on a fresh line. Returns the log size."""
+    data = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+    with open(log_path(path), "ab+") as f:
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                data = b"\n" + data
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+
+def append(path, ops):
+    """Append ops to a note's log, compacting it once it grows too large.
+
+    The log is started against the note's current text when there is none. Returns the compacted
+    text, or None if no compaction ran.
+    """
+    records = [{"ops": ops}]
+    if not os.path.exists(log_path(path)):
+        text = read_note(path)
+        records.insert(0, {"base": checksum(text), "length": len(text)})
+    size = _append_records(path, records)
+    if size > max(COMPACT_BYTES, os.path.getsize(path)):
+        return compact(path)
+    return None
+
+
+def compact(path):
+    """Fold a note's log into its text file. Returns the new text, or None if there was nothing to fold."""
+    if not os.path.exists(log_path(path)) or not os.path.exists(path):
+        return None
+    text = replay(path)
+    _append_records(path, [{"compacted": checksum(text)}])
+    write_atomic(path, text)
+    os.remove(log_path(path))
+    return text
+
+
+def write_full(path, text):
+    """Replace a note with text and drop its log. Returns text."""
+    write_atomic(path, text)
+    discard(path)
+    return text
+
+
+def discard(path):
+    """Delete a note's log if it has one."""
+    try:
+        os.remove(log_path(path))
+    except FileNotFoundError:
+        pass
+
+
+def set_aside(path):
+    """Move a log that no longer matches its note out of the way and return where it went."""
+    os.replace(log_path(path), stale_path(path))
+    return stale_path(path)
@@ -0,0 +1,86 @@
+from collections import namedtuple
+
+# op is "insert", "delete" or "reset". start and end are (line, column) positions from before the
+# change, with lines counted from 1 and columns in Python characters; text is the inserted text,
+# or for a delete the deleted text if the recorder's keep_deleted is set and None otherwise.
+# A reset means the widget changed in a way that could not be described, e.g. by undo.
+Change = namedtuple("Change", "op start end text")
+
+
+def _position(index):
+    """Split a normalized "line.column" Tk index into integers."""
+    line, col = index.split(".")
+    return int(line), int(col)
+
+
+class EditRecorder:
+    """Intercept a Text widget's insert, delete and replace commands and report every change.
+
+    Each listener is called with a Change after the widget has applied it.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.listeners = []
+        # Off unless a listener needs deleted text, so clearing a large note does not copy it
+        self.keep_deleted = False
+        self._orig = text._w + "_orig"
+        text.tk.call("rename", text._w, self._orig)
+        text.tk.createcommand(text._w, self._dispatch)
+
+    def add_listener(self, listener):
+        """Call listener(change) after each change to the widget."""
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """Stop reporting changes to listener."""
+        self.listeners.remove(listener)
+
+    def _call(self, *args):
+        return self.text.tk.call((self._orig,) + args)
+
+    def _index(self, index):
+        """Resolve an index, moving the position after the final newline back onto it as Tk does."""
+        resolved = str(self._call("index", index))
+        if self.text.tk.getboolean(self._call("compare", resolved, ">=", "end")):
+            resolved = str(self._call("index", "end - 1 chars"))
+        return resolved
+
+    def _convert(self, index):
+        """Turn a resolved Tk index into a (line, column) position counted in Python characters."""
+        line, col = _position(index)
+        if col:
+            col = len(self._call("get", f"{line}.0", index))
+        return line, col
+
+    def _dispatch(self, *args):
+        changes = []
+        if args and args[0] in ("insert", "delete", "replace", "edit") and str(self._call("cget", "-state")) != "disabled":
+            if args[0] == "insert" and len(args) >= 3:
+                start = self._convert(self._index(args[1]))
+                changes.append(Change("insert", start, start, "".join(args[2::2])))
+            elif args[0] == "delete" and len(args) >= 2:
+                changes.extend(self._deletions(args[1:]))
+            elif args[0] == "replace" and len(args) >= 4:
+                changes.extend(self._deletions(args[1:3]))
+                start = self._convert(self._index(args[1]))
+                changes.append(Change("insert", start, start, "".join(args[3::2])))
+            elif args[0] == "edit" and len(args) >= 2 and args[1] in ("undo", "redo"):
+                changes.append(Change("reset", None, None, None))
+        result = self._call(*args)
+        for change in changes:
+            if change.text != "":
+                for listener in list(self.listeners):
+                    listener(change)
+        return result
+
+    def _deletions(self, indices):
+        """Describe a delete of one or more ranges, last range first so earlier positions stay valid."""
+        ranges = []
+        for i in range(0, len(indices), 2):
+            start = self._index(indices[i])
+            end = self._index(indices[i + 1] if i + 1 < len(indices) else f"{start} + 1 chars")
+            if _position(start) < _position(end):
+                ranges.append((_position(start), start, end))
+        ranges.sort(reverse=True)
+        return [Change("delete", self._convert(start), self._convert(end), str(self._call("get", start, end)) if self.keep_deleted else None) for _, start, end in ranges]
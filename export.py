@@ -0,0 +1,184 @@
+import collections
+import concurrent.futures
+import html
+import os
+import shutil
+import time
+import zipfile
+
+import packstore
+from nameindex import display_name
+
+# Output formats: (label, file extension; None for a directory)
+FORMATS = {
+    "zip": ("Zip Archive", ".zip"),
+    "markdown": ("Markdown File", ".md"),
+    "html": ("HTML Site", None),
+}
+
+# Notes read at once, and read ahead of the writer; bounds memory to a few notes whatever the export's size
+READ_WORKERS = 4
+READ_AHEAD = 16
+
+PAGE_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>body {{ font-family: sans-serif; max-width: 50em; margin: 2em auto; }} pre {{ white-space: pre-wrap; }}</style>
+</head>
+<body>
+"""
+PAGE_FOOT = "</body>\n</html>\n"
+
+
+def walk(store, node):
+    """Yield the path of every note at or below a trunk, journal or note, in tree order."""
+    kind = store.kind(node)
+    if kind == "note":
+        yield node
+        return
+    for path, child_kind, _ in store.children(node):
+        if child_kind == "note":
+            yield path
+        else:
+            yield from walk(store, path)
+
+
+def read_notes(store, paths, task=None):
+    """Yield (path, text) for paths in order, reading up to READ_AHEAD notes ahead on a thread pool.
+
+    Stops early once task is cancelled.
+    """
+    with concurrent.futures.ThreadPoolExecutor(READ_WORKERS) as pool:
+        window = collections.deque()
+        paths = iter(paths)
+        for path in paths:
+            window.append((path, pool.submit(store.read, path)))
+            if len(window) >= READ_AHEAD:
+                break
+        while window:
+            if task is not None and task.cancelled:
+                for _, future in window:
+                    future.cancel()
+                return
+            path, future = window.popleft()
+            for next_path in paths:
+                window.append((next_path, pool.submit(store.read, next_path)))
+                break
+            yield path, future.result()
+
+
+def _parts(path):
+    """Return the (trunk, journal) display names above a note."""
+    journal = os.path.dirname(os.path.dirname(path))
+    trunk = os.path.dirname(journal)
+    return display_name(os.path.basename(trunk), "trunk"), display_name(os.path.basename(journal), "journal")
+
+
+def _rel(store, path):
+    """Return the trunk/journal/note path of a note relative to the trunk root, without .notes."""
+    journal = os.path.dirname(os.path.dirname(path))
+    return os.path.join(os.path.relpath(journal, store.trunk_root), os.path.basename(path))
+
+
+def write_zip(store, notes, dest):
+    """Write notes into a zip of trunk/journal/note.txt files. Yields each note's path once written."""
+    with zipfile.ZipFile(dest, "w", zipfile.ZIP_DEFLATED) as zf:
+        for path, text in notes:
+            mtime = packstore.stat(path).st_mtime
+            # Zip cannot store dates before 1980
+            info = zipfile.ZipInfo(_rel(store, path).replace(os.sep, "/"), time.localtime(max(mtime, 315532800))[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with zf.open(info, "w") as f:
+                f.write(text.encode("utf-8", "surrogatepass"))
+            yield path
+
+
+def write_markdown(store, notes, dest):
+    """Write notes into one Markdown file with a heading per trunk, journal and note. Yields each note's path once written."""
+    trunk = journal = None
+    with open(dest, "w", encoding="utf-8", errors="surrogatepass") as f:
+        for path, text in notes:
+            note_trunk, note_journal = _parts(path)
+            if note_trunk != trunk:
+                trunk, journal = note_trunk, None
+                f.write(f"# {trunk}\n\n")
+            if note_journal != journal:
+                journal = note_journal
+                f.write(f"## {journal}\n\n")
+            f.write(f"### {display_name(os.path.basename(path), 'note')}\n\n")
+            f.write(text.rstrip("\n") + "\n\n")
+            yield path
+
+
+def write_html(store, notes, dest, title):
+    """Write notes as one page each under dest, plus an index.html linking to them. Yields each note's path once written."""
+    os.makedirs(dest)
+    trunk = journal = None
+    with open(os.path.join(dest, "index.html"), "w", encoding="utf-8", errors="surrogatepass") as index:
+        index.write(PAGE_HEAD.format(title=html.escape(title)) + f"<h1>{html.escape(title)}</h1>\n")
+        for path, text in notes:
+            note_trunk, note_journal = _parts(path)
+            if note_trunk != trunk:
+                trunk, journal = note_trunk, None
+                index.write(f"<h2>{html.escape(trunk)}</h2>\n")
+            if note_journal != journal:
+                journal = note_journal
+                index.write(f"<h3>{html.escape(journal)}</h3>\n")
+            name = display_name(os.path.basename(path), "note")
+            rel = _rel(store, path)[:-4] + ".html"
+            page = os.path.join(dest, rel)
+            os.makedirs(os.path.dirname(page), exist_ok=True)
+            up = "../" * rel.count(os.sep)
+            with open(page, "w", encoding="utf-8", errors="surrogatepass") as f:
+                f.write(PAGE_HEAD.format(title=html.escape(name)))
+                f.write(f'<p><a href="{up}index.html">{html.escape(title)}</a> / {html.escape(trunk)} / {html.escape(journal)}</p>\n')
+                f.write(f"<h1>{html.escape(name)}</h1>\n<pre>{html.escape(text)}</pre>\n" + PAGE_FOOT)
+            index.write(f'<p><a href="{html.escape(rel.replace(os.sep, "/"))}">{html.escape(name)}</a></p>\n')
+            yield path
+        index.write(PAGE_FOOT)
+
+
+def export(store, node, dest, fmt, task=None):
+    """Export the notes at or below node to dest as fmt, one of FORMATS. Returns dest, or None if cancelled.
+
+    Notes stream from disk through the writer one at a time, so memory does not grow with the
+    size of the export. Output goes to a temporary name and is moved to dest once complete; an
+    HTML site needs a dest that does not exist yet, while a file replaces any already there.
+    """
+    if fmt == "html" and os.path.exists(dest):
+        raise FileExistsError(dest)
+    if task is not None:
+        task.total = sum(1 for _ in walk(store, node))
+    tmp = dest + ".tmp"
+    _remove(tmp)
+    notes = read_notes(store, walk(store, node), task)
+    if fmt == "zip":
+        written = write_zip(store, notes, tmp)
+    elif fmt == "markdown":
+        written = write_markdown(store, notes, tmp)
+    elif fmt == "html":
+        written = write_html(store, notes, tmp, display_name(os.path.basename(node), store.kind(node)))
+    else:
+        raise ValueError(f"unknown export format {fmt}")
+    try:
+        for path in written:
+            if task is not None:
+                task.advance(os.path.basename(path))
+    except BaseException:
+        _remove(tmp)
+        raise
+    if task is not None and task.cancelled:
+        _remove(tmp)
+        return None
+    os.replace(tmp, dest)
+    return dest
+
+
+def _remove(path):
+    """Delete a file or directory tree if it exists."""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
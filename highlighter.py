@@ -0,0 +1,230 @@
+import re
+
+# Lines tagged right after an edit, at most, before the rest is left to idle callbacks
+SYNC_LINES = 200
+
+# Lines tagged per idle callback, and the delay (ms) between callbacks so typing stays responsive
+IDLE_LINES = 500
+IDLE_DELAY = 1
+
+HEADING = re.compile(r"(#{1,6})\s")
+FENCE = re.compile(r"\s{0,3}(```|~~~)")
+LIST_MARKER = re.compile(r"\s*([-*+]|\d+[.)])\s")
+QUOTE = re.compile(r"\s{0,3}>")
+CODE_SPAN = re.compile(r"(`+)(.+?)\1")
+LINK = re.compile(r"\[([^\]\n]+)\]\(([^)\s]+)\)")
+BOLD = re.compile(r"(\*\*|__)(?=\S)(.+?)(?<=\S)\1")
+ITALIC = re.compile(r"(?<![\w*])(\*|_)(?=[^\s*_])(.+?)(?<=[^\s*_])\1(?![\w*])")
+
+TAGS = ("md_h1", "md_h2", "md_h3", "md_bold", "md_italic", "md_code", "md_code_block", "md_link", "md_url", "md_list", "md_quote")
+
+
+def tokenize(line, state):
+    """Return (spans, state) for one line: spans are (tag, start column, end column).
+
+    state is "" outside fenced code and the fence marker inside it, the only Markdown construct
+    here that spans lines, and is the state the next line starts in.
+    """
+    if state:
+        if line.lstrip().startswith(state):
+            return [("md_code_block", 0, len(line))], ""
+        return [("md_code_block", 0, len(line))], state
+    fence = FENCE.match(line)
+    if fence:
+        return [("md_code_block", 0, len(line))], fence.group(1)
+    heading = HEADING.match(line)
+    if heading:
+        return [(f"md_h{min(len(heading.group(1)), 3)}", 0, len(line))], ""
+    spans = []
+    quote = QUOTE.match(line)
+    if quote:
+        spans.append(("md_quote", 0, len(line)))
+    else:
+        marker = LIST_MARKER.match(line)
+        if marker:
+            spans.append(("md_list", marker.start(1), marker.end(1)))
+    # Code spans hide everything inside them, links their URL, bold its markers from italics
+    masked = line
+    for pattern, handle in ((CODE_SPAN, _code), (LINK, _link), (BOLD, _bold), (ITALIC, _italic)):
+        for match in pattern.finditer(masked):
+            spans.extend(handle(match))
+            masked = masked[:match.start()] + " " * (match.end() - match.start()) + masked[match.end():]
+    return spans, ""
+
+
+def _code(match):
+    return [("md_code", match.start(), match.end())]
+
+
+def _link(match):
+    return [("md_link", match.start(1), match.end(1)), ("md_url", match.start(2), match.end(2))]
+
+
+def _bold(match):
+    return [("md_bold", match.start(), match.end())]
+
+
+def _italic(match):
+    return [("md_italic", match.start(), match.end())]
+
+
+class MarkdownHighlighter:
+    """Tag Markdown in a Text widget, redoing only the lines that changed.
+
+    Each line keeps the tokenizer state it was tagged with and the state it ended in. An edit
+    marks just the lines it touched as dirty; a line whose end state changes (opening or closing
+    a fence) marks the next line too, so the work spreads only as far as the change reaches.
+    Dirty lines in view are tagged on the next idle callback, the rest a chunk at a time after
+    it. Fed by an EditRecorder through changed().
+    """
+
+    def __init__(self, text, family, size, enabled=True):
+        self.text = text
+        self.enabled = enabled
+        # Per line: (start state, end state) it was tagged with, or None while dirty
+        self._lines = []
+        # Sorted, disjoint [first, last] runs of dirty lines
+        self._dirty = []
+        self._job = None
+        self.configure(family, size)
+        self.reset()
+
+    def configure(self, family, size):
+        """Set the tag fonts from the editor font."""
+        text = self.text
+        text.tag_configure("md_h1", font=(family, size + 6, "bold"))
+        text.tag_configure("md_h2", font=(family, size + 4, "bold"))
+        text.tag_configure("md_h3", font=(family, size + 2, "bold"))
+        text.tag_configure("md_bold", font=(family, size, "bold"))
+        text.tag_configure("md_italic", font=(family, size, "italic"))
+        text.tag_configure("md_code", font=("Courier New", size), foreground="#c7254e")
+        text.tag_configure("md_code_block", font=("Courier New", size), foreground="#5c8a5c")
+        text.tag_configure("md_link", foreground="#4a90d9", underline=True)
+        text.tag_configure("md_url", foreground="#888888")
+        text.tag_configure("md_list", foreground="#d08770", font=(family, size, "bold"))
+        text.tag_configure("md_quote", foreground="#888888", font=(family, size, "italic"))
+        text.tag_raise("sel")
+
+    def set_enabled(self, enabled):
+        """Turn highlighting on, re-tagging the whole text, or off, clearing every tag."""
+        self.enabled = enabled
+        if enabled:
+            self.reset()
+        else:
+            self._cancel()
+            for tag in TAGS:
+                self.text.tag_remove(tag, "1.0", "end")
+
+    def reset(self):
+        """Mark every line dirty, e.g. after a change the recorder could not describe."""
+        count = self._line_count()
+        self._lines = [None] * count
+        self._dirty = [[1, count]]
+        self._schedule(0)
+
+    def _line_count(self):
+        return int(self.text.index("end - 1 chars").split(".")[0])
+
+    # Tracking edits
+
+    def changed(self, change):
+        """Mark the lines an editrecorder Change touched as dirty, keeping line numbers in step."""
+        if change.op == "reset":
+            self.reset()
+            return
+        line = change.start[0]
+        if change.op == "insert":
+            added = change.text.count("\n")
+            self._lines[line - 1:line] = [None] * (added + 1)
+            self._shift(line, line, added)
+            self._mark(line, line + added)
+        else:
+            removed = change.end[0] - line
+            self._lines[line - 1:change.end[0]] = [None]
+            self._shift(line, change.end[0], -removed)
+            self._mark(line, line)
+        self._schedule(0)
+
+    def _shift(self, first, last, delta):
+        """Renumber dirty runs after lines first..last became last - first + 1 + delta lines."""
+        runs = []
+        for a, b in self._dirty:
+            a = a if a <= first else (first if a <= last else a + delta)
+            b = b if b < first else (max(first, last + delta) if b <= last else b + delta)
+            runs.append([a, b])
+        self._dirty = runs
+
+    def _mark(self, first, last):
+        """Add lines first..last to the dirty runs."""
+        runs = sorted(self._dirty + [[first, last]])
+        merged = [runs[0]]
+        for a, b in runs[1:]:
+            if a <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], b)
+            else:
+                merged.append([a, b])
+        self._dirty = merged
+
+    # Tagging
+
+    def _schedule(self, delay):
+        if self._job is None and self.enabled:
+            self._job = self.text.after(delay, self._pass) if delay else self.text.after_idle(self._pass)
+
+    def _cancel(self):
+        if self._job is not None:
+            self.text.after_cancel(self._job)
+            self._job = None
+
+    def _pass(self):
+        """Tag the dirty lines in view, or after an edit-free moment the next chunk of the rest."""
+        self._job = None
+        if not self.enabled or not self._dirty:
+            return
+        bottom = int(self.text.index(f"@0,{self.text.winfo_height()}").split(".")[0])
+        if self._dirty[0][0] <= bottom:
+            self._work(bottom, SYNC_LINES)
+        else:
+            self._work(len(self._lines), IDLE_LINES)
+        if self._dirty:
+            self._schedule(IDLE_DELAY)
+
+    def _work(self, limit, budget):
+        """Tag dirty lines in order, stopping after line limit or budget lines."""
+        while self._dirty and budget > 0:
+            first, last = self._dirty[0]
+            if first > limit:
+                return
+            last = min(last, first + budget - 1, len(self._lines))
+            if last < first:
+                self._dirty.pop(0)
+                continue
+            self._retag(first, last)
+            budget -= last - first + 1
+            if last >= self._dirty[0][1]:
+                self._dirty.pop(0)
+            else:
+                self._dirty[0][0] = last + 1
+            # A changed end state means the next line was tagged in the wrong state
+            after = self._lines[last] if last < len(self._lines) else None
+            if after is not None and after[0] != self._lines[last - 1][1]:
+                self._lines[last] = None
+                self._mark(last + 1, last + 1)
+
+    def _retag(self, first, last):
+        """Tag lines first..last, which follow a line whose state is known."""
+        text = self.text
+        state = self._lines[first - 2][1] if first > 1 else ""
+        lines = text.get(f"{first}.0", f"{last}.end").split("\n")
+        ranges = {tag: [] for tag in TAGS}
+        for number, line in enumerate(lines, first):
+            spans, end = tokenize(line, state)
+            self._lines[number - 1] = (state, end)
+            state = end
+            for tag, start, stop in spans:
+                if stop > start:
+                    ranges[tag] += (f"{number}.{start}", f"{number}.{stop}")
+        for tag, indices in ranges.items():
+            text.tag_remove(tag, f"{first}.0", f"{last}.end")
+            if indices:
+                text.tag_add(tag, *indices)
@@ -0,0 +1,323 @@
+import difflib
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import zlib
+
+import packstore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    hash TEXT PRIMARY KEY,
+    base TEXT,
+    depth INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS versions (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    time REAL NOT NULL,
+    hash TEXT
+);
+CREATE INDEX IF NOT EXISTS versions_path_time ON versions (path, time);
+"""
+
+# A note changed this long ago is snapshotted however small the change
+SNAPSHOT_INTERVAL = 600
+# Changes of at least this many characters are snapshotted sooner, but not more often than MIN_SNAPSHOT_GAP
+SNAPSHOT_DISTANCE = 1000
+MIN_SNAPSHOT_GAP = 30
+
+# Deltas chained longer than this are replaced by a full copy, bounding reconstruction cost
+MAX_CHAIN = 32
+
+# Middle sections larger than this (lines x lines) are not diffed line by line
+MAX_DIFF_WORK = 4_000_000
+
+# Reconstructed versions kept in memory, mostly for the latest version of recently saved notes
+CACHE_SIZE = 32
+
+
+def content_hash(text):
+    """Return the content address of note text."""
+    return hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def make_delta(base, lines):
+    """Describe lines as edits of base lines. Returns (ops, distance).
+
+    ops is a list of [start, end] ranges copied from base and lists of lines inserted as-is;
+    distance is the number of characters inserted or removed.
+    """
+    prefix = 0
+    limit = min(len(base), len(lines))
+    while prefix < limit and base[prefix] == lines[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < limit - prefix and base[-1 - suffix] == lines[-1 - suffix]:
+        suffix += 1
+    old = base[prefix:len(base) - suffix]
+    new = lines[prefix:len(lines) - suffix]
+    ops = [[0, prefix]] if prefix else []
+    distance = 0
+    if len(old) * len(new) > MAX_DIFF_WORK:
+        opcodes = [("replace", 0, len(old), 0, len(new))]
+    else:
+        opcodes = difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes()
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            ops.append([prefix + i1, prefix + i2])
+            continue
+        distance += sum(map(len, old[i1:i2]))
+        if j2 > j1:
+            ops.append(new[j1:j2])
+            distance += sum(map(len, new[j1:j2]))
+    if suffix:
+        ops.append([len(base) - suffix, len(base)])
+    return ops, distance
+
+
+def apply_delta(base, ops):
+    """Rebuild lines from base lines and delta ops."""
+    lines = []
+    for op in ops:
+        if isinstance(op[0], str):
+            lines.extend(op)
+        else:
+            lines.extend(base[op[0]:op[1]])
+    return lines
+
+
+class History:
+    """Content-addressed version history of notes, stored as compressed line deltas.
+
+    Recording happens on a background thread and is throttled by time and by how much a note
+    changed since its last snapshot. Queries are safe to call from any thread.
+    """
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+        self._cache = {}
+        self._jobs = queue.Queue()
+        # Worker state: latest unsnapshotted text per path
+        self._pending = {}
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # Requests, safe to call from any thread
+
+    def record(self, path, text):
+        """Offer the saved text of a note; it becomes a version once enough time or change has built up."""
+        self._jobs.put(("record", path, text))
+
+    def preserve(self, paths):
+        """Snapshot the files at paths as they are on disk now, e.g. before they are deleted."""
+        self._jobs.put(("preserve", list(paths)))
+
+    def deleted(self, path):
+        """Mark a note, or every note below a directory, as deleted from now on."""
+        self._jobs.put(("deleted", path))
+
+    def rename(self, old, new):
+        """Carry the history of a note, or of every note below a directory, over to a new path."""
+        self._jobs.put(("rename", old, new))
+
+    def flush(self):
+        """Snapshot every note with changes that are still waiting on the throttle."""
+        self._jobs.put(("flush",))
+
+    def wait(self):
+        """Block until every queued request has been applied."""
+        self._jobs.join()
+
+    def close(self):
+        """Snapshot pending changes, stop the worker and close the database."""
+        self.flush()
+        self._jobs.put(None)
+        self._thread.join()
+        with self._lock:
+            self._conn.close()
+
+    # Queries
+
+    def versions(self, path):
+        """Return (time, hash, size) for every version of a note, newest first. hash is None for a deletion."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT v.time, v.hash, o.size FROM versions v LEFT JOIN objects o ON o.hash = v.hash "
+                "WHERE v.path = ? ORDER BY v.time DESC, v.id DESC",
+                (path,),
+            ).fetchall()
+
+    def as_of(self, path, when):
+        """Return the text of a note as it was at timestamp when, or None if it did not exist then."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT hash FROM versions WHERE path = ? AND time <= ? ORDER BY time DESC, id DESC LIMIT 1",
+                (path, when),
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return self.text(row[0])
+
+    def text(self, digest):
+        """Return the text stored under a content hash."""
+        return "".join(self._lines(digest))
+
+    def diff(self, old_digest, new_digest, old_label="before", new_label="after"):
+        """Return a unified diff between two stored versions as a list of lines."""
+        return list(difflib.unified_diff(self._lines(old_digest), self._lines(new_digest), old_label, new_label))
+
+    def _lines(self, digest):
+        """Rebuild the lines of a stored version by applying its delta chain to the nearest full copy."""
+        lines = self._cache.get(digest)
+        if lines is not None:
+            return lines
+        chain = []
+        with self._lock:
+            current = digest
+            while current is not None:
+                lines = self._cache.get(current)
+                if lines is not None:
+                    break
+                row = self._conn.execute("SELECT base, data FROM objects WHERE hash = ?", (current,)).fetchone()
+                if row is None:
+                    raise KeyError(digest)
+                chain.append(row)
+                current = row[0]
+        for base, data in reversed(chain):
+            raw = zlib.decompress(data).decode("utf-8", "surrogatepass")
+            if base is None:
+                lines = raw.splitlines(keepends=True)
+            else:
+                lines = apply_delta(lines, json.loads(raw))
+        self._remember(digest, lines)
+        return lines
+
+    def _remember(self, digest, lines):
+        if len(self._cache) >= CACHE_SIZE:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[digest] = lines
+
+    # Worker
+
+    def _run(self):
+        next_check = time.monotonic() + SNAPSHOT_INTERVAL / 4
+        while True:
+            try:
+                job = self._jobs.get(timeout=max(0, next_check - time.monotonic()))
+            except queue.Empty:
+                job = ("snapshot_due",)
+            else:
+                if job is None:
+                    self._jobs.task_done()
+                    return
+            try:
+                getattr(self, "_" + job[0])(*job[1:])
+            except (sqlite3.Error, OSError, KeyError, ValueError):
+                pass  # History is best effort; a failed snapshot must not stop later ones
+            finally:
+                if job[0] != "snapshot_due":
+                    self._jobs.task_done()
+            if time.monotonic() >= next_check:
+                self._snapshot_due()
+                next_check = time.monotonic() + SNAPSHOT_INTERVAL / 4
+
+    def _latest(self, path):
+        """Return (time, hash) of the newest version of a note, or None."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT time, hash FROM versions WHERE path = ? ORDER BY time DESC, id DESC LIMIT 1", (path,)
+            ).fetchone()
+
+    def _record(self, path, text, force=False):
+        now = time.time()
+        latest = self._latest(path)
+        digest = content_hash(text)
+        if latest is not None and latest[1] == digest:
+            self._pending.pop(path, None)
+            return
+        if latest is None or latest[1] is None:
+            self._store(path, text, digest, None, now)
+            return
+        base = self._lines(latest[1])
+        lines = text.splitlines(keepends=True)
+        ops, distance = make_delta(base, lines)
+        elapsed = now - latest[0]
+        if force or elapsed >= SNAPSHOT_INTERVAL or (distance >= SNAPSHOT_DISTANCE and elapsed >= MIN_SNAPSHOT_GAP):
+            self._store(path, text, digest, (latest[1], ops), now)
+        else:
+            self._pending[path] = text
+
+    def _store(self, path, text, digest, delta, now):
+        """Add a version row, writing the object unless identical content is already stored."""
+        self._pending.pop(path, None)
+        with self._lock, self._conn:
+            exists = self._conn.execute("SELECT 1 FROM objects WHERE hash = ?", (digest,)).fetchone()
+            if exists is None:
+                base, depth, data = None, 0, None
+                if delta is not None:
+                    row = self._conn.execute("SELECT depth FROM objects WHERE hash = ?", (delta[0],)).fetchone()
+                    packed = zlib.compress(json.dumps(delta[1]).encode("utf-8", "surrogatepass"))
+                    if row is not None and row[0] < MAX_CHAIN and len(packed) < len(text) // 2:
+                        base, depth, data = delta[0], row[0] + 1, packed
+                if data is None:
+                    data = zlib.compress(text.encode("utf-8", "surrogatepass"))
+                self._conn.execute(
+                    "INSERT INTO objects (hash, base, depth, size, data) VALUES (?, ?, ?, ?, ?)",
+                    (digest, base, depth, len(text), data),
+                )
+            self._conn.execute("INSERT INTO versions (path, time, hash) VALUES (?, ?, ?)", (path, now, digest))
+        self._remember(digest, text.splitlines(keepends=True))
+
+    def _snapshot_due(self):
+        """Snapshot pending changes whose last version is older than SNAPSHOT_INTERVAL."""
+        for path, text in list(self._pending.items()):
+            self._record(path, text)
+
+    def _flush(self):
+        for path, text in list(self._pending.items()):
+            self._record(path, text, force=True)
+
+    def _preserve(self, paths):
+        for path in paths:
+            try:
+                text = packstore.read_text(path)
+            except (OSError, UnicodeDecodeError):
+                text = self._pending.get(path)
+                if text is None:
+                    continue
+            self._record(path, text, force=True)
+
+    def _deleted(self, path):
+        lo, hi = path + os.sep, path + chr(ord(os.sep) + 1)
+        for pending in [p for p in self._pending if p == path or lo <= p < hi]:
+            self._record(pending, self._pending[pending], force=True)
+        with self._lock:
+            paths = [p for (p,) in self._conn.execute(
+                "SELECT DISTINCT path FROM versions WHERE path = ? OR (path > ? AND path < ?)", (path, lo, hi)
+            )]
+        now = time.time()
+        for note in paths:
+            latest = self._latest(note)
+            if latest is not None and latest[1] is not None:
+                with self._lock, self._conn:
+                    self._conn.execute("INSERT INTO versions (path, time, hash) VALUES (?, ?, NULL)", (note, now))
+
+    def _rename(self, old, new):
+        lo, hi = old + os.sep, old + chr(ord(os.sep) + 1)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE versions SET path = ? || substr(path, ?) WHERE path = ? OR (path > ? AND path < ?)",
+                (new, len(old) + 1, old, lo, hi),
+            )
+        for pending in [p for p in self._pending if p == old or lo <= p < hi]:
+            self._pending[new + pending[len(old):]] = self._pending.pop(pending)
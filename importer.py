@@ -0,0 +1,221 @@
+import concurrent.futures
+import hashlib
+import os
+import time
+import zipfile
+
+import packstore
+from notestore import notes_dir, slug, unique_name
+
+# Files imported as notes
+TEXT_EXTENSIONS = (".txt", ".md", ".markdown")
+
+# Journal for files that sit directly in a trunk folder or at the top of the source
+DEFAULT_JOURNAL = "notes"
+
+# Files read, hashed and written at once, and handed to the pool per batch so memory stays bounded
+IMPORT_WORKERS = 8
+IMPORT_BATCH = 256
+
+
+def text_hash(text):
+    """Return the SHA-256 of a note's text, the key duplicates are found by."""
+    return hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+class Import:
+    """Bring a folder tree or zip of text and Markdown files into trunks and journals.
+
+    The first folder level becomes trunks and everything below it journals, deeper folders
+    joined into the journal's name; loose files go to a "notes" journal. Names are normalised
+    as new_note does and numbered on collision against a set of taken names per journal. A file
+    whose text matches a note already in its journal, or another file bound for it, is skipped.
+    plan() works out all of this without writing, for a dry-run report; run() then writes every
+    note on a thread pool. The catalog and search index learn of the notes at the next reconcile.
+    """
+
+    def __init__(self, store, source):
+        self.store = store
+        self.source = source
+        self._zip = zipfile.ZipFile(source) if zipfile.is_zipfile(source) else None
+        self.planned = False
+        # (source file, journal path, note file name, mtime) per note to write
+        self.items = []
+        self.duplicates = []
+        self.failed = []
+        self.new_trunks = []
+        self.new_journals = []
+        self.archived = []
+
+    def close(self):
+        """Close the source zip, if any."""
+        if self._zip is not None:
+            self._zip.close()
+
+    # Source
+
+    def _files(self):
+        """Return (name, parts, mtime) for every text file in the source, parts being its folders."""
+        files = []
+        if self._zip is not None:
+            for info in self._zip.infolist():
+                parts = info.filename.split("/")
+                if not info.is_dir() and self._wanted(parts):
+                    files.append((info.filename, parts[:-1], time.mktime(info.date_time + (0, 0, -1))))
+            return files
+        for dir_path, dir_names, file_names in os.walk(self.source):
+            dir_names[:] = sorted(d for d in dir_names if not d.startswith("."))
+            rel = os.path.relpath(dir_path, self.source)
+            folders = [] if rel == os.curdir else rel.split(os.sep)
+            for name in sorted(file_names):
+                if self._wanted(folders + [name]):
+                    path = os.path.join(dir_path, name)
+                    files.append((path, folders, os.stat(path).st_mtime))
+        return files
+
+    @staticmethod
+    def _wanted(parts):
+        return not any(part.startswith(".") for part in parts) and parts[-1].lower().endswith(TEXT_EXTENSIONS)
+
+    def _read(self, name):
+        """Return the text of a source file, with line endings normalised."""
+        data = self._zip.read(name) if self._zip is not None else _read_bytes(name)
+        return data.decode("utf-8-sig").replace("\r\n", "\n").replace("\r", "\n")
+
+    # Planning
+
+    def _target(self, folders):
+        """Return the (trunk, journal) slugs a file's folders map to."""
+        if not folders:
+            folders = [os.path.splitext(os.path.basename(self.source))[0]]
+        trunk = slug(folders[0])
+        journal = slug(" ".join(folders[1:])) if len(folders) > 1 else DEFAULT_JOURNAL
+        return trunk, journal
+
+    def plan(self, task=None):
+        """Work out every note to write, reading and hashing files on a thread pool. Returns False if cancelled."""
+        files = self._files()
+        if task is not None:
+            task.total = len(files)
+        taken = {}
+        hashes = {}
+        with concurrent.futures.ThreadPoolExecutor(IMPORT_WORKERS) as pool:
+            for start in range(0, len(files), IMPORT_BATCH):
+                if task is not None and task.cancelled:
+                    return False
+                batch = files[start:start + IMPORT_BATCH]
+                texts = [pool.submit(self._read, name) for name, _, _ in batch]
+                for (name, folders, mtime), future in zip(batch, texts):
+                    self._plan_file(pool, name, folders, mtime, future, taken, hashes)
+                    if task is not None:
+                        task.advance(os.path.basename(name))
+        self.planned = True
+        return True
+
+    def _plan_file(self, pool, name, folders, mtime, future, taken, hashes):
+        """Place one source file, or count it as a duplicate or failure."""
+        trunk_slug, journal_slug = self._target(folders)
+        trunk = os.path.join(self.store.trunk_root, trunk_slug)
+        journal = os.path.join(trunk, journal_slug)
+        if journal not in taken:
+            if self.store.archived(journal):
+                self.archived.append(journal)
+                taken[journal], hashes[journal] = set(), set()
+            else:
+                self._prepare(pool, trunk, journal, taken, hashes)
+        try:
+            text = future.result()
+        except (OSError, UnicodeDecodeError, KeyError):
+            self.failed.append(name)
+        else:
+            digest = text_hash(text)
+            if journal in self.archived:
+                self.failed.append(name)
+            elif digest in hashes[journal]:
+                self.duplicates.append(name)
+            else:
+                hashes[journal].add(digest)
+                base = slug(os.path.splitext(os.path.basename(name))[0]) or "note"
+                self.items.append((name, journal, unique_name(taken[journal], base, ".txt"), mtime))
+
+    def _prepare(self, pool, trunk, journal, taken, hashes):
+        """Load the taken names and content hashes of a target journal, noting it or its trunk if new."""
+        if not os.path.isdir(trunk) and trunk not in self.new_trunks:
+            self.new_trunks.append(trunk)
+        if self.store.exists(journal):
+            names = self.store.note_names(journal)
+            paths = [os.path.join(notes_dir(journal), n) for n in names if n.endswith(".txt")]
+            taken[journal] = set(names)
+            hashes[journal] = {text_hash(text) for text in pool.map(self.store.read, paths)}
+        else:
+            self.new_journals.append(journal)
+            taken[journal] = set()
+            hashes[journal] = set()
+
+    def report(self):
+        """Return a summary of what run() will do, for showing before it does it."""
+        root = self.store.trunk_root
+        lines = [
+            f"{len(self.items)} notes to import",
+            f"{len(self.duplicates)} duplicates skipped",
+            f"{len(self.failed)} files skipped as unreadable or archived",
+        ]
+        if self.archived:
+            lines.append("Archived, left alone: " + ", ".join(os.path.relpath(p, root) for p in self.archived))
+        if self.new_trunks:
+            lines.append("New trunks: " + ", ".join(os.path.relpath(p, root) for p in self.new_trunks))
+        if self.new_journals:
+            lines.append(f"{len(self.new_journals)} new journals")
+        return "\n".join(lines)
+
+    # Writing
+
+    def run(self, task=None):
+        """Write the planned notes, planning first if needed. Returns the number written; stops early once task is cancelled."""
+        if not self.planned and not self.plan(task):
+            return 0
+        if task is not None:
+            task.done = 0
+            task.total = len(self.items)
+        for trunk in self.new_trunks:
+            os.makedirs(trunk, exist_ok=True)
+        for journal in self.new_journals:
+            os.makedirs(notes_dir(journal), exist_ok=True)
+        by_journal = {}
+        for item in self.items:
+            by_journal.setdefault(item[1], []).append(item)
+        written = 0
+        with concurrent.futures.ThreadPoolExecutor(IMPORT_WORKERS) as pool:
+            for journal, items in by_journal.items():
+                if task is not None and task.cancelled:
+                    break
+                packed = packstore.is_packed(journal)
+                for start in range(0, len(items), IMPORT_BATCH):
+                    if task is not None and task.cancelled:
+                        break
+                    batch = items[start:start + IMPORT_BATCH]
+                    if packed:
+                        # One transaction per batch
+                        texts = pool.map(self._read, [name for name, _, _, _ in batch])
+                        packstore.get_pack(journal).write_many([(note, text, mtime) for (_, _, note, mtime), text in zip(batch, texts)])
+                    else:
+                        list(pool.map(self._write, batch))
+                    written += len(batch)
+                    if task is not None:
+                        for _, _, note, _ in batch:
+                            task.advance(note)
+        return written
+
+    def _write(self, item):
+        """Write one note file with its source's text and mtime."""
+        name, journal, note, mtime = item
+        path = os.path.join(notes_dir(journal), note)
+        with open(path, "x", encoding="utf-8", errors="surrogatepass") as f:
+            f.write(self._read(name))
+        os.utime(path, (mtime, mtime))
+        return note
+
+
+def _read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
@@ -5,17 +5,79 @@ from tkinter import simpledialog
 from tkinter import filedialog
 import os
 import shutil
+import sys
 from datetime import datetime
 import subprocess
-import re
 import json
+import queue
+import bisect
+import threading
+import time
+import functools
+import hashlib
 import platformdirs
+from catalog import classify
+from watcher import Watcher
+from saver import WriteBehindSaver
+from editrecorder import EditRecorder
+from highlighter import MarkdownHighlighter
+from stats import DocumentStats, format_stats, format_total
+from undo import UndoManager
+from buffercache import BufferCache, BUFFER_CACHE_BYTES, stamp
+from prefetch import Prefetcher, PREFETCH_AHEAD, PREFETCH_BEHIND
+import editlog
+import packstore
+from largenote import LargeNote, LARGE_NOTE_BYTES, WINDOW_LINES
+from notestore import NoteStore, slug, unique_path
+from nameindex import format_display, display_name
+from quickopen import QuickOpenDialog
+from tracing import tracer, traced, TRACE_ENV
+from stall_monitor import StallMonitor
+from tasks import BackgroundTask, ProgressDialog
+import migration
+import export
+from importer import Import
+from backup import Backup, BackupScheduler
 
 APP_NAME = "Journa1.0"
 APP_AUTHOR = "Journa"
 USER_DATA_DIR = platformdirs.user_data_dir(APP_NAME, APP_AUTHOR)
 SETTINGS_FILE = os.path.join(USER_DATA_DIR, "settings.json")
 PREFS_FILE = os.path.join(USER_DATA_DIR, "prefs.json")
+STALL_LOG_FILE = os.path.join(USER_DATA_DIR, "stalls.log")
+MIGRATION_FILE = os.path.join(USER_DATA_DIR, "migration.json")
+UNDO_DIR = os.path.join(USER_DATA_DIR, "undo")
+
+# Key of metadata writes queued on the note writer, outside any trunk root so it is never taken for a note
+META_WRITE_KEY = os.path.join(USER_DATA_DIR, "metadata")
+
+# Number of tree rows inserted per idle callback when filling large directories
+TREE_CHUNK_SIZE = 200
+
+# Autosave delay (ms) after the last keystroke; appending to an edit log is cheap enough to do sooner
+SAVE_DELAY = 2000
+LOG_SAVE_DELAY = 300
+
+# Metadata changes are written this long (ms) after the last one
+META_FLUSH_DELAY = 1000
+
+# Watcher events for a note the app itself wrote this recently (s) are its own save coming back
+OWN_WRITE_SECONDS = 5.0
+
+# A large note pages in another window when the view comes within this fraction of either end
+LARGE_NOTE_PAGE_MARGIN = 0.1
+
+# Search waits this long (ms) after the last keystroke and shows at most this many results
+SEARCH_DELAY = 200
+SEARCH_LIMIT = 200
+
+# Open notes shown as tabs above the editor; opening another closes the least recently opened
+MAX_TABS = 10
+
+# Keys that would change an archived, read-only note: plain keys that type or delete, and the
+# Control shortcuts of the Text widget that edit
+EDIT_KEYS = {"BackSpace", "Delete", "Return", "KP_Enter", "Tab"}
+EDIT_CONTROL_KEYS = {"d", "h", "i", "k", "o", "t", "v", "x", "y", "z"}
 
 os.makedirs(USER_DATA_DIR, exist_ok=True)
 
@@ -73,11 +135,11 @@ class JournalApp:
         # Load settings
         self.settings = self._load_settings()
 
-        # Set trunk root based on settings
-        self.trunk_root = os.path.join(self.settings.get("save_dir", USER_DATA_DIR), "Trunks")
+        # Hot-path tracing, off unless asked for; Ctrl+Shift+D opens the debug panel
+        tracer.enable(bool(os.environ.get(TRACE_ENV)) or self.settings.get("trace", False))
 
-        # Setup storage directories
-        self._setup_storage()
+        # Storage under the trunk root from settings, with its catalog, search index, history and metadata
+        self.store = NoteStore(os.path.join(self.settings.get("save_dir", USER_DATA_DIR), "Trunks"), USER_DATA_DIR)
 
         # Font defaults
         self.font_family = "Arial"
@@ -89,24 +151,114 @@ class JournalApp:
         # Current open file
         self.current_file = None
 
-        # Autosave timer
+        # Autosave timer, and a digest of the text last queued for saving
         self.save_timer = None
+        self._saved_digest = None
+
+        # Edits not yet appended to the open note's log; None when the next save must write the whole note
+        self._log_ops = None
+
+        # The open note when it was opened read-only from an archive
+        self._read_only_file = None
+
+        # Windowed view of the open note when it is too large to load whole
+        self.large_note = None
+        self._paging = False
+
+        # Note metadata is written out shortly after it changes
+        self._meta_timer = None
+
+        # Refreshes the word count once pending edits are counted
+        self._stats_job = None
+        # Set when the open note's counts changed in metadata that has not been written yet
+        self._stats_unflushed = False
+
+        # Refreshes the latency summary in the options frame
+        self._latency_timer = None
 
         # Fullscreen state
         self.fullscreen = False
 
         # Drag and drop state
         self.dragged_item = None
+        self.dragged_notes = []
         self.drag_start_y = None
 
+        # Lazy tree state: nodes whose children have been listed, and pending chunked fills
+        self._loaded_nodes = set()
+        self._fill_jobs = {}
+
+        # The catalog is reconciled against disk on a background thread
+        self._reconcile_thread = None
+        self._reconcile_pending = False
+        # Trunks and journals waiting to be re-totalled, and the one worker totalling them
+        self._totals_pending = set()
+        self._totals_thread = None
+
+        # Search box state
+        self._search_timer = None
+        self._search_paths = []
+
+        # Callbacks posted by worker threads, run on the Tk thread
+        self._ui_calls = queue.Queue()
+
+        # Texts of recently opened notes, so switching back to one costs a stat rather than a read
+        self.buffers = BufferCache(self.settings.get("buffer_cache_mb", BUFFER_CACHE_BYTES // (1024 * 1024)) * 1024 * 1024)
+
+        # Notes likely to be opened next are read into the cache in the background
+        self.prefetcher = Prefetcher(self.store, self.buffers, self._digest)
+
+        # Open notes shown as tabs, and when each was last opened
+        self._tabs = []
+        self._tab_used = {}
+        self._tab_clock = 0
+
+        # Notes are written on a background thread; results come back through the UI queue
+        self.saver = WriteBehindSaver(
+            self._note_written,
+            functools.partial(self._post_to_ui, self._note_save_failed),
+        )
+
+        # Set when the watcher reports that the open note disappeared
+        self._current_deleted = False
+        # {path: time.monotonic()} of notes just written by the saver, set on the writer thread
+        self._own_writes = {}
+
         # Build UI components
         self._build_ui()
+        self.edit_recorder = EditRecorder(self.text)
+        self.edit_recorder.add_listener(self._record_change)
+        self.highlighter = MarkdownHighlighter(self.text, self.font_family, self.font_size, self.settings.get("markdown", True))
+        self.edit_recorder.add_listener(self.highlighter.changed)
+        self.doc_stats = DocumentStats(self.text, self._stats_changed)
+        self.edit_recorder.add_listener(self.doc_stats.changed)
+        # Undo history per note, kept across note switches instead of Tk's, which a load would wipe
+        self.undo = UndoManager(self.text, self.edit_recorder, UNDO_DIR if self.settings.get("undo_to_disk", False) else None)
+        self.undo.attach(None)
+        self.text.config(yscrollcommand=self._on_text_scroll)
 
         # Bind events
         self._bind_events()
 
-        # Load the treeview
+        # Log main-loop stalls and time keystrokes until the loop is idle again
+        self.stall_monitor = StallMonitor(self.root, STALL_LOG_FILE, app_file=__file__)
+        self.stall_monitor.start()
+        self.text.bind("<KeyRelease>", self.stall_monitor.key_released, add="+")
+
+        # Paint the treeview from the catalog, then check it against disk
         self.load_tree()
+        self._drain_ui_calls()
+        self._start_reconcile()
+
+        # Watch the save dir for external changes
+        self.watcher = self._start_watcher()
+
+        # A migration interrupted last time picks up where it stopped
+        self._resume_migration()
+
+        # Scheduled backups, if set up
+        self.backup_scheduler = None
+        self._start_backup_schedule()
 
     def _load_settings(self):
         """Load application settings from JSON file."""
@@ -126,16 +278,6 @@ class JournalApp:
         except IOError:
             messagebox.showerror("Error", "Failed to save settings.")
 
-    def _setup_storage(self):
-        """Setup the storage directories for trunks, journals, and unsaved notes."""
-        os.makedirs(self.trunk_root, exist_ok=True)
-        self.unsaved_trunk = os.path.join(self.trunk_root, "unsaved")
-        os.makedirs(self.unsaved_trunk, exist_ok=True)
-        self.unsaved_journal = os.path.join(self.unsaved_trunk, "notes")
-        os.makedirs(self.unsaved_journal, exist_ok=True)
-        self.unsaved_notes_dir = os.path.join(self.unsaved_journal, ".notes")
-        os.makedirs(self.unsaved_notes_dir, exist_ok=True)
-
     def _build_ui(self):
         """Build the main UI components."""
         # Collapse button for left panel
@@ -153,8 +295,15 @@ class JournalApp:
         style.map("Treeview", background=[('selected', self.select_bg)], foreground=[('selected', self.fg_color)])
         style.configure("Treeview.Heading", background=self.button_bg, foreground=self.fg_color)
 
+        # Search box; while it holds a query the results list replaces the tree
+        self.search_var = tk.StringVar()
+        self.search_entry = tk.Entry(self.left_frame, textvariable=self.search_var, bg=self.button_bg, fg=self.fg_color, insertbackground=self.fg_color)
+        self.search_entry.pack(fill="x", padx=10, pady=(10, 0))
+        self.search_results = tk.Listbox(self.left_frame, bg=self.bg_color, fg=self.fg_color, selectbackground=self.select_bg, highlightthickness=0, activestyle="none")
+
         # Treeview for hierarchy
-        self.tree = ttk.Treeview(self.left_frame, show="tree", style="Treeview")
+        self.tree = ttk.Treeview(self.left_frame, show="tree", selectmode="extended", style="Treeview", columns=("path", "stats"), displaycolumns=("stats",))
+        self.tree.column("stats", width=80, stretch=False, anchor="e")
         self.tree.pack(fill="both", expand=True, padx=10, pady=10)
 
         # Context menu
@@ -192,6 +341,10 @@ class JournalApp:
         self.options_toggle = tk.Button(self.header_frame, text="▼", command=self.toggle_options, bg=self.button_bg, fg=self.fg_color, width=2)
         self.options_toggle.pack(side="right")
 
+        # Live counts of the open note
+        self.stats_label = tk.Label(self.header_frame, text="", bg=self.header_bg, fg=self.header_fg, padx=10)
+        self.stats_label.pack(side="right")
+
         # Options frame (initially hidden)
         self.options_frame = tk.Frame(self.header_frame, bg=self.header_bg)
 
@@ -220,6 +373,42 @@ class JournalApp:
         change_dir_btn = tk.Button(self.options_frame, text="Change Save Dir", command=self.change_save_dir, bg=self.button_bg, fg=self.fg_color)
         change_dir_btn.pack(side="left", padx=5)
 
+        import_btn = tk.Button(self.options_frame, text="Import...", bg=self.button_bg, fg=self.fg_color)
+        import_menu = tk.Menu(import_btn, tearoff=0)
+        import_menu.add_command(label="Folder...", command=lambda: self.import_notes(filedialog.askdirectory(title="Import Folder")))
+        import_menu.add_command(label="Zip File...", command=lambda: self.import_notes(filedialog.askopenfilename(title="Import Zip File", filetypes=[("Zip archive", "*.zip")])))
+        import_btn.config(command=lambda: import_menu.tk_popup(import_btn.winfo_rootx(), import_btn.winfo_rooty() + import_btn.winfo_height()))
+        import_btn.pack(side="left", padx=5)
+
+        backup_btn = tk.Button(self.options_frame, text="Backup...", command=self.show_backup_dialog, bg=self.button_bg, fg=self.fg_color)
+        backup_btn.pack(side="left", padx=5)
+
+        self.edit_log_var = tk.BooleanVar(value=self.settings.get("edit_log", False))
+        edit_log_check = tk.Checkbutton(self.options_frame, text="Append-only saves", variable=self.edit_log_var, command=self.toggle_edit_log, bg=self.header_bg, fg=self.header_fg, selectcolor=self.button_bg, activebackground=self.header_bg, activeforeground=self.header_fg)
+        edit_log_check.pack(side="left", padx=5)
+
+        self.markdown_var = tk.BooleanVar(value=self.settings.get("markdown", True))
+        markdown_check = tk.Checkbutton(self.options_frame, text="Markdown", variable=self.markdown_var, command=self.toggle_markdown, bg=self.header_bg, fg=self.header_fg, selectcolor=self.button_bg, activebackground=self.header_bg, activeforeground=self.header_fg)
+        markdown_check.pack(side="left", padx=5)
+
+        self.undo_to_disk_var = tk.BooleanVar(value=self.settings.get("undo_to_disk", False))
+        undo_check = tk.Checkbutton(self.options_frame, text="Keep undo on disk", variable=self.undo_to_disk_var, command=self.toggle_undo_to_disk, bg=self.header_bg, fg=self.header_fg, selectcolor=self.button_bg, activebackground=self.header_bg, activeforeground=self.header_fg)
+        undo_check.pack(side="left", padx=5)
+
+        tk.Label(self.options_frame, text="Cache MB", bg=self.header_bg, fg=self.header_fg).pack(side="left")
+        self.cache_mb_var = tk.IntVar(value=self.buffers.budget // (1024 * 1024))
+        cache_spin = tk.Spinbox(self.options_frame, from_=0, to=4096, increment=16, width=5, textvariable=self.cache_mb_var, command=self.change_cache_size)
+        cache_spin.bind("<Return>", self.change_cache_size)
+        cache_spin.pack(side="left", padx=5)
+
+        # Keystroke latency and stall counts, refreshed while the options are shown
+        self.latency_label = tk.Label(self.options_frame, text="", bg=self.header_bg, fg=self.header_fg)
+        self.latency_label.pack(side="left", padx=5)
+
+        # Tabs of open notes
+        self.tab_bar = tk.Frame(self.right_container, bg=self.bg_color)
+        self.tab_bar.pack(side="top", fill="x")
+
         # Right writing panel
         self.right_frame = tk.Frame(self.right_container, bg=self.bg_color)
         self.right_frame.pack(side="top", fill="both", expand=True)
@@ -230,16 +419,34 @@ class JournalApp:
     def _bind_events(self):
         """Bind all necessary events."""
         self.tree.bind("<<TreeviewSelect>>", self.on_select)
+        self.tree.bind("<<TreeviewOpen>>", self.on_open)
         self.tree.bind("<Button-3>", self.popup)
         self.tree.bind("<Button-1>", self.start_drag)
         self.tree.bind("<B1-Motion>", self.on_drag)
         self.tree.bind("<ButtonRelease-1>", self.drop)
         self.text.bind("<KeyRelease>", self.schedule_save)
+        self.text.bind("<Control-Home>", self.large_note_home)
+        self.text.bind("<Control-End>", self.large_note_end)
+        self.text.bind("<Key>", self._guard_read_only_key)
+        for sequence in ("<<Paste>>", "<<PasteSelection>>", "<<Cut>>", "<<Clear>>"):
+            self.text.bind(sequence, self._guard_read_only_edit)
+        self.text.bind("<<Undo>>", self.undo_edit)
+        self.text.bind("<<Redo>>", self.redo_edit)
+        self.text.bind("<Control-y>", self.redo_edit)
         self.root.bind("<F11>", self.toggle_fullscreen)
         self.root.bind("<FocusIn>", self.refresh_on_focus)
         self.font_combo.bind("<<ComboboxSelected>>", self.change_font_family)
         self.header_label.bind("<Double-Button-1>", self.rename_note)
         self.header_label.bind("<Button-3>", self.rename_note)
+        self.search_entry.bind("<KeyRelease>", self.schedule_search)
+        self.search_entry.bind("<Escape>", self.clear_search)
+        self.search_results.bind("<<ListboxSelect>>", self.open_search_result)
+        self.root.bind("<Control-Shift-KeyPress-D>", self.show_debug_panel)
+        # On the editor and tree too, since their class bindings of Control-p move the cursor up a line
+        # before a binding on the window would run; quick_open's "break" stops them
+        for widget in (self.root, self.text, self.tree):
+            widget.bind("<Control-p>", self.quick_open)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def _save_prefs(self):
         """Save preferences to JSON file."""
@@ -252,87 +459,300 @@ class JournalApp:
 
     def change_save_dir(self):
         """Change the save directory and optionally migrate data."""
-        old_trunk_root = self.trunk_root
         new_save_dir = filedialog.askdirectory(title="Select New Save Directory")
         if not new_save_dir:
             return
-        new_trunk_root = os.path.join(new_save_dir, "Trunks")
-        migrate = messagebox.askyesno("Migrate Data?", "Move existing data to the new location?")
-        if migrate:
-            os.makedirs(new_trunk_root, exist_ok=True)
-            for item in os.listdir(old_trunk_root):
-                src = os.path.join(old_trunk_root, item)
-                dst = os.path.join(new_trunk_root, item)
-                if os.path.exists(dst):
-                    messagebox.showwarning("Conflict", f"Item {item} exists in target, skipping.")
-                    continue
-                try:
-                    shutil.move(src, dst)
-                except shutil.Error:
-                    messagebox.showerror("Error", f"Failed to move {item}.")
-        self.settings["save_dir"] = new_save_dir
+        if messagebox.askyesno("Migrate Data?", "Move existing data to the new location?"):
+            self._start_migration(self.store.trunk_root, os.path.join(new_save_dir, "Trunks"))
+        else:
+            self._switch_save_dir(os.path.join(new_save_dir, "Trunks"), False)
+
+    def import_notes(self, source):
+        """Plan an import of a folder or zip of text files, show what it would do, then do it if confirmed."""
+        if not source:
+            return
+        try:
+            importer = Import(self.store, source)
+        except OSError as e:
+            messagebox.showerror("Error", f"Cannot read {source}.\n{e}")
+            return
+        task = BackgroundTask(importer.plan, 0)
+        ProgressDialog(self.root, task, "Scanning", functools.partial(self._confirm_import, importer))
+
+    def _confirm_import(self, importer, task):
+        """Show the dry-run report and start writing once the user agrees."""
+        if task.error is not None or not task.result:
+            importer.close()
+            if task.error is not None:
+                messagebox.showerror("Error", f"Import failed.\n{task.error}")
+            return
+        if not importer.items:
+            importer.close()
+            messagebox.showinfo("Import", importer.report())
+            return
+        if not messagebox.askyesno("Import", importer.report() + "\n\nImport now?"):
+            importer.close()
+            return
+        task = BackgroundTask(importer.run, len(importer.items))
+        ProgressDialog(self.root, task, "Importing", functools.partial(self._finish_import, importer))
+
+    def _finish_import(self, importer, task):
+        """Refresh the tree once for everything imported."""
+        importer.close()
+        self._start_reconcile()
+        if task.error is not None:
+            messagebox.showerror("Error", f"Import failed after {task.done} notes.\n{task.error}")
+        else:
+            messagebox.showinfo("Import", f"Imported {task.result} notes.")
+
+    def _make_backup(self):
+        """Return a Backup of the current save dir to the configured backup folder."""
+        return Backup(self.store.trunk_root, self.settings["backup_dir"], self.settings.get("backup_versioned", True))
+
+    def _start_backup_schedule(self):
+        """(Re)start scheduled backups from the settings."""
+        if self.backup_scheduler is not None:
+            self.backup_scheduler.stop()
+            self.backup_scheduler = None
+        interval = self.settings.get("backup_interval", 0)
+        if self.settings.get("backup_dir") and interval > 0:
+            self.backup_scheduler = BackupScheduler(self._make_backup, interval, self._scheduled_backup_done)
+            self.backup_scheduler.start()
+
+    def _scheduled_backup_done(self, backup, error):
+        """Report a failed scheduled backup; successful ones are silent."""
+        if error is not None:
+            self._post_to_ui(messagebox.showwarning, "Backup", f"Scheduled backup to {backup.dest} failed.\n{error}")
+
+    def show_backup_dialog(self):
+        """Set up, run, verify and restore backups."""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Backup")
+        dir_var = tk.StringVar(value=self.settings.get("backup_dir", ""))
+        versioned_var = tk.BooleanVar(value=self.settings.get("backup_versioned", True))
+        interval_var = tk.IntVar(value=self.settings.get("backup_interval", 0))
+
+        row = tk.Frame(dialog)
+        row.pack(fill="x", padx=10, pady=(10, 5))
+        tk.Label(row, text="Folder:").pack(side="left")
+        tk.Label(row, textvariable=dir_var, anchor="w", width=40).pack(side="left", padx=5)
+
+        def choose():
+            path = filedialog.askdirectory(parent=dialog, title="Select Backup Folder")
+            if path:
+                dir_var.set(path)
+                apply()
+
+        tk.Button(row, text="Choose...", command=choose).pack(side="left")
+        tk.Checkbutton(dialog, text="Keep every version (otherwise a plain mirror)", variable=versioned_var, command=lambda: apply()).pack(anchor="w", padx=10)
+        row = tk.Frame(dialog)
+        row.pack(fill="x", padx=10, pady=5)
+        tk.Label(row, text="Back up every").pack(side="left")
+        tk.Spinbox(row, from_=0, to=1440, width=5, textvariable=interval_var, command=lambda: apply()).pack(side="left", padx=5)
+        tk.Label(row, text="minutes (0 = only by hand)").pack(side="left")
+
+        def apply():
+            try:
+                interval = max(int(interval_var.get()), 0)
+            except (tk.TclError, ValueError):
+                interval = 0
+            self.settings.update(backup_dir=dir_var.get(), backup_versioned=versioned_var.get(), backup_interval=interval)
+            self._save_settings()
+            self._start_backup_schedule()
+
+        def run(work, title, on_finish):
+            apply()
+            if not dir_var.get():
+                messagebox.showwarning("Backup", "Choose a backup folder first.", parent=dialog)
+                return
+            self.save_current()
+            self.saver.flush()
+            self._flush_meta()
+            task = BackgroundTask(functools.partial(work, self._make_backup()), 0)
+            ProgressDialog(self.root, task, title, on_finish)
+
+        def backed_up(task):
+            if task.error is not None:
+                messagebox.showerror("Backup", f"Backup failed.\n{task.error}")
+
+        def verified(task):
+            if task.error is not None:
+                messagebox.showerror("Backup", f"Verify failed.\n{task.error}")
+            elif task.result:
+                messagebox.showwarning("Backup", f"{len(task.result)} files are missing or damaged in the backup, e.g. {task.result[0]}")
+            elif not task.cancelled:
+                messagebox.showinfo("Backup", "Every file in the backup is intact.")
+
+        buttons = tk.Frame(dialog)
+        buttons.pack(pady=10)
+        tk.Button(buttons, text="Back Up Now", command=lambda: run(Backup.run, "Backing Up", backed_up)).pack(side="left", padx=5)
+        tk.Button(buttons, text="Verify", command=lambda: run(Backup.verify, "Verifying", verified)).pack(side="left", padx=5)
+        tk.Button(buttons, text="Restore...", command=lambda: (apply(), self._restore_backup(dialog))).pack(side="left", padx=5)
+        dialog.protocol("WM_DELETE_WINDOW", lambda: (apply(), dialog.destroy()))
+
+    def _restore_backup(self, parent):
+        """Restore a backup, or one of its versions, into a new save dir and offer to switch to it."""
+        if not self.settings.get("backup_dir"):
+            messagebox.showwarning("Backup", "Choose a backup folder first.", parent=parent)
+            return
+        backup = self._make_backup()
+        snapshot = None
+        versions = backup.snapshots()
+        if backup.versioned and versions:
+            snapshot = simpledialog.askstring("Restore", "Version to restore:\n" + "\n".join(versions[-10:]), initialvalue=versions[-1], parent=parent)
+            if snapshot is None:
+                return
+            if snapshot not in versions:
+                messagebox.showwarning("Backup", f"No version {snapshot}.", parent=parent)
+                return
+        folder = filedialog.askdirectory(parent=parent, title="Restore Into Folder")
+        if not folder:
+            return
+        target = os.path.join(unique_path(folder, "journa_restore")[0], "Trunks")
+        task = BackgroundTask(lambda task: backup.restore(target, snapshot, task), 0)
+        ProgressDialog(self.root, task, "Restoring", functools.partial(self._finish_restore, target))
+
+    def _finish_restore(self, target, task):
+        """Report the restore and offer to open the restored notes."""
+        if task.error is not None:
+            messagebox.showerror("Backup", f"Restore failed.\n{task.error}")
+            return
+        if task.result is None:
+            return
+        note = f"\n{len(task.result)} files could not be restored intact." if task.result else ""
+        if messagebox.askyesno("Restore", f"Restored to {os.path.dirname(target)}.{note}\n\nSwitch to the restored notes?"):
+            self._switch_save_dir(target, False)
+
+    def _resume_migration(self):
+        """Offer to finish a migration that was interrupted, e.g. by a crash or Cancel."""
+        interrupted = migration.pending(MIGRATION_FILE)
+        if not interrupted:
+            return
+        src, dst = interrupted
+        if messagebox.askyesno("Resume Migration?", f"Moving data from {src} to {dst} did not finish. Resume it now?"):
+            self._start_migration(src, dst)
+        else:
+            os.remove(MIGRATION_FILE)
+            messagebox.showinfo("Migration Abandoned", f"Your data stays in {src}. Files already copied are left in {dst}.")
+
+    def _start_migration(self, old_trunk_root, new_trunk_root):
+        """Copy and verify the trunks into the new root on worker threads behind a progress dialog."""
+        self.saver.flush()
+        self._flush_meta()
+        if self.large_note is not None:
+            self.large_note.close()
+        # Removing the sources must not look like external deletions
+        self.watcher.stop()
+        mover = migration.Migration(old_trunk_root, new_trunk_root, MIGRATION_FILE)
+
+        def work(task):
+            with tracer.span("migration"):
+                return mover.run(task)
+
+        task = BackgroundTask(work, 0)
+        ProgressDialog(self.root, task, "Migrating Data", functools.partial(self._finish_migration, mover))
+
+    def _finish_migration(self, mover, task):
+        """Switch to the new root once everything has moved; otherwise stay put so it can resume."""
+        for item in mover.skipped:
+            messagebox.showwarning("Conflict", f"Item {item} exists in target, skipping.")
+        if task.error is None and (task.result or (mover.failed and not os.path.exists(MIGRATION_FILE))):
+            for item in mover.items:
+                if item not in mover.failed:
+                    src = os.path.join(mover.src_root, item)
+                    dst = os.path.join(mover.dst_root, item)
+                    self.store.history.rename(src, dst)
+                    self.store.meta.rename(src, dst)
+            if mover.failed:
+                messagebox.showerror("Error", f"Failed to move {', '.join(mover.failed)}.")
+            self._switch_save_dir(mover.dst_root, True, mover.src_root)
+            return
+        if self.large_note is not None:
+            self.large_note.reopen(self.current_file)
+        self.watcher = self._start_watcher()
+        if task.error is not None:
+            detail = f"Migration failed: {task.error}."
+        elif mover.failed:
+            detail = f"{len(mover.failed)} file(s) could not be copied and verified."
+        else:
+            detail = "Migration cancelled."
+        messagebox.showerror("Migration Incomplete", f"{detail} Your data is still in {mover.src_root}; the migration resumes next time you choose {os.path.dirname(mover.dst_root)}, or at startup.")
+
+    @traced
+    def _switch_save_dir(self, new_trunk_root, migrated, old_trunk_root=None):
+        """Point the store, tree and watcher at new_trunk_root."""
+        self.settings["save_dir"] = os.path.dirname(new_trunk_root)
         self._save_settings()
-        self.trunk_root = new_trunk_root
-        self._setup_storage()
+        self.store.set_root(new_trunk_root)
+        self._reset_tree()
+        self.watcher.stop()
+        self.watcher = self._start_watcher()
         if self.current_file:
-            if migrate:
-                self.current_file = self.current_file.replace(old_trunk_root, new_trunk_root, 1)
-            if not os.path.exists(self.current_file):
+            if migrated:
+                self._current_moved(self.current_file.replace(old_trunk_root, new_trunk_root, 1))
+                if self.large_note is not None and os.path.exists(self.current_file):
+                    self.large_note.reopen(self.current_file)
+            if not self.store.exists(self.current_file):
+                self._release_large_note()
                 if messagebox.askyesno("Keep Current Note?", "Current note not found in new location. Keep in memory?"):
                     self.in_memory = True
                     self.header_label.config(text=f"In-Memory: {self.header_label.cget('text')}")
                 else:
                     self.current_file = None
-                    self.text.delete("1.0", tk.END)
+                    self._clear_editor()
                     self.header_label.config(text="Untitled")
         self.load_tree()
+        self._start_reconcile()
 
     def change_font_family(self, event):
         """Change the font family of the text editor."""
         self.font_family = self.font_combo.get()
-        self.text.config(font=(self.font_family, self.font_size))
+        self._apply_font()
         self._save_meta()
 
     def change_font_size(self, val):
         """Change the font size of the text editor."""
         self.font_size = int(float(val))
-        self.text.config(font=(self.font_family, self.font_size))
+        self._apply_font()
         self._save_meta()
 
-    def _meta_path(self):
-        """Get the path to the metadata file for the current note."""
-        if self.current_file:
-            return self.current_file + ".meta"
-        return None
+    def _apply_font(self):
+        """Set the editor and Markdown fonts from the current family and size."""
+        self.text.config(font=(self.font_family, self.font_size))
+        self.highlighter.configure(self.font_family, self.font_size)
 
     def _save_meta(self):
         """Save font metadata for the current note."""
         if self.current_file and not self.in_memory:
-            meta_path = self._meta_path()
-            data = {"font_family": self.font_family, "font_size": self.font_size}
-            try:
-                with open(meta_path, "w") as f:
-                    json.dump(data, f)
-            except IOError:
-                pass
-
+            if self.store.meta.set(self.current_file, font_family=self.font_family, font_size=self.font_size):
+                self._schedule_meta_flush()
+
+    def _schedule_meta_flush(self):
+        """Write metadata changes out once they stop coming, e.g. when the size slider is released."""
+        if self._meta_timer:
+            self.root.after_cancel(self._meta_timer)
+        self._meta_timer = self.root.after(META_FLUSH_DELAY, self._flush_meta_in_background)
+
+    def _flush_meta_in_background(self):
+        """Write metadata changes on the note writer thread, so the files are written off the Tk thread."""
+        self._meta_timer = None
+        self.saver.submit(META_WRITE_KEY, self.store.meta.flush)
+
+    def _flush_meta(self):
+        """Write pending metadata changes now."""
+        if self._meta_timer:
+            self.root.after_cancel(self._meta_timer)
+            self._meta_timer = None
+        self.store.meta.flush()
+
+    @traced
     def _load_meta(self):
         """Load font metadata for the current note."""
         if self.current_file:
-            meta_path = self._meta_path()
-            if os.path.exists(meta_path):
-                try:
-                    with open(meta_path, "r") as f:
-                        data = json.load(f)
-                        self.font_family = data.get("font_family", "Arial")
-                        self.font_size = data.get("font_size", 12)
-                except (json.JSONDecodeError, IOError):
-                    self.font_family = "Arial"
-                    self.font_size = 12
-            else:
-                self.font_family = "Arial"
-                self.font_size = 12
-            self.text.config(font=(self.font_family, self.font_size))
+            data = self.store.meta.get(self.current_file)
+            self.font_family = data.get("font_family", "Arial")
+            self.font_size = data.get("font_size", 12)
+            self._apply_font()
             self.font_combo.set(self.font_family)
             self.size_scale.set(self.font_size)
 
@@ -341,9 +761,11 @@ class JournalApp:
         if not iid:
             return None
         parent = self.tree.parent(iid)
+        if "placeholder" in self.tree.item(iid, "tags"):
+            return None
         if not parent:
             return "trunk"
-        elif self.tree.item(iid).get('values'):
+        elif self.tree.set(iid, "path"):
             return "note"
         return "journal"
 
@@ -353,6 +775,9 @@ class JournalApp:
         if iid and self.get_item_type(iid) == "note":
             self.dragged_item = iid
             self.drag_start_y = event.y
+            # The press is about to collapse a multi-selection, so remember which notes it carries
+            selection = self._selected_of_type("note")
+            self.dragged_notes = selection if iid in selection else [iid]
 
     def on_drag(self, event):
         """Placeholder for drag motion."""
@@ -385,92 +810,188 @@ class JournalApp:
             self.dragged_item = None
             self.drag_start_y = None
             return
-        if self.tree.parent(self.dragged_item) == drop_journal_iid:
-            self.dragged_item = None
-            self.drag_start_y = None
-            return
-        self._move_note_to_journal(self.dragged_item, drop_journal_iid)
+        if len(self.dragged_notes) > 1:
+            self._move_notes_batch(self.dragged_notes, drop_journal_iid)
+        elif self.tree.parent(self.dragged_item) != drop_journal_iid:
+            self._move_note_to_journal(self.dragged_item, drop_journal_iid)
         self.dragged_item = None
         self.drag_start_y = None
 
+    @traced
     def _move_note_to_journal(self, note_iid, journal_iid):
         """Move a note to a different journal."""
-        journal_item = self.tree.item(journal_iid)
-        trunk_iid = self.tree.parent(journal_iid)
-        trunk_item = self.tree.item(trunk_iid)
         src_file = self.tree.item(note_iid)['values'][0]
         src_dir = os.path.dirname(src_file)
-        trunk_name = trunk_item['text'].lower().replace(" ", "_")
-        journal_name = journal_item['text'].lower().replace(" ", "_")
-        dest_dir = os.path.join(self.trunk_root, trunk_name, journal_name, ".notes")
-        if src_dir == dest_dir:
-            return
-        base_file = os.path.basename(src_file)
-        dest_file = os.path.join(dest_dir, base_file)
-        base, ext = os.path.splitext(base_file)
-        counter = 2
-        new_base = base
-        while os.path.exists(dest_file):
-            new_base = f"{base}_{counter}"
-            dest_file = os.path.join(dest_dir, new_base + ext)
-            counter += 1
+        if src_dir == os.path.join(journal_iid, ".notes"):
+            return
+        moving_large = self.large_note is not None and self.current_file == src_file
         try:
-            shutil.move(src_file, dest_file)
-            src_meta = src_file + ".meta"
-            if os.path.exists(src_meta):
-                shutil.move(src_meta, dest_file + ".meta")
+            self.saver.flush(src_file)
+            if moving_large:
+                self.large_note.close()
+            dest_file = self.store.move_note(src_file, journal_iid)
+            self._schedule_meta_flush()
             if self.current_file == src_file:
-                self.current_file = dest_file
-                if new_base != base:
-                    new_display = self._format_display(new_base)
+                self._current_moved(dest_file)
+                if moving_large:
+                    self.large_note.reopen(dest_file)
+                if os.path.basename(dest_file) != os.path.basename(src_file):
+                    new_display = self._format_display(os.path.basename(dest_file)[:-4])
                     self.header_label.config(text=new_display)
-        except shutil.Error:
+        except OSError:
+            if moving_large:
+                self.large_note.reopen()
             messagebox.showerror("Error", "Failed to move note.")
-        self.load_tree()
+        self._refresh_node(os.path.dirname(src_dir))
+        self._refresh_node(journal_iid)
 
     def refresh_on_focus(self, event):
-        """Refresh tree and handle deleted files on window focus."""
+        """Handle a deleted current note and let the watcher catch up on window focus."""
         if event.widget != self.root:
             return
-        if self.current_file and not os.path.exists(self.current_file) and not self.in_memory:
+        self.watcher.poll_now()
+        self._handle_current_deleted()
+
+    def _handle_current_deleted(self):
+        """Offer to keep the open note in memory once the watcher has seen it deleted."""
+        if not self._current_deleted:
+            return
+        self._current_deleted = False
+        if self.current_file and not self.store.exists(self.current_file) and not self.in_memory:
+            self._release_large_note()
             if messagebox.askyesno("File Deleted", "The current note has been deleted from disk. Keep an in-memory version (unsaved)?"):
                 self.in_memory = True
                 self.header_label.config(text=f"In-Memory Note: {self.header_label.cget('text')}")
             else:
-                self.text.delete("1.0", tk.END)
+                self._clear_editor()
                 self.current_file = None
                 self.in_memory = False
                 self.header_label.config(text="Untitled")
-        self.load_tree()
+
+    def _start_watcher(self):
+        """Start a watcher for the current trunk root that patches the tree from the Tk thread."""
+        watcher = Watcher(self.store.trunk_root, functools.partial(self._post_fs_events, self.store.trunk_root))
+        watcher.start()
+        return watcher
+
+    def _post_fs_events(self, root, events):
+        """Forward watcher events to the Tk thread."""
+        self._post_to_ui(self._apply_fs_events, root, events)
+
+    @traced
+    def _apply_fs_events(self, root, events):
+        """Patch the catalog and tree for each external create, delete or rename."""
+        if root != self.store.trunk_root:
+            return
+        now = time.monotonic()
+        for path, written in list(self._own_writes.items()):
+            if now - written > OWN_WRITE_SECONDS:
+                self._own_writes.pop(path, None)
+        for event in events:
+            if event[0] == "created":
+                if event[1] in self._own_writes:
+                    continue  # A save of ours renamed over the note; it is already in the catalog and tree
+                self._fs_created(event[1])
+            elif event[0] == "deleted":
+                self._fs_deleted(event[1])
+            elif event[0] == "moved":
+                self._fs_moved(event[1], event[2])
+            else:
+                self.store.catalog.invalidate(root)
+                self._start_reconcile()
+        if self._current_deleted and self.root.focus_displayof() is not None:
+            self.root.after_idle(self._handle_current_deleted)
+
+    def _fs_created(self, path):
+        """Add a trunk, journal or note that appeared on disk."""
+        info = classify(self.store.trunk_root, path)
+        if info is None:
+            return
+        item_type, node = info
+        if not self.store.catalog.add(path, item_type, node):
+            return
+        if item_type == "note":
+            self.store.search_index.update(path)
+        parent = "" if node == self.store.trunk_root else node
+        if self.tree.exists(path) or (parent and (parent not in self._loaded_nodes or not self.tree.exists(parent))):
+            return
+        if parent in self._fill_jobs:
+            self._sync_children(parent, self._list_children(parent))
+            return
+        siblings = [os.path.basename(iid) for iid in self.tree.get_children(parent)]
+        index = bisect.bisect_left(siblings, os.path.basename(path))
+        self._insert_row(parent, index, path, self._display_text(os.path.basename(path), item_type), item_type)
+
+    def _fs_deleted(self, path):
+        """Remove a trunk, journal or note that disappeared from disk."""
+        if self.store.exists(path):
+            return  # A note file that went into its journal's pack
+        if classify(self.store.trunk_root, path) is not None:
+            self.store.deleted(path)
+            self._schedule_meta_flush()
+        if self.tree.exists(path):
+            parent = self.tree.parent(path)
+            if parent in self._fill_jobs:
+                self._sync_children(parent, self._list_children(parent))
+            else:
+                self.tree.delete(path)
+                self._forget_loaded(path)
+        if self.current_file and (self.current_file == path or self.current_file.startswith(path + os.sep)):
+            self._current_deleted = True
+
+    def _fs_moved(self, old, new):
+        """Apply an external rename, following the open note if it moved."""
+        self.store.moved(old, new)
+        follows = self.current_file and (self.current_file == old or self.current_file.startswith(old + os.sep))
+        self._fs_deleted(old)
+        self._fs_created(new)
+        if follows and not self.in_memory:
+            moved_file = new + self.current_file[len(old):]
+            if classify(self.store.trunk_root, moved_file) is not None:
+                self._current_deleted = False
+                if self._log_ops is not None:
+                    # The log stayed behind under the old name; rewrite the whole note at its new path
+                    self.saver.submit(self.current_file, functools.partial(editlog.discard, self.current_file))
+                    self._log_ops = None
+                    self.text.edit_modified(True)
+                self._current_moved(moved_file)
+                if self.large_note is not None:
+                    self.saver.flush()
+                    self.large_note.reopen(moved_file)
+                if self.current_file == new:
+                    self.header_label.config(text=self._format_display(os.path.basename(new)[:-4]))
 
     def _format_display(self, file_base):
         """Format file base name for display."""
-        match = re.search(r"_(\d+)$", file_base)
-        if match:
-            num = match.group(1)
-            try:
-                num_int = int(num)
-                if num_int < 100:
-                    base_part = file_base[:match.start()]
-                    base_display = base_part.replace("_", " ").title()
-                    return f"{base_display} ({num_int})"
-            except ValueError:
-                pass
-        return file_base.replace("_", " ").title()
+        return format_display(file_base)
 
     def popup(self, event):
         """Show context menu for tree items."""
         iid = self.tree.identify_row(event.y)
         if iid:
-            self.tree.selection_set(iid)
+            if iid not in self.tree.selection():
+                self.tree.selection_set(iid)
             self.tree.focus(iid)
             self.menu.delete(0, tk.END)
             self.menu.add_command(label="Open in Explorer", command=self.open_location)
             item_type = self.get_item_type(iid)
             if item_type == "note":
                 self.menu.add_command(label="Move to Journal...", command=self.move_note_context)
-            elif item_type == "journal":
+                self.menu.add_command(label="History...", command=self.show_history)
+            elif item_type == "journal" and not self.store.archived(iid):
                 self.menu.add_command(label="Move to Trunk...", command=self.move_journal_context)
+                self.menu.add_command(label="Unpack Journal" if self.store.packed(iid) else "Pack Journal", command=self.toggle_pack_journal)
+            if item_type in ("trunk", "journal"):
+                held = self.store.archived(iid)
+                if held is None:
+                    self.menu.add_command(label="Archive", command=self.archive_item)
+                elif held == iid:
+                    self.menu.add_command(label="Unarchive", command=self.unarchive_item)
+            export_menu = tk.Menu(self.menu, tearoff=0)
+            for fmt, (label, _) in export.FORMATS.items():
+                export_menu.add_command(label=label + "...", command=functools.partial(self.export_item, fmt))
+            self.menu.add_cascade(label="Export", menu=export_menu)
+            self.menu.add_command(label="Delete", command=self.delete_item)
             try:
                 self.menu.tk_popup(event.x_root, event.y_root)
             finally:
@@ -478,99 +999,45 @@ class JournalApp:
 
     def _get_target_journal(self):
         """Open dialog to select target journal for moving notes."""
-        dialog = tk.Toplevel(self.root)
-        dialog.title("Select Target Journal")
-        tree = ttk.Treeview(dialog, show="tree")
-        tree.pack(fill="both", expand=True)
-        for trunk_iid in self.tree.get_children():
-            trunk_text = self.tree.item(trunk_iid)['text']
-            new_trunk_id = tree.insert("", "end", text=trunk_text, open=False)
-            for journal_iid in self.tree.get_children(trunk_iid):
-                journal_text = self.tree.item(journal_iid)['text']
-                tree.insert(new_trunk_id, "end", text=journal_text)
-        target = None
-
-        def ok():
-            nonlocal target
-            sel = tree.focus()
-            if sel and tree.parent(sel) and not tree.get_children(sel):
-                journal_text = tree.item(sel)['text']
-                trunk_text = tree.item(tree.parent(sel))['text']
-                target = (trunk_text, journal_text)
-            dialog.destroy()
-
-        tk.Button(dialog, text="OK", command=ok).pack(pady=10)
-        dialog.grab_set()
-        self.root.wait_window(dialog)
-        return target
+        return self._pick_target("Select Target Journal", "journal")
 
     def _get_target_trunk(self):
         """Open dialog to select target trunk for moving journals."""
-        dialog = tk.Toplevel(self.root)
-        dialog.title("Select Target Trunk")
-        tree = ttk.Treeview(dialog, show="tree")
-        tree.pack(fill="both", expand=True)
-        for trunk_iid in self.tree.get_children():
-            trunk_text = self.tree.item(trunk_iid)['text']
-            tree.insert("", "end", text=trunk_text)
-        target = None
-
-        def ok():
-            nonlocal target
-            sel = tree.focus()
-            if sel and not tree.parent(sel) and not tree.get_children(sel):
-                target = tree.item(sel)['text']
-            dialog.destroy()
+        return self._pick_target("Select Target Trunk", "trunk")
 
-        tk.Button(dialog, text="OK", command=ok).pack(pady=10)
-        dialog.grab_set()
-        self.root.wait_window(dialog)
+    def _pick_target(self, title, kind):
+        """Let the user find a trunk or journal by name; return its path, or None."""
+        target = QuickOpenDialog(self.root, self.store.names, title, kinds=(kind,), modal=True).result
+        if target and self.store.archived(target):
+            messagebox.showwarning("Warning", f"That {kind} is archived and read-only.")
+            return None
         return target
 
+    def quick_open(self, event=None):
+        """Find any trunk, journal or note by name and reveal it in the tree."""
+        QuickOpenDialog(self.root, self.store.names, on_pick=self._open_picked)
+        return "break"
+
+    def _open_picked(self, path, kind):
+        """Reveal a quick-open choice, loading it if it is a note."""
+        if not self.store.exists(path):
+            messagebox.showwarning("Warning", f"That {kind} no longer exists.")
+            return
+        self._reveal(path)
+
     def move_note_context(self):
         """Move selected note to another journal via context menu."""
         selected = self.tree.focus()
         if not selected or self.get_item_type(selected) != "note":
             return
-        current_journal_id = self.tree.parent(selected)
-        current_trunk_id = self.tree.parent(current_journal_id)
-        current_trunk_text = self.tree.item(current_trunk_id)['text']
-        current_journal_text = self.tree.item(current_journal_id)['text']
-        target = self._get_target_journal()
-        if not target:
+        notes = self._selected_of_type("note")
+        target_journal = self._get_target_journal()
+        if len(notes) > 1 and target_journal:
+            self._move_notes_batch(notes, target_journal)
             return
-        target_trunk_text, target_journal_text = target
-        if target_trunk_text == current_trunk_text and target_journal_text == current_journal_text:
+        if not target_journal or target_journal == self.tree.parent(selected):
             return
-        target_trunk_name = target_trunk_text.lower().replace(" ", "_")
-        target_journal_name = target_journal_text.lower().replace(" ", "_")
-        dest_dir = os.path.join(self.trunk_root, target_trunk_name, target_journal_name, ".notes")
-        src_file = self.tree.item(selected)['values'][0]
-        src_dir = os.path.dirname(src_file)
-        if src_dir == dest_dir:
-            return
-        base_file = os.path.basename(src_file)
-        dest_file = os.path.join(dest_dir, base_file)
-        base, ext = os.path.splitext(base_file)
-        counter = 2
-        new_base = base
-        while os.path.exists(dest_file):
-            new_base = f"{base}_{counter}"
-            dest_file = os.path.join(dest_dir, new_base + ext)
-            counter += 1
-        try:
-            shutil.move(src_file, dest_file)
-            src_meta = src_file + ".meta"
-            if os.path.exists(src_meta):
-                shutil.move(src_meta, dest_file + ".meta")
-            if self.current_file == src_file:
-                self.current_file = dest_file
-                if new_base != base:
-                    new_display = self._format_display(new_base)
-                    self.header_label.config(text=new_display)
-        except shutil.Error:
-            messagebox.showerror("Error", "Failed to move note.")
-        self.load_tree()
+        self._move_note_to_journal(selected, target_journal)
 
     def move_journal_context(self):
         """Move selected journal to another trunk via context menu."""
@@ -578,30 +1045,406 @@ class JournalApp:
         if not selected or self.get_item_type(selected) != "journal":
             return
         current_trunk_id = self.tree.parent(selected)
-        current_trunk_text = self.tree.item(current_trunk_id)['text']
-        target_trunk_text = self._get_target_trunk()
-        if not target_trunk_text or target_trunk_text == current_trunk_text:
-            return
-        journal_text = self.tree.item(selected)['text']
-        journal_name = journal_text.lower().replace(" ", "_")
-        target_trunk_name = target_trunk_text.lower().replace(" ", "_")
-        dest_path = os.path.join(self.trunk_root, target_trunk_name, journal_name)
-        if os.path.exists(dest_path):
+        journals = self._selected_of_type("journal")
+        target_trunk = self._get_target_trunk()
+        if len(journals) > 1 and target_trunk:
+            self._move_journals_batch(journals, target_trunk)
+            return
+        if not target_trunk or target_trunk == current_trunk_id:
+            return
+        src_path = selected
+        if os.path.exists(os.path.join(target_trunk, os.path.basename(src_path))):
             messagebox.showwarning("Warning", "Journal with same name exists in target trunk.")
             return
-        current_trunk_name = current_trunk_text.lower().replace(" ", "_")
-        src_path = os.path.join(self.trunk_root, current_trunk_name, journal_name)
         notes_path = os.path.join(src_path, ".notes")
         if self.current_file and os.path.dirname(self.current_file) == notes_path:
             self.save_current()
+            self._release_large_note()
             self.current_file = None
-            self.text.delete("1.0", tk.END)
+            self._clear_editor()
             self.header_label.config(text="Untitled")
         try:
-            shutil.move(src_path, dest_path)
-        except shutil.Error:
+            self.saver.flush()
+            self.store.move_journal(src_path, target_trunk)
+        except OSError:
             messagebox.showerror("Error", "Failed to move journal.")
-        self.load_tree()
+        self._refresh_node(current_trunk_id)
+        self._refresh_node(target_trunk)
+
+    def toggle_pack_journal(self):
+        """Convert the selected journal between a directory of note files and a single pack file."""
+        journal = self.tree.focus()
+        if self.get_item_type(journal) != "journal":
+            return
+        packing = not self.store.packed(journal)
+        if self._under_any(self.current_file, [journal]):
+            self.save_current()
+            self._release_large_note()
+        self.saver.flush()
+        self._flush_meta()
+        work = self.store.pack_journal if packing else self.store.unpack_journal
+        task = BackgroundTask(functools.partial(work, journal), self.store.note_count(journal))
+        title = "Packing Journal" if packing else "Unpacking Journal"
+        ProgressDialog(self.root, task, title, functools.partial(self._finish_pack_journal, journal))
+
+    def _finish_pack_journal(self, journal, task):
+        """Reopen the current note from its new home and re-list the journal."""
+        if self._under_any(self.current_file, [journal]) and not self.in_memory:
+            self._load_note(self.current_file)
+        self._refresh_node(journal)
+        if task.error is not None:
+            messagebox.showerror("Error", f"Failed to convert journal.\n{task.error}")
+
+    def archive_item(self):
+        """Compress the selected trunk or journal into a read-only archive."""
+        self._convert_archive(self.store.archive_node, "Archiving")
+
+    def unarchive_item(self):
+        """Restore the selected archived trunk or journal to directories and files."""
+        self._convert_archive(self.store.unarchive_node, "Unarchiving")
+
+    def _convert_archive(self, work, title):
+        node = self.tree.focus()
+        if self.get_item_type(node) not in ("trunk", "journal"):
+            return
+        if self._under_any(self.current_file, [node]):
+            self.save_current()
+            self._release_large_note()
+        self.saver.flush()
+        self._flush_meta()
+        task = BackgroundTask(functools.partial(work, node), 0)
+        ProgressDialog(self.root, task, title, functools.partial(self._finish_archive, node))
+
+    def _finish_archive(self, node, task):
+        """Re-list the node under its new name and reopen the current note, editable or not."""
+        if self._under_any(self.current_file, [node]) and not self.in_memory:
+            self._load_note(self.current_file)
+            self._load_meta()
+            display = self._format_display(os.path.basename(self.current_file)[:-4])
+            self.header_label.config(text=display + (" (Read-only)" if self._read_only_file else ""))
+        parent = self.tree.parent(node) if self.tree.exists(node) else ""
+        if self.tree.exists(node):
+            self.tree.delete(node)
+            self._forget_loaded(node)
+        self._refresh_node(parent)
+        if task.error is not None:
+            messagebox.showerror("Error", f"Failed to convert {os.path.basename(node)}.\n{task.error}")
+
+    def export_item(self, fmt):
+        """Export the selected note, journal or trunk as a zip, a Markdown file or an HTML site."""
+        node = self.tree.focus()
+        item_type = self.get_item_type(node)
+        if item_type is None:
+            return
+        base = os.path.basename(node)[:-4] if item_type == "note" else os.path.basename(node)
+        label, ext = export.FORMATS[fmt]
+        if ext is None:
+            parent = filedialog.askdirectory(title=f"Export {label} Into")
+            if not parent:
+                return
+            dest = unique_path(parent, base + "_site")[0]
+        else:
+            dest = filedialog.asksaveasfilename(title=f"Export {label}", initialfile=base + ext, defaultextension=ext, filetypes=[(label, "*" + ext)])
+            if not dest:
+                return
+        self.save_current()
+        self.saver.flush()
+        task = BackgroundTask(functools.partial(export.export, self.store, node, dest, fmt), 0)
+        ProgressDialog(self.root, task, "Exporting", self._finish_export)
+
+    def _finish_export(self, task):
+        """Report where an export went, or why it failed."""
+        if task.error is not None:
+            messagebox.showerror("Error", f"Export failed.\n{task.error}")
+        elif task.result:
+            messagebox.showinfo("Export", f"Exported to {task.result}")
+
+    def _guard_read_only_key(self, event):
+        """Swallow keys that would edit a note opened read-only; moving, selecting and copying still work."""
+        if self.current_file is None or self.current_file != self._read_only_file:
+            return None
+        if event.state & 0x4:
+            return "break" if event.keysym.lower() in EDIT_CONTROL_KEYS else None
+        if event.keysym in EDIT_KEYS or (event.char and event.char.isprintable()):
+            return "break"
+        return None
+
+    def _guard_read_only_edit(self, event):
+        """Swallow paste, cut and clear in a note opened read-only."""
+        if self.current_file is not None and self.current_file == self._read_only_file:
+            return "break"
+        return None
+
+    def undo_edit(self, event=None):
+        """Undo the last edit to the open note."""
+        if self._guard_read_only_edit(event) is None and not self.undo.undo():
+            self.text.bell()
+        return "break"
+
+    def redo_edit(self, event=None):
+        """Redo the last undone edit to the open note."""
+        if self._guard_read_only_edit(event) is None and not self.undo.redo():
+            self.text.bell()
+        return "break"
+
+    def _clear_editor(self):
+        """Empty the editor for a new untitled note, keeping the undo history of the note it showed."""
+        self.undo.detach()
+        self.text.delete("1.0", tk.END)
+        self.undo.forget(None)
+        self.undo.attach(None)
+
+    def _selected_of_type(self, item_type):
+        """Return the selected tree items of one type, in tree order."""
+        return [iid for iid in self.tree.selection() if self.get_item_type(iid) == item_type]
+
+    def _move_notes_batch(self, notes, journal):
+        """Move several notes to a journal on a worker thread, then patch the tree once."""
+        nodes = {os.path.dirname(os.path.dirname(note)) for note in notes} | {journal}
+        self._start_batch_move("Moving Notes", notes, nodes, lambda task: self.store.move_notes(notes, journal, task))
+
+    def _move_journals_batch(self, journals, trunk):
+        """Move several journals to a trunk on a worker thread, then patch the tree once."""
+        nodes = {os.path.dirname(journal) for journal in journals} | {trunk}
+        self._start_batch_move("Moving Journals", journals, nodes, lambda task: self.store.move_journals(journals, trunk, task))
+
+    def _start_batch_move(self, title, paths, nodes, work):
+        self.save_current()
+        self.saver.flush()
+        moves_open_note = self._under_any(self.current_file, paths)
+        if moves_open_note and self.large_note is not None:
+            self.large_note.close()
+        task = BackgroundTask(work, len(paths))
+        ProgressDialog(self.root, task, title, functools.partial(self._finish_batch_move, nodes, moves_open_note))
+
+    def _finish_batch_move(self, nodes, moved_open_note, task):
+        """Follow the open note to its new path and re-list each affected node once."""
+        moved, failed = task.result or ([], [])
+        if moved_open_note:
+            for old, new in moved:
+                if self._under_any(self.current_file, [old]):
+                    self._current_moved(new + self.current_file[len(old):])
+                    self.header_label.config(text=self._format_display(os.path.basename(self.current_file)[:-4]))
+                    break
+            if self.large_note is not None:
+                self.large_note.reopen(self.current_file)
+        self._schedule_meta_flush()
+        for node in sorted(nodes, key=len):
+            self._refresh_node("" if node == self.store.trunk_root else node)
+        if task.error is not None or failed:
+            messagebox.showerror("Error", f"Failed to move {len(failed) or 'some'} item(s).")
+
+    def _delete_batch(self, paths):
+        """Delete several notes, journals or trunks on a worker thread, then patch the tree once."""
+        protected = {self.store.unsaved_trunk, self.store.unsaved_journal}
+        if protected.intersection(paths):
+            messagebox.showwarning("Warning", "The 'Unsaved' trunk and its journal cannot be deleted; skipping them.")
+        # Items inside another selected item go with it
+        paths = [p for p in paths if p not in protected and not any(p.startswith(q + os.sep) for q in paths)]
+        if not paths or not messagebox.askyesno("Delete Items", f"Are you sure you want to delete these {len(paths)} items and everything in them?"):
+            return
+        if self._under_any(self.current_file, paths):
+            self._release_large_note()
+        self.save_current()
+        notes = []
+        for path in paths:
+            notes.extend([path] if self.get_item_type(path) == "note" else [note for note, _, _ in self.store.catalog.notes(path)])
+        self._settle_notes(notes)
+        nodes = {self.tree.parent(path) for path in paths}
+        task = BackgroundTask(lambda task: self.store.delete_many(paths, task), len(paths))
+        ProgressDialog(self.root, task, "Deleting", functools.partial(self._finish_batch_delete, nodes))
+
+    def _finish_batch_delete(self, nodes, task):
+        """Close the open note if it was deleted and re-list each affected node once."""
+        deleted, failed = task.result or ([], [])
+        if self._under_any(self.current_file, deleted):
+            self._clear_editor()
+            self.current_file = None
+            self.header_label.config(text="Untitled")
+        self._schedule_meta_flush()
+        for node in sorted(nodes, key=len):
+            self._refresh_node(node)
+        if task.error is not None or failed:
+            messagebox.showerror("Error", f"Failed to delete {len(failed) or 'some'} item(s).")
+
+    def _under_any(self, path, roots):
+        """Return True if path is one of roots or lies below one of them."""
+        return bool(path) and any(path == root or path.startswith(root + os.sep) for root in roots)
+
+    def show_history(self):
+        """Browse the saved versions of the selected note, compare them and restore one."""
+        selected = self.tree.focus()
+        if self.get_item_type(selected) != "note":
+            return
+        path = self.tree.item(selected)['values'][0]
+        if path == self.current_file:
+            self.save_current()
+            self.saver.flush(path)
+            self._run_ui_calls()
+        self.store.history.flush()
+        title = self.tree.item(selected)['text']
+
+        def work():
+            # Opened once the history worker has taken in the latest save, without blocking the window
+            self.store.history.wait()
+            self._post_to_ui(self._open_history, path, title)
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def _open_history(self, path, title):
+        """Show the history dialog of a note, once its latest save is in the history."""
+        versions = [v for v in self.store.history.versions(path) if v[1] is not None]
+        if not versions:
+            messagebox.showinfo("History", "No saved versions of this note yet.")
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"History - {title}")
+        dialog.geometry("760x480")
+        side = tk.Frame(dialog)
+        side.pack(side="left", fill="y", padx=5, pady=5)
+        listbox = tk.Listbox(side, width=24, exportselection=False)
+        listbox.pack(fill="both", expand=True)
+        for when, _, size in versions:
+            listbox.insert(tk.END, f"{datetime.fromtimestamp(when).strftime('%Y-%m-%d %H:%M')}  ({size} chars)")
+        tk.Label(side, text="As of (YYYY-MM-DD HH:MM):").pack(anchor="w", pady=(5, 0))
+        as_of_entry = tk.Entry(side)
+        as_of_entry.pack(fill="x")
+        view = tk.Text(dialog, wrap="word", state="disabled")
+        view.pack(side="left", fill="both", expand=True, padx=5, pady=5)
+
+        def show(content):
+            view.config(state="normal")
+            view.delete("1.0", tk.END)
+            view.insert("1.0", content)
+            view.config(state="disabled")
+
+        def selected_index():
+            selection = listbox.curselection()
+            return selection[0] if selection else None
+
+        def on_pick(event=None):
+            index = selected_index()
+            if index is not None:
+                show(self.store.history.text(versions[index][1]))
+
+        def compare():
+            index = selected_index()
+            if index is None:
+                return
+            if index + 1 >= len(versions):
+                messagebox.showinfo("History", "This is the oldest version.", parent=dialog)
+                return
+            labels = [datetime.fromtimestamp(versions[i][0]).strftime("%Y-%m-%d %H:%M:%S") for i in (index + 1, index)]
+            show("".join(self.store.history.diff(versions[index + 1][1], versions[index][1], *labels)) or "No changes.")
+
+        def go_to_date(event=None):
+            value = as_of_entry.get().strip()
+            for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
+                try:
+                    when = datetime.strptime(value, fmt).timestamp()
+                    break
+                except ValueError:
+                    continue
+            else:
+                messagebox.showwarning("Warning", "Enter a date as YYYY-MM-DD or YYYY-MM-DD HH:MM.", parent=dialog)
+                return
+            content = self.store.history.as_of(path, when)
+            if content is None:
+                messagebox.showinfo("History", "The note had no saved version at that time.", parent=dialog)
+                return
+            listbox.selection_clear(0, tk.END)
+            index = next(i for i, v in enumerate(versions) if v[0] <= when)
+            listbox.selection_set(index)
+            listbox.see(index)
+            show(content)
+
+        def restore():
+            index = selected_index()
+            if index is None:
+                return
+            if not messagebox.askyesno("Restore Version", "Replace the note with this version?", parent=dialog):
+                return
+            content = self.store.history.text(versions[index][1])
+            if path == self.current_file and self.large_note is not None:
+                self._release_large_note()
+                self.saver.submit(path, self._write_job(path, content))
+                self._load_note(path)
+            elif path == self.current_file and not self.in_memory:
+                self.text.delete("1.0", tk.END)
+                self.text.insert("1.0", content)
+                self.save_current()
+            else:
+                self.saver.submit(path, self._write_job(path, content))
+            dialog.destroy()
+
+        listbox.bind("<<ListboxSelect>>", on_pick)
+        as_of_entry.bind("<Return>", go_to_date)
+        tk.Button(side, text="Show", command=go_to_date).pack(fill="x", pady=(2, 5))
+        tk.Button(side, text="Compare with Previous", command=compare).pack(fill="x")
+        tk.Button(side, text="Restore", command=restore).pack(fill="x", pady=(2, 0))
+        listbox.selection_set(0)
+        on_pick()
+
+    def show_debug_panel(self, event=None):
+        """Show p50/p95 timings of traced operations, with trace export and a cProfile toggle."""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Debug")
+        dialog.geometry("760x360")
+        columns = ("count", "p50", "p95", "max", "fs", "read", "written")
+        table = ttk.Treeview(dialog, columns=columns)
+        table.heading("#0", text="Operation")
+        for column, heading in zip(columns, ("Calls", "p50 ms", "p95 ms", "Max ms", "FS calls", "Bytes read", "Bytes written")):
+            table.heading(column, text=heading)
+            table.column(column, width=80, anchor="e")
+        table.pack(fill="both", expand=True, padx=5, pady=5)
+        buttons = tk.Frame(dialog)
+        buttons.pack(fill="x", padx=5, pady=5)
+        trace_var = tk.BooleanVar(value=tracer.enabled)
+
+        def refresh():
+            table.delete(*table.get_children())
+            for name, row in sorted(tracer.stats().items()):
+                table.insert("", tk.END, text=name, values=(
+                    row["count"], f"{row['p50_ms']:.1f}", f"{row['p95_ms']:.1f}", f"{row['max_ms']:.1f}",
+                    f"{row['fs_calls']:.0f}", f"{row['bytes_read']:.0f}", f"{row['bytes_written']:.0f}",
+                ))
+
+        def toggle_trace():
+            tracer.enable(trace_var.get())
+            self.settings["trace"] = trace_var.get()
+            self._save_settings()
+
+        def export():
+            path = filedialog.asksaveasfilename(parent=dialog, defaultextension=".json", filetypes=[("Chrome trace", "*.json")])
+            if path:
+                try:
+                    tracer.export_chrome(path)
+                except OSError:
+                    messagebox.showerror("Error", "Failed to export trace.", parent=dialog)
+
+        def toggle_profile():
+            if not tracer.profiling:
+                tracer.start_profile()
+                profile_button.config(text="Stop Profile")
+                return
+            profile_button.config(text="Start Profile")
+            path = filedialog.asksaveasfilename(parent=dialog, defaultextension=".prof", filetypes=[("cProfile stats", "*.prof")])
+            report = tracer.stop_profile(path or None)
+            view = tk.Toplevel(dialog)
+            view.title("Profile")
+            text = tk.Text(view, wrap="none", font=("Courier", 9))
+            text.pack(fill="both", expand=True)
+            text.insert("1.0", report)
+            text.config(state="disabled")
+
+        tk.Checkbutton(buttons, text="Record traces", variable=trace_var, command=toggle_trace).pack(side="left")
+        tk.Button(buttons, text="Refresh", command=refresh).pack(side="left", padx=5)
+        tk.Button(buttons, text="Clear", command=lambda: (tracer.clear(), refresh())).pack(side="left")
+        tk.Button(buttons, text="Export Trace...", command=export).pack(side="left", padx=5)
+        profile_button = tk.Button(buttons, text="Stop Profile" if tracer.profiling else "Start Profile", command=toggle_profile)
+        profile_button.pack(side="left")
+        refresh()
 
     def open_location(self):
         """Open the location of the selected item in file explorer."""
@@ -609,33 +1452,20 @@ class JournalApp:
         if not selected:
             return
         item_type = self.get_item_type(selected)
-        item = self.tree.item(selected)
         if item_type == "note":
-            file_path = item['values'][0]
+            file_path = self.tree.item(selected)['values'][0]
+            if self.store.packed(file_path):
+                file_path = packstore.pack_path(packstore.journal_of(file_path))
             dir_path = os.path.dirname(file_path)
             if os.name == 'nt':
                 subprocess.call(['explorer', '/select,', file_path])
             else:
                 subprocess.call(['xdg-open', dir_path])
-        elif item_type == "journal":
-            journal_text = item['text']
-            journal_name = journal_text.lower().replace(" ", "_")
-            trunk_id = self.tree.parent(selected)
-            trunk_text = self.tree.item(trunk_id)['text']
-            trunk_name = trunk_text.lower().replace(" ", "_")
-            dir_path = os.path.join(self.trunk_root, trunk_name, journal_name)
-            if os.name == 'nt':
-                os.startfile(dir_path)
-            else:
-                subprocess.call(['xdg-open', dir_path])
-        elif item_type == "trunk":
-            trunk_text = item['text']
-            trunk_name = trunk_text.lower().replace(" ", "_")
-            dir_path = os.path.join(self.trunk_root, trunk_name)
+        elif item_type in ("journal", "trunk"):
             if os.name == 'nt':
-                os.startfile(dir_path)
+                os.startfile(selected)
             else:
-                subprocess.call(['xdg-open', dir_path])
+                subprocess.call(['xdg-open', selected])
 
     def toggle_options(self):
         """Toggle visibility of options frame."""
@@ -645,6 +1475,15 @@ class JournalApp:
         else:
             self.options_frame.pack(side="right", before=self.options_toggle, padx=10)
             self.options_toggle.config(text="▲")
+            if self._latency_timer is None:
+                self._update_latency_label()
+
+    def _update_latency_label(self):
+        """Show the keystroke latency summary, refreshed every second while the options are open."""
+        self._latency_timer = None
+        if self.options_toggle.cget("text") == "▲":
+            self.latency_label.config(text=self.stall_monitor.summary())
+            self._latency_timer = self.root.after(1000, self._update_latency_label)
 
     def set_opacity(self, val):
         """Set window opacity."""
@@ -674,27 +1513,280 @@ class JournalApp:
             self.root.attributes('-alpha', self.saved_alpha)
         self.root.attributes("-fullscreen", self.fullscreen)
 
+    @traced
     def load_tree(self):
-        """Load and populate the treeview with trunks, journals, and notes."""
+        """Paint trunks and any already expanded nodes from the catalog."""
+        self._sync_children("", self._list_children(""))
+        for iid in sorted(self._loaded_nodes, key=len):
+            if iid in self._loaded_nodes and self.tree.exists(iid):
+                self._sync_children(iid, self._list_children(iid))
+
+    def _reset_tree(self):
+        """Drop every row and all lazy loading state, e.g. after the trunk root changes."""
+        for job in self._fill_jobs.values():
+            self.root.after_cancel(job)
+        self._fill_jobs.clear()
+        self._loaded_nodes.clear()
         self.tree.delete(*self.tree.get_children())
-        for trunk_name in sorted(os.listdir(self.trunk_root)):
-            trunk_path = os.path.join(self.trunk_root, trunk_name)
-            if os.path.isdir(trunk_path):
-                display_trunk = trunk_name.replace("_", " ").title()
-                trunk_id = self.tree.insert("", "end", text=display_trunk, open=False)
-                for journal_name in sorted(os.listdir(trunk_path)):
-                    journal_path = os.path.join(trunk_path, journal_name)
-                    if os.path.isdir(journal_path):
-                        display_journal = journal_name.replace("_", " ").title()
-                        journal_id = self.tree.insert(trunk_id, "end", text=display_journal, open=False)
-                        notes_dir = os.path.join(journal_path, ".notes")
-                        if os.path.exists(notes_dir):
-                            for file_name in sorted(f for f in os.listdir(notes_dir) if f.endswith(".txt")):
-                                file_base = file_name[:-4]
-                                display_text = self._format_display(file_base)
-                                file_path = os.path.join(notes_dir, file_name)
-                                self.tree.insert(journal_id, "end", text=display_text, values=(file_path,))
 
+    def _refresh_node(self, iid):
+        """Re-list the children of a node from disk if they have been loaded before."""
+        if not iid:
+            self._sync_children("", self._list_children("", rescan=True))
+        elif iid in self._loaded_nodes and self.tree.exists(iid):
+            self._sync_children(iid, self._list_children(iid, rescan=True))
+
+    def on_open(self, event):
+        """Load the children of a trunk or journal the first time it is expanded."""
+        iid = self.tree.focus()
+        if iid and iid not in self._loaded_nodes and self.get_item_type(iid) in ("trunk", "journal"):
+            self._sync_children(iid, self._list_children(iid))
+        if iid and self.get_item_type(iid) == "journal":
+            self._prefetch_journal(iid)
+
+    def _list_children(self, iid, rescan=False):
+        """List (iid, display text, type) rows for the children of a node, from the catalog when possible."""
+        rows = self.store.children(iid or self.store.trunk_root, rescan)
+        return [(path, self._display_text(name, child_type), child_type) for path, child_type, name in rows]
+
+    def _display_text(self, name, item_type):
+        """Return the tree text for a trunk or journal directory or archive name or a note file name."""
+        return display_name(name, item_type)
+
+    def _start_reconcile(self):
+        """Check the catalog against disk on a background thread."""
+        if self._reconcile_thread is not None:
+            self._reconcile_pending = True
+            return
+        self._reconcile_thread = threading.Thread(target=self._reconcile_worker, args=(self.store.trunk_root,), daemon=True)
+        self._reconcile_thread.start()
+
+    def _reconcile_worker(self, root):
+        """Reconcile the catalog for root and hand the changed nodes to the Tk thread."""
+        changed = []
+        try:
+            changed = self.store.reconcile(root)
+        finally:
+            self._post_to_ui(self._apply_reconcile, root, changed)
+
+    @traced
+    def _apply_reconcile(self, root, changed):
+        """Patch loaded tree nodes whose listing changed on disk."""
+        self._reconcile_thread = None
+        if root == self.store.trunk_root:
+            for node in changed:
+                iid = "" if node == root else node
+                if not iid or (iid in self._loaded_nodes and self.tree.exists(iid)):
+                    self._sync_children(iid, self._list_children(iid))
+        if self._reconcile_pending:
+            self._reconcile_pending = False
+            self._start_reconcile()
+
+    def _post_to_ui(self, callback, *args):
+        """Queue a callback from any thread to run on the Tk thread."""
+        self._ui_calls.put((callback, args))
+
+    def _drain_ui_calls(self):
+        """Check again shortly, then run callbacks queued by worker threads."""
+        self.root.after(50, self._drain_ui_calls)
+        self._run_ui_calls()
+
+    def _run_ui_calls(self):
+        """Run every callback queued by worker threads so far."""
+        while True:
+            try:
+                callback, args = self._ui_calls.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception:
+                # Reported as Tk reports errors in its own callbacks, without losing the rest of the queue
+                self.root.report_callback_exception(*sys.exc_info())
+
+    def _sync_children(self, parent, rows, chunked=True):
+        """Patch the children of a node to match rows, only deleting and inserting what changed."""
+        job = self._fill_jobs.pop(parent, None)
+        if job:
+            self.root.after_cancel(job)
+        wanted = {row[0] for row in rows}
+        existing = self.tree.get_children(parent)
+        stale = [iid for iid in existing if iid not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+            for iid in stale:
+                self._forget_loaded(iid)
+        present = set(existing).difference(stale)
+        if parent:
+            self._loaded_nodes.add(parent)
+        self._fill_children(parent, rows, 0, 0, present, chunked)
+        # Only new rows need totals, and their parent only if its notes changed
+        nodes = [iid for iid, _, item_type in rows if item_type != "note" and iid not in present]
+        if parent and (stale or len(present) < len(rows)):
+            nodes += [parent, os.path.dirname(parent)]
+        self._refresh_totals(nodes)
+
+    def _fill_children(self, parent, rows, start, index, present, chunked=True):
+        """Insert missing rows in chunks, yielding to the event loop between chunks."""
+        end = min(start + TREE_CHUNK_SIZE, len(rows)) if chunked else len(rows)
+        for iid, text, item_type in rows[start:end]:
+            if iid not in present:
+                self._insert_row(parent, index, iid, text, item_type)
+            index += 1
+        if end < len(rows):
+            self._fill_jobs[parent] = self.root.after_idle(self._fill_children, parent, rows, end, index, present)
+        else:
+            self._fill_jobs.pop(parent, None)
+
+    def _insert_row(self, parent, index, iid, text, item_type):
+        """Insert one row; trunks and journals get a placeholder child until they are expanded."""
+        if item_type == "note":
+            words = self.store.meta.get(iid).get("words")
+            self.tree.insert(parent, index, iid=iid, text=text, values=(iid, "" if words is None else format_total(words)))
+        else:
+            self.tree.insert(parent, index, iid=iid, text=text, open=False)
+            self.tree.insert(iid, "end", text="Loading...", tags=("placeholder",))
+
+    def _refresh_totals(self, nodes):
+        """Total the word counts of trunks and journals on the totals worker and show them in the tree.
+
+        Nodes asked for while the worker is busy are totalled together in its next run, so results
+        reach the tree in the order they were computed and never older over newer.
+        """
+        self._totals_pending.update(node for node in nodes if node and node != self.store.trunk_root)
+        if self._totals_thread is not None or not self._totals_pending:
+            return
+        nodes = list(self._totals_pending)
+        self._totals_pending.clear()
+        self._totals_thread = threading.Thread(target=self._totals_worker, args=(nodes,), daemon=True)
+        self._totals_thread.start()
+
+    def _totals_worker(self, nodes):
+        """Total nodes and hand the results to the Tk thread."""
+        results = []
+        try:
+            for node in nodes:
+                try:
+                    results.append((node, self.store.totals(node)))
+                except OSError:
+                    pass  # Gone since it was queued
+        finally:
+            self._post_to_ui(self._show_totals, results)
+
+    def _show_totals(self, results):
+        """Show (node, totals) results from _totals_worker; a + marks totals missing uncounted notes."""
+        self._totals_thread = None
+        self._refresh_totals(())
+        for node, (words, _, notes, counted) in results:
+            if self.tree.exists(node):
+                text = format_total(words) + ("+" if counted < notes else "") if notes else ""
+                self.tree.set(node, "stats", text)
+
+    def _stats_changed(self, stats):
+        """Refresh the word count once the event loop is idle, however many edits came in."""
+        if self._stats_job is None:
+            self._stats_job = self.root.after_idle(self._show_stats)
+
+    def _show_stats(self):
+        """Show the open note's counts in the header."""
+        self._stats_job = None
+        text = format_stats(self.doc_stats.words, self.doc_stats.chars)
+        if self.large_note is not None:
+            text += " (loaded part)"
+        self.stats_label.config(text=text)
+
+    def _save_stats(self):
+        """Keep the open note's counts in its metadata, where the tree totals are added up from."""
+        path = self.current_file
+        if not path or self.in_memory or self.large_note is not None or path == self._read_only_file:
+            return
+        if self.store.meta.set(path, words=self.doc_stats.words, chars=self.doc_stats.chars):
+            # Written once the note is closed, not on every autosave
+            self._stats_unflushed = True
+            if self.tree.exists(path):
+                self.tree.set(path, "stats", format_total(self.doc_stats.words))
+            journal = os.path.dirname(os.path.dirname(path))
+            self._refresh_totals([journal, os.path.dirname(journal)])
+
+    def _flush_stats(self):
+        """Schedule writing the counts of the note being closed, if they changed."""
+        if self._stats_unflushed:
+            self._stats_unflushed = False
+            self._schedule_meta_flush()
+
+    def _forget_loaded(self, iid):
+        """Forget lazy loading state for a removed node and everything below it."""
+        prefix = iid + os.sep
+        for loaded in [n for n in self._loaded_nodes if n == iid or n.startswith(prefix)]:
+            self._loaded_nodes.discard(loaded)
+            job = self._fill_jobs.pop(loaded, None)
+            if job:
+                self.root.after_cancel(job)
+
+    def schedule_search(self, event=None):
+        """Run the search shortly after the user stops typing."""
+        if self._search_timer:
+            self.root.after_cancel(self._search_timer)
+        self._search_timer = self.root.after(SEARCH_DELAY, self.run_search)
+
+    @traced
+    def run_search(self):
+        """Show notes matching the query in place of the tree, or the tree again when it is empty."""
+        self._search_timer = None
+        query = self.search_var.get().strip()
+        if not query:
+            self.search_results.pack_forget()
+            self.tree.pack(fill="both", expand=True, padx=10, pady=10, after=self.search_entry)
+            return
+        self._search_paths = self.store.search(query, limit=SEARCH_LIMIT)
+        self.search_results.delete(0, tk.END)
+        for path in self._search_paths:
+            journal = os.path.basename(os.path.dirname(os.path.dirname(path)))
+            self.search_results.insert(tk.END, f"{self._display_text(os.path.basename(path), 'note')} - {self._display_text(journal, 'journal')}")
+        if not self.search_results.winfo_ismapped():
+            self.tree.pack_forget()
+            self.search_results.pack(fill="both", expand=True, padx=10, pady=10, after=self.search_entry)
+
+    def clear_search(self, event=None):
+        """Empty the search box and go back to the tree."""
+        self.search_var.set("")
+        self.run_search()
+
+    def open_search_result(self, event):
+        """Open the selected search result in the editor."""
+        selection = self.search_results.curselection()
+        if not selection:
+            return
+        path = self._search_paths[selection[0]]
+        if not self.store.exists(path):
+            messagebox.showwarning("Warning", "Note no longer exists.")
+            return
+        self._reveal(path)
+
+    def _reveal(self, path):
+        """Load and expand the tree down to a trunk, journal or note, then select it."""
+        info = classify(self.store.trunk_root, path)
+        if info is None:
+            return
+        chain = [path]
+        while len(chain) < 3 and classify(self.store.trunk_root, info[1]):
+            chain.insert(0, info[1])
+            info = classify(self.store.trunk_root, info[1])
+        parent = ""
+        for child in chain:
+            self._sync_children(parent, self._list_children(parent), chunked=False)
+            if not self.tree.exists(child):
+                self._sync_children(parent, self._list_children(parent, rescan=True), chunked=False)
+            if not self.tree.exists(child):
+                return
+            parent = child
+        for node in chain[:-1]:
+            self.tree.item(node, open=True)
+        self.tree.see(path)
+        self.tree.focus(path)
+        self.tree.selection_set(path)
+
+    @traced
     def on_select(self, event):
         """Handle selection in treeview."""
         self.save_current()
@@ -702,84 +1794,471 @@ class JournalApp:
         if not selected:
             return
         item_type = self.get_item_type(selected)
+        if item_type is None:
+            return
         item = self.tree.item(selected)
         if item_type == "note":
+            if item['values'][0] == self.current_file and not self.in_memory:
+                return
             if self.in_memory:
                 if not messagebox.askyesno("Discard In-Memory?", "Discard the in-memory note?"):
                     self.tree.selection_remove(selected)
                     return
                 self.in_memory = False
+            self._compact_log(self.current_file)
+            self._flush_stats()
+            self._release_large_note()
             self.current_file = item['values'][0]
             self._load_meta()
             try:
-                with open(self.current_file, "r") as f:
-                    content = f.read()
-                self.text.delete("1.0", tk.END)
-                self.text.insert("1.0", content)
+                self._load_note(self.current_file)
+                # Counts notes saved before they were kept, as they are opened
+                self._save_stats()
             except IOError:
                 messagebox.showerror("Error", "Failed to load note.")
-            self.header_label.config(text=item['text'])
+            self.header_label.config(text=item['text'] + (" (Read-only)" if self._read_only_file else ""))
+            self._open_tab(self.current_file)
+            self._prefetch_siblings(selected)
         else:
             if self.in_memory:
                 if not messagebox.askyesno("Discard In-Memory?", "Discard the in-memory note?"):
                     self.tree.selection_remove(selected)
                     return
                 self.in_memory = False
-            self.current_file = None
-            self.font_family = "Arial"
-            self.font_size = 12
-            self.text.config(font=(self.font_family, self.font_size))
-            self.font_combo.set(self.font_family)
-            self.size_scale.set(self.font_size)
-            self.text.delete("1.0", tk.END)
-            self.header_label.config(text="Untitled")
+            self._close_note()
+            if item_type == "journal":
+                self._prefetch_journal(selected)
+            else:
+                self.prefetcher.cancel()
+
+    def _prefetch_siblings(self, iid):
+        """Read the notes after and just before a note ahead of time, nearest first."""
+        siblings = self.tree.get_children(self.tree.parent(iid))
+        index = siblings.index(iid)
+        after = siblings[index + 1:index + 1 + PREFETCH_AHEAD]
+        before = siblings[max(0, index - PREFETCH_BEHIND):index][::-1]
+        self.prefetcher.prefetch([path for path in after + before if self.get_item_type(path) == "note"])
+
+    def _prefetch_journal(self, journal):
+        """Read the first notes of a journal ahead of time."""
+        rows = self.store.children(journal)
+        self.prefetcher.prefetch([path for path, kind, _ in rows if kind == "note"][:PREFETCH_AHEAD])
+
+    def _close_note(self):
+        """Leave the open note for an empty, untitled editor."""
+        self._compact_log(self.current_file)
+        self._flush_stats()
+        self._release_large_note()
+        self.current_file = None
+        self._log_ops = None
+        self.font_family = "Arial"
+        self.font_size = 12
+        self._apply_font()
+        self.font_combo.set(self.font_family)
+        self.size_scale.set(self.font_size)
+        self._clear_editor()
+        self.text.edit_modified(False)
+        self._saved_digest = None
+        self.header_label.config(text="Untitled")
+        self._render_tabs()
+
+    # Tabs
+
+    def _open_tab(self, path):
+        """Show a tab for a note just opened, closing the least recently used tab beyond MAX_TABS."""
+        if path not in self._tabs:
+            self._tabs.append(path)
+        self._tab_clock += 1
+        self._tab_used[path] = self._tab_clock
+        while len(self._tabs) > MAX_TABS:
+            self._drop_tab(min((p for p in self._tabs if p != path), key=self._tab_used.get))
+        self._render_tabs()
+
+    def _drop_tab(self, path):
+        self._tabs.remove(path)
+        self._tab_used.pop(path, None)
+
+    def _render_tabs(self):
+        """Redraw the tab bar, dropping tabs of notes that are gone."""
+        for child in self.tab_bar.winfo_children():
+            child.destroy()
+        for path in [p for p in self._tabs if p != self.current_file and not self.store.exists(p)]:
+            self._drop_tab(path)
+        for path in self._tabs:
+            bg = self.select_bg if path == self.current_file else self.button_bg
+            tab = tk.Frame(self.tab_bar, bg=bg)
+            tab.pack(side="left", padx=(0, 1))
+            label = tk.Label(tab, text=display_name(os.path.basename(path), "note"), bg=bg, fg=self.fg_color, padx=8, pady=2)
+            label.pack(side="left")
+            label.bind("<Button-1>", lambda event, p=path: self._switch_tab(p))
+            close = tk.Label(tab, text="×", bg=bg, fg=self.fg_color, padx=4)
+            close.pack(side="left")
+            close.bind("<Button-1>", lambda event, p=path: self._close_tab(p))
+
+    def _switch_tab(self, path):
+        """Open the note of a tab."""
+        if path == self.current_file:
+            return
+        if not self.store.exists(path):
+            messagebox.showwarning("Warning", "Note no longer exists.")
+            self._render_tabs()
+            return
+        parent = self.tree.exists(path) and self.tree.parent(path)
+        while parent and self.tree.item(parent, "open"):
+            parent = self.tree.parent(parent)
+        if parent == "":
+            # Already showing in the tree; no need to re-list the nodes above it
+            self.tree.see(path)
+            self.tree.focus(path)
+            self.tree.selection_set(path)
+        else:
+            self._reveal(path)
+
+    def _close_tab(self, path):
+        """Close a tab, moving to the most recently used other tab if it was the open note."""
+        if path != self.current_file:
+            self._drop_tab(path)
+            self._render_tabs()
+            return
+        if self.in_memory:
+            return
+        self.save_current()
+        self._drop_tab(path)
+        if self._tabs:
+            self._switch_tab(max(self._tabs, key=self._tab_used.get))
+        else:
+            self.tree.selection_remove(*self.tree.selection())
+            self._close_note()
+
+    def _current_moved(self, path):
+        """Follow the open note to a new path with its undo history and tab."""
+        old = self.current_file
+        self.undo.rename(old, path)
+        self.current_file = path
+        if old in self._tabs:
+            self._tabs[self._tabs.index(old)] = path
+            self._tab_used[path] = self._tab_used.pop(old)
+            self._render_tabs()
+        else:
+            self._open_tab(path)
+
+    @traced
+    def _load_note(self, path):
+        """Load a note into the editor, a window at a time when it is too large to load whole."""
+        self.saver.flush(path)
+        digest = None
+        cached = self.buffers.entry(path)
+        if cached is not None and cached[0][0]:
+            # A note file unchanged since it was cached: the stamp just checked is the only stat
+            # (packed and archived notes have no inode), and it tells whether an edit log is left
+            version, content, digest = cached
+            self._read_only_file = None
+            self._log_ops = [] if self.edit_log_var.get() else None
+            if version[3] is not None:
+                self.saver.submit(path, functools.partial(editlog.compact, path))
+            self._show_note(path, content, digest)
+            return
+        self._read_only_file = path if self.store.archived(path) else None
+        if self.store.packed(path) or self._read_only_file:
+            # Packed and archived notes are read whole; packed ones are rewritten in place, without an edit log
+            content, digest = self._read_cached(path, self.store.read)
+            self._log_ops = None
+        elif os.path.getsize(path) >= LARGE_NOTE_BYTES and not os.path.exists(editlog.log_path(path)):
+            self.large_note = LargeNote(path)
+            content = self.large_note.load(0)
+            self._log_ops = None
+        else:
+            content, digest = self._read_cached(path, self._read_note)
+            self._log_ops = [] if self.edit_log_var.get() else None
+            if os.path.exists(editlog.log_path(path)):
+                # Left over from a crash or from before append-only saves were turned off
+                self.saver.submit(path, functools.partial(editlog.compact, path))
+        self._show_note(path, content, digest)
+
+    def _show_note(self, path, content, digest):
+        """Put a loaded note's text in the editor and pick up its undo history."""
+        self.undo.detach()
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", content)
+        self.text.edit_modified(False)
+        if self.large_note is not None:
+            # Positions in a large note's history are relative to the window it was made in
+            self.undo.forget(path)
+        self.undo.attach(path)
+        self._saved_digest = digest
+
+    def _read_cached(self, path, read):
+        """Return (text, digest) of a note from the buffer cache, or read it with read(path) and cache it."""
+        cached = self.buffers.get(path)
+        if cached is not None:
+            return cached
+        try:
+            version = stamp(path)
+        except OSError:
+            version = None
+        content = read(path)
+        digest = self._digest(content.strip())
+        if version is not None:
+            self.buffers.put(path, version, content, digest)
+        return content, digest
+
+    def _release_large_note(self):
+        """Close the open large note once its pending write-back has finished."""
+        note = self.large_note
+        if note is not None:
+            self.large_note = None
+            self.saver.submit(note.path, note.close)
+
+    def _on_text_scroll(self, first, last):
+        """Page another window of a large note in when the view nears either end of the loaded one."""
+        note = self.large_note
+        if note is None or self._paging:
+            return
+        if float(last) > 1 - LARGE_NOTE_PAGE_MARGIN and note.end < note.size:
+            direction = 1
+        elif float(first) < LARGE_NOTE_PAGE_MARGIN and note.start > 0:
+            direction = -1
+        else:
+            return
+        self._paging = True
+        self.root.after_idle(self._page_large_note, direction)
+
+    def _page_large_note(self, direction):
+        """Load the window of the large note centred on the top visible line."""
+        self._paging = False
+        note = self.large_note
+        if note is None:
+            return
+        top = note.first_line + int(self.text.index("@0,0").split(".")[0]) - 1
+        first = max(0, top - WINDOW_LINES // 2)
+        if (first > note.first_line) != (direction > 0):
+            return
+        self._show_large_window(first, top)
+
+    def _show_large_window(self, first, top):
+        """Write back the loaded window, then load the one starting at line first and scroll to line top."""
+        note = self.large_note
+        self.save_current()
+        self.saver.flush(note.path)
+        content = note.load(first)
+        self.undo.detach()
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", content)
+        self.text.edit_modified(False)
+        self.undo.forget(note.path)
+        self.undo.attach(note.path)
+        line = f"{max(1, top - note.first_line + 1)}.0"
+        self.text.yview(line)
+        self.text.mark_set("insert", line)
+
+    def large_note_home(self, event=None):
+        """Jump to the start of a large note rather than of its loaded window."""
+        if self.large_note is None:
+            return None
+        self._show_large_window(0, 0)
+        return "break"
+
+    def large_note_end(self, event=None):
+        """Jump to the end of a large note rather than of its loaded window."""
+        if self.large_note is None:
+            return None
+        last = self.large_note.line_count - 1
+        self._show_large_window(max(0, last - WINDOW_LINES + 1), last)
+        self.text.see(tk.END)
+        self.text.mark_set("insert", "end-1c")
+        return "break"
 
     def schedule_save(self, event=None):
         """Schedule autosave after inactivity."""
         if self.save_timer:
             self.root.after_cancel(self.save_timer)
-        self.save_timer = self.root.after(2000, self.save_current)
+        delay = LOG_SAVE_DELAY if self._log_ops is not None else SAVE_DELAY
+        self.save_timer = self.root.after(delay, self.save_current)
 
+    @traced
     def save_current(self):
-        """Save the current note content."""
-        if self.in_memory:
+        """Queue the current note for writing if its text changed since the last save."""
+        if self.in_memory or not self.text.edit_modified():
             return
-        content = self.text.get("1.0", tk.END).strip()
-        if not content:
+        if self.current_file is not None and self.current_file == self._read_only_file:
+            self.text.edit_modified(False)
+            return
+        if self.large_note is not None:
+            # Only the loaded window of a large note is written back
+            self.text.edit_modified(False)
+            self.saver.submit(self.large_note.path, functools.partial(self.large_note.write_window, self.text.get("1.0", "end-1c")))
+            return
+        if self.current_file and self._log_ops is not None:
+            # Append-only mode: only the edited ranges are written
+            self.text.edit_modified(False)
+            if self._log_ops:
+                ops = editlog.to_ops(self._log_ops)
+                self._log_ops = []
+                self.saver.submit(self.current_file, functools.partial(editlog.append, self.current_file, ops))
+                self._save_stats()
+            return
+        log = self.edit_log_var.get() and not self.store.packed(self.current_file or self.store.unsaved_journal)
+        if log:
+            # The log records positions in the text as shown, so the note is written unstripped
+            content = self.text.get("1.0", "end-1c")
+            if not content.strip():
+                return
+        else:
+            content = self.text.get("1.0", tk.END).strip()
+            if not content:
+                return
+        self.text.edit_modified(False)
+        digest = self._digest(content)
+        if self.current_file and digest == self._saved_digest and not log:
             return
         if not self.current_file:
             # Save to unsaved notes
-            now = datetime.now().strftime("%Y-%m-%d_%H%M%S")
-            note_base = f"note_{now}"
-            filename = f"{note_base}.txt"
-            self.current_file = os.path.join(self.unsaved_notes_dir, filename)
-            display_name = self._format_display(note_base)
-            for trunk_iid in self.tree.get_children():
-                if self.tree.item(trunk_iid)['text'] == "Unsaved":
-                    for journal_iid in self.tree.get_children(trunk_iid):
-                        if self.tree.item(journal_iid)['text'] == "Notes":
-                            self.tree.insert(journal_iid, "end", text=display_name, values=(self.current_file,))
-                            break
-                    break
+            self._current_moved(self.store.unsaved_note_path())
+            display_name = self._format_display(os.path.basename(self.current_file)[:-4])
             self.header_label.config(text=display_name)
+        self._saved_digest = digest
+        if log:
+            self.saver.submit(self.current_file, self._write_job(self.current_file, content))
+            self._log_ops = []
+        elif self.store.packed(self.current_file):
+            self.saver.submit(self.current_file, self._write_job(self.current_file, content))
+        else:
+            self.saver.save(self.current_file, content)
+        self._save_stats()
+
+    def _write_job(self, path, content):
+        """Return a saver job writing a whole note, into its pack or as a file that starts a fresh edit log."""
+        if self.store.packed(path):
+            return functools.partial(packstore.write_text, path, content)
+        return functools.partial(editlog.write_full, path, content)
+
+    def _record_change(self, change):
+        """Collect edits to the open note for the next append to its log."""
+        if self._log_ops is None:
+            return
+        if change.op == "reset":
+            self._log_ops = None
+        else:
+            self._log_ops.append(change)
+
+    def _read_note(self, path):
+        """Read a note, replaying its edit log, and set the log aside if it no longer fits the note."""
         try:
-            with open(self.current_file, "w") as f:
-                f.write(content)
-        except IOError:
-            messagebox.showerror("Error", "Failed to save note.")
+            return editlog.replay(path)
+        except editlog.LogError:
+            stale = editlog.set_aside(path)
+            messagebox.showwarning("Warning", f"Recent edits to this note could not be applied because it was changed elsewhere. They were kept in {stale}.")
+            return editlog.read_note(path)
+
+    def _compact_log(self, path):
+        """Fold a note's edit log into its file on the writer thread."""
+        if path and self._log_ops is not None:
+            self.saver.submit(path, functools.partial(editlog.compact, path))
+
+    def toggle_markdown(self):
+        """Turn Markdown highlighting on or off, and remember the choice."""
+        self.settings["markdown"] = self.markdown_var.get()
+        self._save_settings()
+        self.highlighter.set_enabled(self.markdown_var.get())
+
+    def change_cache_size(self, event=None):
+        """Set the memory budget of the note text cache, and remember it."""
+        try:
+            mb = max(0, self.cache_mb_var.get())
+        except tk.TclError:
+            return
+        self.settings["buffer_cache_mb"] = mb
+        self._save_settings()
+        self.buffers.set_budget(mb * 1024 * 1024)
+
+    def toggle_undo_to_disk(self):
+        """Choose whether undo history pushed out of memory is written to disk, and remember the choice."""
+        self.settings["undo_to_disk"] = self.undo_to_disk_var.get()
+        self._save_settings()
+        self.undo.spill_dir = UNDO_DIR if self.undo_to_disk_var.get() else None
+
+    def toggle_edit_log(self):
+        """Switch between rewriting notes and appending edits to a log, and remember the choice."""
+        self.settings["edit_log"] = self.edit_log_var.get()
+        self._save_settings()
+        if self.edit_log_var.get():
+            # Start from a full write so the log's positions match the file
+            self._log_ops = None
+            if self.current_file:
+                self.text.edit_modified(True)
+                self.save_current()
+        else:
+            # Append what was recorded so far, then fold the log into the note
+            self.save_current()
+            self._compact_log(self.current_file)
+            self._log_ops = None
+
+    def _digest(self, content):
+        """Return a digest of note text for telling whether it changed."""
+        return hashlib.blake2b(content.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def _note_written(self, path, content):
+        """Cache the text a background write left on disk, then finish the save on the Tk thread. Runs on the writer thread."""
+        self._own_writes[path] = time.monotonic()
+        if content is not None:
+            try:
+                self.buffers.put(path, stamp(path), content, self._digest(content.strip()))
+            except OSError:
+                self.buffers.discard(path)
+        self._post_to_ui(self._note_saved, path, content)
+
+    def _note_saved(self, path, content):
+        """Record a finished background write in the catalog, search index and tree."""
+        if not self.store.saved(path, content):
+            return
+        if not self.tree.exists(path):
+            self._refresh_node(os.path.dirname(os.path.dirname(path)))
+
+    def _settle_notes(self, paths):
+        """Fold any edit logs into notes and finish queued writes, so the history snapshots what is on disk."""
+        for path in paths:
+            if os.path.exists(editlog.log_path(path)):
+                self.saver.submit(path, functools.partial(editlog.compact, path))
+        self.saver.flush()
+
+    def _note_save_failed(self, path, error):
+        """Report a failed background write and keep the note dirty so the next autosave retries."""
+        if path == self.current_file:
+            self._saved_digest = None
+            self.text.edit_modified(True)
+        messagebox.showerror("Error", f"Failed to save note.\n{error}")
+
+    def on_close(self):
+        """Finish pending writes, reporting any failure, before the window closes."""
+        if self.save_timer:
+            self.root.after_cancel(self.save_timer)
+        self.save_current()
+        self._compact_log(self.current_file)
+        self.saver.flush()
+        self._flush_meta()
+        self._run_ui_calls()
+        if self.text.edit_modified() and not self.in_memory and self.text.get("1.0", tk.END).strip():
+            if not messagebox.askyesno("Unsaved Changes", "The current note could not be saved. Close anyway?"):
+                return
+        self.undo.close()
+        self.prefetcher.close()
+        self.stall_monitor.stop()
+        if self.backup_scheduler is not None:
+            self.backup_scheduler.stop()
+        self.saver.close()
+        self.store.close()
+        self.watcher.stop()
+        self.root.destroy()
 
     def new_trunk(self):
         """Create a new trunk."""
         name = simpledialog.askstring("New Trunk", "Enter trunk name:")
         if name:
-            base = name.strip().lower().replace(" ", "_")
-            path = os.path.join(self.trunk_root, base)
-            if os.path.exists(path):
-                messagebox.showwarning("Warning", "Trunk already exists.")
-                return
             try:
-                os.mkdir(path)
-                self.load_tree()
+                self.store.create_trunk(name)
+                self._refresh_node("")
+            except FileExistsError:
+                messagebox.showwarning("Warning", "Trunk already exists.")
             except OSError:
                 messagebox.showerror("Error", "Failed to create trunk.")
 
@@ -799,20 +2278,13 @@ class JournalApp:
             trunk_id = selected
         else:
             return
-        trunk_item = self.tree.item(trunk_id)
-        trunk_name = trunk_item['text'].lower().replace(" ", "_")
         name = simpledialog.askstring("New Journal", "Enter journal name:")
         if name:
-            base = name.strip().lower().replace(" ", "_")
-            path = os.path.join(self.trunk_root, trunk_name, base)
-            if os.path.exists(path):
-                messagebox.showwarning("Warning", "Journal already exists.")
-                return
             try:
-                os.mkdir(path)
-                notes_path = os.path.join(path, ".notes")
-                os.mkdir(notes_path)
-                self.load_tree()
+                self.store.create_journal(trunk_id, name)
+                self._refresh_node(trunk_id)
+            except FileExistsError:
+                messagebox.showwarning("Warning", "Journal already exists.")
             except OSError:
                 messagebox.showerror("Error", "Failed to create journal.")
 
@@ -827,25 +2299,12 @@ class JournalApp:
             messagebox.showwarning("Warning", "Select a journal.")
             return
         journal_id = selected
-        journal_item = self.tree.item(journal_id)
-        journal_name = journal_item['text'].lower().replace(" ", "_")
-        trunk_id = self.tree.parent(journal_id)
-        trunk_item = self.tree.item(trunk_id)
-        trunk_name = trunk_item['text'].lower().replace(" ", "_")
         name = simpledialog.askstring("New Note", "Enter note name:")
         if name:
-            dir_path = os.path.join(self.trunk_root, trunk_name, journal_name, ".notes")
-            base = name.strip().lower().replace(" ", "_")
-            filename = base + ".txt"
-            counter = 2
-            while os.path.exists(os.path.join(dir_path, filename)):
-                filename = f"{base}_{counter}.txt"
-                counter += 1
-            file_path = os.path.join(dir_path, filename)
             try:
-                open(file_path, "w").close()
-                self.load_tree()
-            except IOError:
+                self.store.create_note(journal_id, name)
+                self._refresh_node(journal_id)
+            except OSError:
                 messagebox.showerror("Error", "Failed to create note.")
 
     def rename_note(self, event=None):
@@ -856,91 +2315,83 @@ class JournalApp:
         new_display = simpledialog.askstring("Rename Note", "Enter new note name:", initialvalue=current_display)
         if not new_display or new_display == current_display:
             return
-        dir_path = os.path.dirname(self.current_file)
-        base = new_display.strip().lower().replace(" ", "_")
-        filename = base + ".txt"
-        counter = 2
-        display_final = new_display
-        while os.path.exists(os.path.join(dir_path, filename)):
-            filename = f"{base}_{counter}.txt"
-            display_final = f"{new_display} ({counter})"
-            counter += 1
-        old_meta = self.current_file + ".meta"
-        content = self.text.get("1.0", tk.END).strip()
+        new_file, counter = self.store.unique_note_path(packstore.journal_of(self.current_file), slug(new_display))
+        display_final = new_display if counter is None else f"{new_display} ({counter})"
+        # The file is renamed as it is on disk, edit log and all, once pending edits are written
+        old_file = self.current_file
+        self.save_current()
+        self.saver.flush(old_file)
+        if self.large_note is not None:
+            self.large_note.close()
         try:
-            os.remove(self.current_file)
-            new_file = os.path.join(dir_path, filename)
-            with open(new_file, "w") as f:
-                f.write(content)
-            if os.path.exists(old_meta):
-                shutil.move(old_meta, new_file + ".meta")
-            self.current_file = new_file
-            selected = self.tree.focus()
-            self.tree.item(selected, text=display_final, values=(new_file,))
-            self.header_label.config(text=display_final)
-        except (IOError, shutil.Error):
+            self.store.rename_note(old_file, new_file)
+        except OSError:
+            if self.large_note is not None:
+                self.large_note.reopen()
             messagebox.showerror("Error", "Failed to rename note.")
-
+            return
+        if self.large_note is not None:
+            self.large_note.reopen(new_file)
+        self._schedule_meta_flush()
+        self._current_moved(new_file)
+        self._refresh_node(os.path.dirname(os.path.dirname(new_file)))
+        if self.tree.exists(new_file):
+            self.tree.focus(new_file)
+            self.tree.selection_set(new_file)
+        self.header_label.config(text=display_final)
+
+    @traced
     def delete_item(self):
         """Delete the selected item (trunk, journal, or note)."""
         selected = self.tree.focus()
         if not selected:
             return
+        if len(self.tree.selection()) > 1:
+            self._delete_batch([iid for iid in self.tree.selection() if self.get_item_type(iid)])
+            return
         item_type = self.get_item_type(selected)
-        item = self.tree.item(selected)
         if item_type == "note":
-            file_path = item['values'][0]
+            path = self.tree.item(selected)['values'][0]
             if not messagebox.askyesno("Delete Note", "Are you sure you want to delete this note?"):
                 return
-            try:
-                os.remove(file_path)
-                meta = file_path + ".meta"
-                if os.path.exists(meta):
-                    os.remove(meta)
-                if self.current_file == file_path:
-                    self.text.delete("1.0", tk.END)
-                    self.current_file = None
-                    self.header_label.config(text="Untitled")
-            except OSError:
-                messagebox.showerror("Error", "Failed to delete note.")
-            self.load_tree()
+            notes = [path]
         elif item_type == "journal":
-            journal_text = item['text']
-            journal_name = journal_text.lower().replace(" ", "_")
-            trunk_id = self.tree.parent(selected)
-            trunk_text = self.tree.item(trunk_id)['text']
-            trunk_name = trunk_text.lower().replace(" ", "_")
-            if trunk_name == "unsaved" and journal_name == "notes":
+            if selected == self.store.unsaved_journal:
                 messagebox.showwarning("Warning", "Cannot delete 'Unsaved Notes' journal.")
                 return
-            path = os.path.join(self.trunk_root, trunk_name, journal_name)
+            path = selected
             if not messagebox.askyesno("Delete Journal", "Are you sure you want to delete this journal and all its notes?"):
                 return
-            try:
-                shutil.rmtree(path)
-                self.text.delete("1.0", tk.END)
-                self.current_file = None
-                self.header_label.config(text="Untitled")
-            except shutil.Error:
-                messagebox.showerror("Error", "Failed to delete journal.")
-            self.load_tree()
+            notes = [note for note, _, _ in self.store.catalog.notes(path)]
         elif item_type == "trunk":
-            trunk_text = item['text']
-            trunk_name = trunk_text.lower().replace(" ", "_")
-            if trunk_name == "unsaved":
+            if selected == self.store.unsaved_trunk:
                 messagebox.showwarning("Warning", "Cannot delete 'Unsaved' trunk.")
                 return
-            path = os.path.join(self.trunk_root, trunk_name)
+            path = selected
             if not messagebox.askyesno("Delete Trunk", "Are you sure you want to delete this trunk and all its journals and notes?"):
                 return
-            try:
-                shutil.rmtree(path)
-                self.text.delete("1.0", tk.END)
-                self.current_file = None
-                self.header_label.config(text="Untitled")
-            except shutil.Error:
-                messagebox.showerror("Error", "Failed to delete trunk.")
-            self.load_tree()
+            notes = [note for note, _, _ in self.store.catalog.notes(path)]
+        else:
+            return
+        # Saved first: once a large note is released its loaded window would be written as the whole note
+        self.save_current()
+        if self._under_any(self.current_file, [path]):
+            self._release_large_note()
+        self._settle_notes(notes)
+        # Snapshotting the notes into the history can take a while for a big journal or trunk
+        task = BackgroundTask(lambda task: self.store.delete(path), 0)
+        ProgressDialog(self.root, task, "Deleting", functools.partial(self._finish_delete, path, item_type, self.tree.parent(selected)))
+
+    def _finish_delete(self, path, item_type, parent, task):
+        """Close the open note if it went with the deleted item and re-list the item's parent."""
+        if task.error is None and self._under_any(self.current_file, [path]):
+            self._clear_editor()
+            self.current_file = None
+            self.header_label.config(text="Untitled")
+        self._schedule_meta_flush()
+        self._refresh_node(parent)
+        if task.error is not None:
+            messagebox.showerror("Error", f"Failed to delete {item_type}.")
 
 
 if __name__ == "__main__":
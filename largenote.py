@@ -0,0 +1,202 @@
+import json
+import mmap
+import os
+from array import array
+from bisect import bisect_left
+
+# Notes at least this large open in large-note mode
+LARGE_NOTE_BYTES = 16 * 1024 * 1024
+
+# Newlines are counted per block so a line can be found without scanning the whole file
+BLOCK_SIZE = 64 * 1024
+
+# Lines loaded into the editor at a time, and a cap on the bytes they may cover
+WINDOW_LINES = 5000
+MAX_WINDOW_BYTES = 4 * 1024 * 1024
+
+# Edits followed by at most this much of the file are written in place; others rewrite the file
+INPLACE_TAIL_BYTES = 8 * 1024 * 1024
+
+COPY_CHUNK = 1024 * 1024
+
+
+def recovery_path(path):
+    """Return the path of the undo record kept while a window is written in place."""
+    return path + ".recover"
+
+
+def recover(path):
+    """Undo a write-back that was interrupted by a crash, if one was. Returns True if the note was restored."""
+    record = recovery_path(path)
+    try:
+        f = open(record, "rb")
+    except FileNotFoundError:
+        return False
+    with f:
+        header = json.loads(f.readline() or b"{}")
+        data = f.read()
+    restored = False
+    if header.get("length") == len(data):
+        # The record is complete, so the note may have been partly overwritten
+        with open(path, "r+b") as f:
+            f.seek(header["offset"])
+            f.write(data)
+            f.truncate(header["size"])
+            f.flush()
+            os.fsync(f.fileno())
+        restored = True
+    os.remove(record)
+    return restored
+
+
+class LargeNote:
+    """A memory-mapped note edited one window of lines at a time.
+
+    start and end are the byte range of the loaded window and first_line its first line, counted
+    from 0. load() runs on the Tk thread and write_window() on the saver's writer thread; callers
+    flush the saver before loading another window.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.start = self.end = 0
+        self.first_line = 0
+        self._file = None
+        self._map = None
+        self._open()
+
+    def _open(self, unchanged_blocks=0):
+        """Map the file and count its newlines, reusing the counts of blocks known not to have changed."""
+        if not unchanged_blocks:
+            recover(self.path)
+        self._file = open(self.path, "rb")
+        self.size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+        if not unchanged_blocks:
+            first_newline = self._map.find(b"\n", 0, BLOCK_SIZE)
+            self.crlf = first_newline > 0 and self._map[first_newline - 1:first_newline] == b"\r"
+            self._counts = array("Q", [0])
+        self._count_from(unchanged_blocks)
+
+    def close(self):
+        """Unmap and close the file."""
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def reopen(self, path=None):
+        """Map the file again, e.g. after it was moved to path. The loaded window stays where it was."""
+        self.close()
+        if path is not None:
+            self.path = path
+        self._open()
+
+    def _count_from(self, block):
+        """Recount newlines from a block to the end; _counts[i] is the number of newlines before block i."""
+        del self._counts[block + 1:]
+        total = self._counts[block]
+        for offset in range(block * BLOCK_SIZE, self.size, BLOCK_SIZE):
+            total += self._map[offset:offset + BLOCK_SIZE].count(b"\n")
+            self._counts.append(total)
+
+    @property
+    def line_count(self):
+        """Return the number of lines, counting the text after the last newline as a line."""
+        return self._counts[-1] + 1
+
+    def line_offset(self, line):
+        """Return the byte offset at which a line starts, or the file size past the last line."""
+        if line <= 0:
+            return 0
+        if line >= self.line_count:
+            return self.size
+        # The line starts after the newline numbered line, which falls in the first block whose count reaches it
+        block = bisect_left(self._counts, line) - 1
+        pos = block * BLOCK_SIZE
+        for _ in range(line - self._counts[block]):
+            pos = self._map.find(b"\n", pos) + 1
+        return pos
+
+    def load(self, first_line):
+        """Make the window start at first_line and return its text."""
+        first_line = max(0, min(first_line, self.line_count - 1))
+        start = self.line_offset(first_line)
+        end = self.line_offset(first_line + WINDOW_LINES)
+        if end - start > MAX_WINDOW_BYTES:
+            cut = self._map.find(b"\n", start + MAX_WINDOW_BYTES // 2, start + MAX_WINDOW_BYTES)
+            if cut < 0:
+                cut = self._map.find(b"\n", start)
+            end = self.size if cut < 0 else cut + 1
+        self.first_line, self.start, self.end = first_line, start, end
+        return self._decode(self._map[start:end])
+
+    def _decode(self, data):
+        text = data.decode("utf-8", "surrogateescape")
+        return text.replace("\r\n", "\n") if self.crlf else text
+
+    def _encode(self, text):
+        if self.crlf:
+            text = text.replace("\n", "\r\n")
+        return text.encode("utf-8", "surrogateescape")
+
+    def write_window(self, text):
+        """Write the edited window back, leaving the bytes before it untouched.
+
+        Short tails are shifted in place under an undo record; long ones are written to a new file
+        that replaces the note.
+        """
+        data = self._encode(text)
+        start, end = self.start, self.end
+        if self._map[start:end] == data:
+            return None
+        if len(data) == end - start or self.size - end <= INPLACE_TAIL_BYTES:
+            self._write_in_place(start, end, data)
+        else:
+            self._rewrite(start, end, data)
+        self.end = start + len(data)
+        self.close()
+        self._open(start // BLOCK_SIZE)
+        return None
+
+    def _write_in_place(self, start, end, data):
+        old = self._map[start:] if len(data) != end - start else self._map[start:end]
+        size = self.size
+        with open(recovery_path(self.path), "wb") as f:
+            f.write(json.dumps({"offset": start, "size": size, "length": len(old)}).encode() + b"\n")
+            f.write(old)
+            f.flush()
+            os.fsync(f.fileno())
+        self.close()
+        with open(self.path, "r+b") as f:
+            f.seek(start)
+            f.write(data)
+            if len(data) != end - start:
+                f.write(old[end - start:])
+                f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+        os.remove(recovery_path(self.path))
+
+    def _rewrite(self, start, end, data):
+        tmp_path = os.path.join(os.path.dirname(self.path), f".{os.path.basename(self.path)}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                for offset in range(0, start, COPY_CHUNK):
+                    f.write(self._map[offset:min(offset + COPY_CHUNK, start)])
+                f.write(data)
+                for offset in range(end, self.size, COPY_CHUNK):
+                    f.write(self._map[offset:offset + COPY_CHUNK])
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, os.stat(self.path).st_mode & 0o7777)
+            self.close()
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
@@ -0,0 +1,228 @@
+import json
+import os
+import threading
+
+import archive
+import packstore
+from saver import write_atomic
+
+# Every note's metadata lives in this file in its journal's .notes directory, or beside the pack
+# of a packed journal
+META_FILE = ".meta.json"
+
+# Suffix of the per-note sidecar files the journal file replaces
+LEGACY_SUFFIX = ".meta"
+
+
+def meta_path(notes_dir):
+    """Return the path of the metadata file of a journal's .notes directory."""
+    if packstore.is_packed(os.path.dirname(notes_dir)):
+        return notes_dir + META_FILE
+    return os.path.join(notes_dir, META_FILE)
+
+
+def _is_note(path):
+    return path.endswith(".txt") and os.path.basename(os.path.dirname(path)) == ".notes"
+
+
+def _below(path, root):
+    return path == root or path.startswith(root + os.sep)
+
+
+def _counts(entry):
+    """Return what a note's metadata adds to its journal's totals: (words, chars, counted)."""
+    if entry is None or "words" not in entry:
+        return 0, 0, 0
+    return entry["words"], entry.get("chars", 0), 1
+
+
+class MetaStore:
+    """Metadata of every note, kept in one JSON file per journal and cached in memory.
+
+    A journal's file is read the first time one of its notes is looked up, folding in any old
+    per-note .meta sidecars. Changes stay in memory until flush(), which callers debounce.
+    Safe to call from any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Held while files are written, so two flushes never write a journal's file out of order
+        self._flush_lock = threading.Lock()
+        # Cached metadata per .notes directory: {note file name: {key: value}}
+        self._journals = {}
+        self._dirty = set()
+        # [words, chars, notes counted] per cached .notes directory, kept in step with every change
+        self._totals = {}
+        # Sidecars folded into a journal, deleted once its file has been written
+        self._legacy = {}
+
+    def _journal(self, notes_dir):
+        data = self._journals.get(notes_dir)
+        if data is not None:
+            return data
+        archived = False
+        try:
+            with open(meta_path(notes_dir), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = self._archived(notes_dir)
+            archived = data is not None
+        except (OSError, ValueError):
+            data = None
+        if not isinstance(data, dict):
+            data = {}
+        legacy = []
+        notes = None
+        journal = os.path.dirname(notes_dir)
+        try:
+            if packstore.is_packed(journal):
+                notes = packstore.get_pack(journal).names()
+            else:
+                notes = set()
+                with os.scandir(notes_dir) as it:
+                    for entry in it:
+                        if entry.name.endswith(".txt"):
+                            notes.add(entry.name)
+                        elif entry.name.endswith(".txt" + LEGACY_SUFFIX):
+                            legacy.append(entry.path)
+        except OSError:
+            notes = None
+        if notes is not None and not archived:
+            # Drop entries of notes deleted while the app was not watching, once, as the file is loaded
+            dead = [name for name in data if name not in notes]
+            for name in dead:
+                del data[name]
+            if dead:
+                self._dirty.add(notes_dir)
+        for sidecar in legacy:
+            try:
+                with open(sidecar, "r", encoding="utf-8") as f:
+                    values = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if isinstance(values, dict):
+                # A sidecar can only be newer than the journal file if an old version wrote it
+                name = os.path.basename(sidecar)[:-len(LEGACY_SUFFIX)]
+                data[name] = {**data.get(name, {}), **values}
+        if legacy:
+            self._legacy[notes_dir] = legacy
+            self._dirty.add(notes_dir)
+        self._journals[notes_dir] = data
+        self._totals[notes_dir] = [sum(column) for column in zip((0, 0, 0), *map(_counts, data.values()))]
+        return data
+
+    def _add_counts(self, notes_dir, entry, sign):
+        totals = self._totals[notes_dir]
+        for i, value in enumerate(_counts(entry)):
+            totals[i] += sign * value
+
+    def _archived(self, notes_dir):
+        """Read the metadata of an archived journal from its archive, or return None."""
+        held = archive.holder(os.path.dirname(notes_dir))
+        if held is None:
+            return None
+        try:
+            return json.loads(archive.get_archive(held).read_file(os.path.join(notes_dir, META_FILE)))
+        except (OSError, ValueError):
+            return None
+
+    def get(self, path):
+        """Return a copy of the metadata of a note, empty if it has none."""
+        with self._lock:
+            return dict(self._journal(os.path.dirname(path)).get(os.path.basename(path), {}))
+
+    def totals(self, notes_dir):
+        """Return (words, chars, notes counted) summed over the notes of a journal that have counts."""
+        with self._lock:
+            self._journal(notes_dir)
+            return tuple(self._totals[notes_dir])
+
+    def set(self, path, **values):
+        """Update metadata of a note. Returns True if anything changed."""
+        with self._lock:
+            notes_dir = os.path.dirname(path)
+            entry = self._journal(notes_dir).setdefault(os.path.basename(path), {})
+            if all(key in entry and entry[key] == value for key, value in values.items()):
+                return False
+            self._add_counts(notes_dir, entry, -1)
+            entry.update(values)
+            self._add_counts(notes_dir, entry, 1)
+            self._dirty.add(notes_dir)
+            return True
+
+    def rename(self, old, new):
+        """Carry the metadata of a note, or of every note below a directory, over to a new path."""
+        with self._lock:
+            if _is_note(old):
+                entry = self._journal(os.path.dirname(old)).pop(os.path.basename(old), None)
+                self._add_counts(os.path.dirname(old), entry, -1)
+                self._dirty.add(os.path.dirname(old))
+                if entry is not None:
+                    self._journal(os.path.dirname(new))[os.path.basename(new)] = entry
+                    self._add_counts(os.path.dirname(new), entry, 1)
+                    self._dirty.add(os.path.dirname(new))
+                return
+            # The journal files moved with the directory; only the cache needs rekeying
+            for notes_dir in [d for d in self._journals if _below(d, old)]:
+                moved = new + notes_dir[len(old):]
+                self._journals[moved] = self._journals.pop(notes_dir)
+                self._totals[moved] = self._totals.pop(notes_dir)
+                if notes_dir in self._dirty:
+                    self._dirty.discard(notes_dir)
+                    self._dirty.add(moved)
+                if notes_dir in self._legacy:
+                    self._legacy[moved] = [new + p[len(old):] for p in self._legacy.pop(notes_dir)]
+
+    def remove(self, path):
+        """Forget the metadata of a note, or of every note below a deleted directory."""
+        with self._lock:
+            if _is_note(path):
+                notes_dir = os.path.dirname(path)
+                entry = self._journal(notes_dir).pop(os.path.basename(path), None)
+                if entry is not None:
+                    self._add_counts(notes_dir, entry, -1)
+                    self._dirty.add(notes_dir)
+                return
+            for notes_dir in [d for d in self._journals if _below(d, path)]:
+                del self._journals[notes_dir]
+                del self._totals[notes_dir]
+                self._dirty.discard(notes_dir)
+                self._legacy.pop(notes_dir, None)
+
+    def flush(self):
+        """Write the file of every journal with unsaved changes.
+
+        The files are written outside the lock, so lookups from other threads do not wait on the disk.
+        """
+        with self._flush_lock:
+            pending = []
+            with self._lock:
+                for notes_dir in list(self._dirty):
+                    self._dirty.discard(notes_dir)
+                    if not os.path.isdir(notes_dir) and not packstore.is_packed(os.path.dirname(notes_dir)):
+                        # Deleted or moved behind our back; nothing left to write to
+                        self._journals.pop(notes_dir, None)
+                        self._totals.pop(notes_dir, None)
+                        self._legacy.pop(notes_dir, None)
+                        continue
+                    data = self._journals[notes_dir]
+                    content = json.dumps(data, sort_keys=True) if data else None
+                    pending.append((notes_dir, content, self._legacy.pop(notes_dir, [])))
+            for notes_dir, content, legacy in pending:
+                try:
+                    if content is not None:
+                        write_atomic(meta_path(notes_dir), content)
+                    elif os.path.exists(meta_path(notes_dir)):
+                        os.remove(meta_path(notes_dir))
+                except OSError:
+                    # Retried on the next flush
+                    with self._lock:
+                        self._dirty.add(notes_dir)
+                        if legacy:
+                            self._legacy.setdefault(notes_dir, []).extend(legacy)
+                    continue
+                for sidecar in legacy:
+                    try:
+                        os.remove(sidecar)
+                    except OSError:
+                        pass
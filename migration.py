@@ -0,0 +1,213 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import shutil
+
+# Files copied at once when the destination is on another device
+COPY_WORKERS = 4
+COPY_CHUNK = 1024 * 1024
+
+# Suffix of a file still being copied; renamed into place once verified
+PARTIAL_SUFFIX = ".migrating"
+
+
+def file_hash(path):
+    """Return the SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def pending(journal_path):
+    """Return (src_root, dst_root) of an interrupted migration recorded at journal_path, or None."""
+    try:
+        with open(journal_path, "r", encoding="utf-8") as f:
+            header = json.loads(f.readline())
+        return header["src"], header["dst"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+class Migration:
+    """Move the trunks under src_root to dst_root, resumably.
+
+    Within one device each trunk is simply renamed. Across devices every file in the manifest is
+    copied on a thread pool, read back and checked against the source's SHA-256 before it is
+    renamed into place, and recorded in a JSON-lines journal. Sources are only removed once every
+    file has been verified. Running again after an interruption skips files already verified
+    whose size and mtime are unchanged.
+    """
+
+    def __init__(self, src_root, dst_root, journal_path):
+        self.src_root = src_root
+        self.dst_root = dst_root
+        self.journal_path = journal_path
+        self.items = []
+        self.skipped = []
+        self.failed = []
+
+    def run(self, task=None):
+        """Migrate, reporting files through task. Returns True once everything has moved."""
+        os.makedirs(self.dst_root, exist_ok=True)
+        verified = self._load()
+        if not os.path.exists(self.journal_path) and os.stat(self.src_root).st_dev == os.stat(self.dst_root).st_dev:
+            return self._rename_all(task)
+        files, dirs = self._manifest()
+        # Drop records of files that changed since they were copied
+        verified = {rel: rec for rel, rec in verified.items() if rel in files and files[rel] == (rec["size"], rec["mtime_ns"])}
+        self._write_header(files, verified)
+        for rel in dirs:
+            os.makedirs(os.path.join(self.dst_root, rel), exist_ok=True)
+        todo = [rel for rel in files if rel not in verified]
+        if task is not None:
+            task.total = len(todo)
+        with concurrent.futures.ThreadPoolExecutor(COPY_WORKERS) as pool:
+            futures = {pool.submit(self._copy, rel, files[rel]): rel for rel in todo}
+            for future in concurrent.futures.as_completed(futures):
+                rel = futures[future]
+                try:
+                    record = future.result()
+                except concurrent.futures.CancelledError:
+                    continue
+                except (OSError, ValueError):
+                    self.failed.append(rel)
+                else:
+                    verified[rel] = record
+                    self._append(record)
+                if task is not None:
+                    task.advance(rel)
+                    if task.cancelled:
+                        for pending_future in futures:
+                            pending_future.cancel()
+        if self.failed or len(verified) < len(files):
+            return False
+        self._remove_sources(files, dirs, verified)
+        os.remove(self.journal_path)
+        return True
+
+    # Journal
+
+    def _load(self):
+        """Read the item list and verified records of an earlier run to the same destination."""
+        try:
+            with open(self.journal_path, "r", encoding="utf-8") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            lines = []
+        header = None
+        if lines:
+            try:
+                header = json.loads(lines[0])
+            except ValueError:
+                pass
+        if not header or header.get("src") != self.src_root or header.get("dst") != self.dst_root:
+            # A new migration; conflicting trunks at the destination are left alone
+            self.items, self.skipped = [], []
+            for name in sorted(os.listdir(self.src_root)):
+                (self.skipped if os.path.exists(os.path.join(self.dst_root, name)) else self.items).append(name)
+            if lines:
+                os.remove(self.journal_path)
+            return {}
+        self.items, self.skipped = header["items"], header["skipped"]
+        verified = {}
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break  # Torn by a crash mid-write
+            verified[record["path"]] = record
+        return verified
+
+    def _write_header(self, files, verified):
+        """Start the journal afresh with the manifest, carrying over records that are still valid."""
+        header = {
+            "src": self.src_root,
+            "dst": self.dst_root,
+            "items": self.items,
+            "skipped": self.skipped,
+            "manifest": {rel: list(stat) for rel, stat in files.items()},
+        }
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+            for record in verified.values():
+                f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def _append(self, record):
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    # Work
+
+    def _manifest(self):
+        """Return {relative path: (size, mtime_ns)} for every file to move, and every directory."""
+        files, dirs = {}, []
+        for item in self.items:
+            top = os.path.join(self.src_root, item)
+            for dir_path, dir_names, file_names in os.walk(top):
+                dir_names.sort()
+                rel_dir = os.path.relpath(dir_path, self.src_root)
+                dirs.append(rel_dir)
+                for name in sorted(file_names):
+                    st = os.stat(os.path.join(dir_path, name))
+                    files[os.path.join(rel_dir, name)] = (st.st_size, st.st_mtime_ns)
+        return files, dirs
+
+    def _copy(self, rel, stat):
+        """Copy one file, verify the copy and move it into place. Returns its journal record."""
+        src = os.path.join(self.src_root, rel)
+        dst = os.path.join(self.dst_root, rel)
+        partial = dst + PARTIAL_SUFFIX
+        digest = hashlib.sha256()
+        with open(src, "rb") as fin, open(partial, "wb") as fout:
+            for chunk in iter(lambda: fin.read(COPY_CHUNK), b""):
+                digest.update(chunk)
+                fout.write(chunk)
+            fout.flush()
+            os.fsync(fout.fileno())
+        source_hash = digest.hexdigest()
+        if file_hash(partial) != source_hash:
+            os.remove(partial)
+            raise ValueError(f"copy of {rel} does not match the source")
+        shutil.copystat(src, partial)
+        os.replace(partial, dst)
+        return {"path": rel, "size": stat[0], "mtime_ns": stat[1], "sha256": source_hash}
+
+    def _remove_sources(self, files, dirs, verified):
+        """Delete verified source files that have not changed since, then directories left empty."""
+        for rel in files:
+            src = os.path.join(self.src_root, rel)
+            try:
+                st = os.stat(src)
+            except FileNotFoundError:
+                continue
+            if (st.st_size, st.st_mtime_ns) == (verified[rel]["size"], verified[rel]["mtime_ns"]):
+                os.remove(src)
+        for rel in sorted(dirs, key=len, reverse=True):
+            try:
+                os.rmdir(os.path.join(self.src_root, rel))
+            except OSError:
+                pass  # Not empty: something was added during the migration
+
+    def _rename_all(self, task):
+        """Move each trunk with a single rename when both roots are on the same device."""
+        if task is not None:
+            task.total = len(self.items)
+        for item in list(self.items):
+            if task is not None and task.cancelled:
+                return False
+            try:
+                os.rename(os.path.join(self.src_root, item), os.path.join(self.dst_root, item))
+            except OSError:
+                self.failed.append(item)
+            if task is not None:
+                task.advance(item)
+        return not self.failed
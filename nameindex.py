@@ -0,0 +1,311 @@
+import heapq
+import itertools
+import os
+import re
+import threading
+from collections import defaultdict
+
+from archive import ARCHIVE_SUFFIX
+from catalog import PARENT_KIND
+
+# Results returned by a search
+RESULT_LIMIT = 50
+
+# Matches ranked at most per search; broader queries rank the first this many found
+RANK_LIMIT = 2000
+
+
+def format_display(file_base):
+    """Format file base name for display."""
+    match = re.search(r"_(\d+)$", file_base)
+    if match:
+        num = match.group(1)
+        try:
+            num_int = int(num)
+            if num_int < 100:
+                base_part = file_base[:match.start()]
+                base_display = base_part.replace("_", " ").title()
+                return f"{base_display} ({num_int})"
+        except ValueError:
+            pass
+    return file_base.replace("_", " ").title()
+
+
+def display_name(name, kind):
+    """Return the tree text for a trunk or journal directory or archive name or a note file name."""
+    if kind == "note":
+        return format_display(name[:-4])
+    if name.endswith(ARCHIVE_SUFFIX):
+        return name[:-len(ARCHIVE_SUFFIX)].replace("_", " ").title() + " (Archived)"
+    return name.replace("_", " ").title()
+
+
+def _grams(text):
+    """Return the trigrams of text."""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _matches(text, token):
+    """Return True if text contains token, or for tokens under three letters, has a word starting with it."""
+    if len(token) < 3:
+        return text.startswith(token) or f" {token}" in text
+    return token in text
+
+
+def _word_prefixes(text):
+    """Return the one and two letter prefixes of each word of text."""
+    prefixes = set()
+    for word in text.split():
+        prefixes.add(word[:1])
+        prefixes.add(word[:2])
+    return prefixes
+
+
+class NameIndex:
+    """In-memory index of the display names of every trunk, journal and note, for quick-open.
+
+    Names are indexed by trigram and by the first one and two letters of each word, so each query
+    token narrows the candidates by set intersection before any string is compared, and a query
+    that extends the previous one only filters that query's matches. Fed the catalog's changes as
+    its observer; safe to call from any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Changes that arrive while load() builds, replayed once it is done
+        self._pending = None
+        self.clear()
+
+    def clear(self):
+        """Forget every name."""
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self._ids = {}
+        # Per id: [path, kind, display, lowercased display], or None once removed
+        self._entries = []
+        self._free = []
+        self._children = defaultdict(set)
+        self._grams = defaultdict(set)
+        self._prefixes = defaultdict(set)
+        self._by_kind = defaultdict(set)
+        self._last = None
+        self.loaded = False
+
+    def load(self, rows):
+        """Replace the index with (path, kind, name) rows, e.g. every row of the catalog.
+
+        The new index is built aside, so searches go on answering from the old one meanwhile.
+        """
+        with self._lock:
+            self._pending = []
+        built = NameIndex()
+        for path, kind, name in rows:
+            built._add(path, kind, name)
+        with self._lock:
+            for name in ("_ids", "_entries", "_free", "_children", "_grams", "_prefixes", "_by_kind"):
+                setattr(self, name, getattr(built, name))
+            self._last = None
+            for method, args in self._pending:
+                method(*args)
+            self._pending = None
+            self.loaded = True
+
+    def __len__(self):
+        return len(self._ids)
+
+    # Catalog observer
+
+    def set_children(self, node, rows):
+        """Replace the children of node with (path, kind, name) rows."""
+        with self._lock:
+            self._apply(self._set_children, node, rows)
+
+    def add(self, path, kind, name):
+        """Add one entry, if it is not indexed yet."""
+        with self._lock:
+            self._apply(self._add_new, path, kind, name)
+
+    def remove(self, path):
+        """Remove an entry and everything below it."""
+        with self._lock:
+            self._apply(self._remove, path)
+
+    def move(self, old, new):
+        """Carry an entry and everything below it over to a new path, renaming it if its name changed."""
+        with self._lock:
+            self._apply(self._move, old, new)
+
+    def _apply(self, method, *args):
+        """Apply a change now, and again after a load() in progress swaps its index in. Caller holds the lock."""
+        method(*args)
+        if self._pending is not None:
+            self._pending.append((method, args))
+
+    def _set_children(self, node, rows):
+        wanted = {row[0] for row in rows}
+        for path in self._children.get(node, set()) - wanted:
+            self._remove(path)
+        for path, kind, name in rows:
+            entry_id = self._ids.get(path)
+            if entry_id is None:
+                self._add(path, kind, name)
+            elif self._entries[entry_id][2] != display_name(name, kind):
+                # Archived or unarchived in place
+                self._rename(entry_id, name)
+
+    def _add_new(self, path, kind, name):
+        if path not in self._ids:
+            self._add(path, kind, name)
+
+    def _move(self, old, new):
+        entry_id = self._ids.get(old)
+        if entry_id is None:
+            return
+        self._rekey(old, new)
+        if os.path.basename(old) != os.path.basename(new):
+            self._rename(entry_id, os.path.basename(new))
+        self._last = None
+
+    def _parent(self, path, kind):
+        if kind == "note":
+            return os.path.dirname(os.path.dirname(path))
+        return os.path.dirname(path)
+
+    def _add(self, path, kind, name):
+        display = display_name(name, kind)
+        entry = [path, kind, display, display.lower()]
+        if self._free:
+            entry_id = self._free.pop()
+            self._entries[entry_id] = entry
+        else:
+            entry_id = len(self._entries)
+            self._entries.append(entry)
+        self._ids[path] = entry_id
+        self._children[self._parent(path, kind)].add(path)
+        self._index(entry_id)
+        self._last = None
+
+    def _remove(self, path):
+        entry_id = self._ids.pop(path, None)
+        for child in self._children.pop(path, set()):
+            self._remove(child)
+        if entry_id is None:
+            return
+        self._unindex(entry_id)
+        self._children[self._parent(path, self._entries[entry_id][1])].discard(path)
+        self._entries[entry_id] = None
+        self._free.append(entry_id)
+        self._last = None
+
+    def _rename(self, entry_id, name):
+        self._unindex(entry_id)
+        entry = self._entries[entry_id]
+        entry[2] = display_name(name, entry[1])
+        entry[3] = entry[2].lower()
+        self._index(entry_id)
+        self._last = None
+
+    def _index(self, entry_id):
+        _, kind, _, text = self._entries[entry_id]
+        self._by_kind[kind].add(entry_id)
+        for gram in _grams(text):
+            self._grams[gram].add(entry_id)
+        for prefix in _word_prefixes(text):
+            self._prefixes[prefix].add(entry_id)
+
+    def _unindex(self, entry_id):
+        _, kind, _, text = self._entries[entry_id]
+        self._by_kind[kind].discard(entry_id)
+        for gram in _grams(text):
+            self._grams[gram].discard(entry_id)
+        for prefix in _word_prefixes(text):
+            self._prefixes[prefix].discard(entry_id)
+
+    def _rekey(self, old, new):
+        entry_id = self._ids.pop(old)
+        entry = self._entries[entry_id]
+        entry[0] = new
+        self._ids[new] = entry_id
+        self._children[self._parent(old, entry[1])].discard(old)
+        self._children[self._parent(new, entry[1])].add(new)
+        for child in self._children.pop(old, set()):
+            self._rekey(child, new + child[len(old):])
+
+    # Queries
+
+    def search(self, query, kinds=None, limit=RESULT_LIMIT):
+        """Return (path, kind, display) rows whose display name contains every word of query, best first.
+
+        Words under three letters only match the start of a word of the name. A name that is the
+        query, then one that starts with it, then one where each word starts a word of the name
+        rank first, shorter names before longer ones. Queries so broad that more than RANK_LIMIT
+        names match rank only the first RANK_LIMIT found. kinds limits the kinds returned; an
+        empty query lists the trunks and journals among them alphabetically.
+        """
+        tokens = query.lower().split()
+        kinds = tuple(kinds or ("trunk", "journal", "note"))
+        with self._lock:
+            entries = self._entries
+            if not tokens:
+                ids = set().union(*(self._by_kind[kind] for kind in kinds if kind != "note"))
+                best = heapq.nsmallest(limit, ids, key=lambda i: entries[i][3])
+            else:
+                phrase = " ".join(tokens)
+                best = heapq.nsmallest(limit, self._candidates(tokens, kinds), key=lambda i: self._rank(entries[i][3], phrase, tokens))
+            return [tuple(entries[i][:3]) for i in best]
+
+    def _candidates(self, tokens, kinds):
+        """Return the ids of up to RANK_LIMIT entries of kinds whose name matches every token."""
+        entries = self._entries
+        last = self._last
+        if last is not None and last[1] == kinds and len(last[2]) <= RANK_LIMIT and len(tokens) >= len(last[0]) and all(
+            token == previous or (len(previous) >= 3 and token.startswith(previous))
+            for token, previous in zip(tokens, last[0])
+        ):
+            # Typing on only narrows the previous matches, when there are few enough to check one by one
+            ids = {i for i in last[2] if all(_matches(entries[i][3], token) for token in tokens)}
+        else:
+            postings = []
+            for token in tokens:
+                if len(token) < 3:
+                    postings.append(self._prefixes.get(token, set()))
+                else:
+                    postings.extend(self._grams.get(gram, set()) for gram in _grams(token))
+            if len(kinds) < 3:
+                postings.append(set().union(*(self._by_kind[kind] for kind in kinds)))
+            postings.sort(key=len)
+            ids = postings[0].intersection(*postings[1:])
+            # Trigrams can all occur without the token itself; check the name really contains it
+            long_tokens = [token for token in tokens if len(token) >= 3]
+            if long_tokens:
+                ids = {i for i in ids if all(token in entries[i][3] for token in long_tokens)}
+        self._last = (tokens, kinds, ids)
+        if len(ids) > RANK_LIMIT:
+            return itertools.islice(ids, RANK_LIMIT)
+        return ids
+
+    @staticmethod
+    def _rank(text, phrase, tokens):
+        if text == phrase:
+            tier = 0
+        elif text.startswith(phrase):
+            tier = 1
+        elif all(text.startswith(token) or f" {token}" in text for token in tokens):
+            tier = 2
+        else:
+            tier = 3
+        return tier, len(text), text
+
+    def context(self, path, kind):
+        """Return the display names of the journal and trunk above an entry, joined for showing beside it."""
+        names = []
+        node = path
+        while kind in PARENT_KIND and PARENT_KIND[kind] != "root":
+            node = self._parent(node, kind)
+            kind = PARENT_KIND[kind]
+            with self._lock:
+                entry_id = self._ids.get(node)
+                names.append(self._entries[entry_id][2] if entry_id is not None else os.path.basename(node))
+        return " / ".join(names)
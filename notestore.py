@@ -0,0 +1,556 @@
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+import archive
+import editlog
+import packstore
+from catalog import Catalog, PARENT_KIND, classify
+from history import History
+from metastore import MetaStore, META_FILE
+from nameindex import NameIndex
+from saver import write_atomic
+from search_index import SearchIndex
+from tracing import traced
+
+# Databases kept in the data dir
+CATALOG_FILE = "catalog.sqlite3"
+SEARCH_INDEX_FILE = "search.sqlite3"
+HISTORY_FILE = "history.sqlite3"
+
+
+def slug(name):
+    """Turn a name typed by the user into a trunk, journal or note base name."""
+    return name.strip().lower().replace(" ", "_")
+
+
+def notes_dir(journal):
+    """Return the directory holding a journal's notes."""
+    return os.path.join(journal, ".notes")
+
+
+def unique_path(dir_path, base, ext=""):
+    """Return (path, counter) for the first free name of base, base_2, base_3... in dir_path.
+
+    counter is None when base itself is free.
+    """
+    path = os.path.join(dir_path, base + ext)
+    counter = 2
+    while os.path.exists(path):
+        path = os.path.join(dir_path, f"{base}_{counter}{ext}")
+        counter += 1
+    return path, (counter - 1 if counter > 2 else None)
+
+
+def unique_name(taken, base, ext=""):
+    """Return the first of base, base_2, base_3... (plus ext) not in the set taken, and add it."""
+    name = base + ext
+    counter = 2
+    while name in taken:
+        name = f"{base}_{counter}{ext}"
+        counter += 1
+    taken.add(name)
+    return name
+
+
+class NoteStore:
+    """Trunks, journals and notes under a trunk root, with the catalog, search index, history and
+    metadata kept in step with every change.
+
+    Trunks and journals are identified by their directory and notes by their .txt file. A journal
+    can instead be packed into a single file (see packstore), and a trunk or journal archived into
+    a read-only zip (see archive); their notes keep their .txt paths, so everything but the reads
+    and writes here is the same for any layout. Filesystem errors propagate as OSError; creating
+    something that already exists raises FileExistsError, and changing something archived
+    PermissionError. Needs no display, so it can be driven by the UI, scripts and benchmarks alike.
+    """
+
+    def __init__(self, trunk_root, data_dir):
+        self.catalog = Catalog(os.path.join(data_dir, CATALOG_FILE))
+        self.names = NameIndex()
+        self.catalog.observer = self.names
+        self.search_index = SearchIndex(os.path.join(data_dir, SEARCH_INDEX_FILE))
+        self.history = History(os.path.join(data_dir, HISTORY_FILE))
+        self.meta = MetaStore()
+        self.set_root(trunk_root)
+
+    def set_root(self, trunk_root):
+        """Switch to another trunk root, creating it and the unsaved notes journal if needed."""
+        self.trunk_root = trunk_root
+        self.names.clear()
+        self.unsaved_trunk = os.path.join(trunk_root, "unsaved")
+        self.unsaved_journal = os.path.join(self.unsaved_trunk, "notes")
+        self.unsaved_notes_dir = notes_dir(self.unsaved_journal)
+        os.makedirs(self.unsaved_notes_dir, exist_ok=True)
+
+    def close(self):
+        """Write pending metadata and history and close the databases."""
+        self.meta.flush()
+        self.search_index.wait()
+        self.history.close()
+        self.catalog.close()
+        packstore.close_all()
+        archive.close_all()
+
+    # Listing
+
+    def kind(self, path):
+        """Return "root", "trunk", "journal" or "note" for a path under the trunk root, or None."""
+        if path == self.trunk_root:
+            return "root"
+        info = classify(self.trunk_root, path)
+        return info and info[0]
+
+    def packed(self, path):
+        """Return True if path is a packed journal or a note in one."""
+        return packstore.is_packed(path if self.kind(path) == "journal" else packstore.journal_of(path))
+
+    def archived(self, path):
+        """Return the trunk or journal whose archive holds path, or None if it is not archived."""
+        kind = self.kind(path)
+        if kind == "trunk":
+            return path if os.path.isfile(archive.archive_path(path)) else None
+        if kind == "journal":
+            return archive.holder(path)
+        if kind == "note":
+            return archive.holder(packstore.journal_of(path))
+        return None
+
+    def _writable(self, *paths):
+        """Raise PermissionError if any of paths is archived."""
+        for path in paths:
+            if self.archived(path):
+                raise PermissionError(f"{path} is archived and read-only")
+
+    def exists(self, path):
+        """Return True if a trunk, journal or note exists, in any layout."""
+        if self.kind(path) == "note":
+            return packstore.exists(path)
+        return os.path.exists(path) or self.archived(path) is not None
+
+    def children(self, node, rescan=False):
+        """Return (path, kind, name) rows for the children of the root, a trunk or a journal.
+
+        Rows come from the catalog unless the node was never listed or rescan is set.
+        """
+        rows = None if rescan else self.catalog.children(node)
+        if rows is None:
+            rows = self.catalog.rescan(node, self.kind(node))
+        return rows
+
+    def reconcile(self, root=None):
+        """Bring the catalog and search index in line with disk. Returns the nodes whose children changed."""
+        root = root or self.trunk_root
+        changed = self.catalog.reconcile(root)
+        self.search_index.sync(root, self.catalog.notes(root))
+        if root == self.trunk_root and not self.names.loaded:
+            self.names.load(self.catalog.entries(root))
+        return changed
+
+    def search(self, query, limit=100):
+        """Return the paths of notes matching query, newest first."""
+        return self.search_index.search(query, limit=limit)
+
+    # Creating
+
+    def create_trunk(self, name):
+        """Create a trunk and return its path."""
+        path = os.path.join(self.trunk_root, slug(name))
+        if os.path.exists(archive.archive_path(path)):
+            raise FileExistsError(path)
+        os.mkdir(path)
+        self.catalog.add(path, "trunk", self.trunk_root)
+        return path
+
+    def create_journal(self, trunk, name):
+        """Create a journal in a trunk and return its path."""
+        self._writable(trunk)
+        path = os.path.join(trunk, slug(name))
+        if os.path.exists(archive.archive_path(path)):
+            raise FileExistsError(path)
+        os.mkdir(path)
+        os.mkdir(notes_dir(path))
+        self.catalog.add(path, "journal", trunk)
+        return path
+
+    def create_note(self, journal, name, text=""):
+        """Create a note in a journal, numbering it if the name is taken, and return its path."""
+        self._writable(journal)
+        path, _ = self.unique_note_path(journal, slug(name))
+        if packstore.is_packed(journal):
+            packstore.get_pack(journal).write(os.path.basename(path), text, create=True)
+        else:
+            with open(path, "x", encoding="utf-8", errors="surrogatepass") as f:
+                f.write(text)
+        if text:
+            self.saved(path, text)
+        else:
+            self.catalog.add(path, "note", journal)
+        return path
+
+    def unique_note_path(self, journal, base):
+        """Return (path, counter) for the first free note name of base in a journal, as unique_path does."""
+        if not packstore.is_packed(journal):
+            return unique_path(notes_dir(journal), base, ".txt")
+        name = unique_name(packstore.get_pack(journal).names(), base, ".txt")
+        counter = name[len(base) + 1:-4]
+        return os.path.join(notes_dir(journal), name), int(counter) if counter else None
+
+    def note_names(self, journal):
+        """Return the set of file names of a journal's notes."""
+        if packstore.is_packed(journal):
+            return packstore.get_pack(journal).names()
+        return set(os.listdir(notes_dir(journal)))
+
+    def unsaved_note_path(self):
+        """Return a fresh path in the unsaved notes journal for a note typed without one."""
+        return os.path.join(self.unsaved_notes_dir, f"note_{datetime.now().strftime('%Y-%m-%d_%H%M%S')}.txt")
+
+    # Reading and writing
+
+    def read(self, path):
+        """Return the text of a note, with its edit log applied."""
+        if os.path.exists(path):
+            return editlog.replay(path)
+        return packstore.read_text(path)
+
+    def save(self, path, text):
+        """Write a note and update the indexes."""
+        self._writable(path)
+        if packstore.is_packed_note(path):
+            packstore.write_text(path, text)
+        else:
+            write_atomic(path, text)
+        self.saved(path, text)
+
+    def saved(self, path, text):
+        """Update the indexes after a note was written with text. Returns False if path is not a note."""
+        info = classify(self.trunk_root, path)
+        if info is None or info[0] != "note" or text is None:
+            return False
+        if not self.catalog.add(path, "note", info[1]):
+            return False
+        self.search_index.update(path, text)
+        self.history.record(path, text)
+        return True
+
+    # Moving, renaming and deleting
+
+    def move_note(self, path, journal):
+        """Move a note to another journal, numbering it if the name is taken there. Returns the new path."""
+        self._writable(path, journal)
+        dest, _ = self.unique_note_path(journal, os.path.basename(path)[:-4])
+        self._move_file(path, dest)
+        return dest
+
+    def rename_note(self, path, new_path):
+        """Rename a note within its journal."""
+        self._writable(path)
+        if packstore.exists(new_path):
+            raise FileExistsError(new_path)
+        self._move_file(path, new_path)
+
+    def _move_file(self, path, dest):
+        src_journal, dest_journal = packstore.journal_of(path), packstore.journal_of(dest)
+        if src_journal == dest_journal and packstore.is_packed(src_journal):
+            packstore.get_pack(src_journal).rename(os.path.basename(path), os.path.basename(dest))
+        elif packstore.is_packed(src_journal) or packstore.is_packed(dest_journal):
+            # Between layouts, or between two packs: copy the text over, keeping its mtime
+            text = self.read(path)
+            mtime = packstore.stat(path).st_mtime
+            if packstore.is_packed(dest_journal):
+                packstore.get_pack(dest_journal).write(os.path.basename(dest), text, mtime, create=True)
+            else:
+                with open(dest, "x", encoding="utf-8", errors="surrogatepass") as f:
+                    f.write(text)
+                os.utime(dest, (mtime, mtime))
+            self._remove_note(path)
+        else:
+            shutil.move(path, dest)
+            if os.path.exists(editlog.log_path(path)):
+                shutil.move(editlog.log_path(path), editlog.log_path(dest))
+        self.moved(path, dest)
+
+    def _remove_note(self, path):
+        journal = packstore.journal_of(path)
+        if packstore.is_packed(journal):
+            pack = packstore.get_pack(journal)
+            pack.remove(os.path.basename(path))
+            pack.compact()
+        else:
+            os.remove(path)
+            editlog.discard(path)
+
+    def move_journal(self, journal, trunk):
+        """Move a journal and its notes to another trunk. Returns the new path."""
+        dest = os.path.join(trunk, os.path.basename(journal))
+        self._writable(journal, trunk)
+        if self.exists(dest):
+            raise FileExistsError(dest)
+        packstore.release(journal)
+        shutil.move(journal, dest)
+        self.moved(journal, dest)
+        return dest
+
+    @traced
+    def delete(self, path):
+        """Delete a note, journal or trunk, snapshotting its notes into the history first."""
+        is_note = self.kind(path) == "note"
+        self.history.preserve([path] if is_note else [note for note, _, _ in self.catalog.notes(path)])
+        self.history.wait()
+        self._remove(path)
+        self.deleted(path)
+
+    def _remove(self, path):
+        """Remove a note, journal or trunk from disk, whatever its layout. An archive goes whole."""
+        if self.kind(path) == "note":
+            self._writable(path)
+            self._remove_note(path)
+        elif self.archived(path) == path:
+            archive.release(path)
+            os.remove(archive.archive_path(path))
+        else:
+            self._writable(path)
+            packstore.release(path)
+            archive.release(path)
+            shutil.rmtree(path)
+
+    # Converting between layouts, on a worker thread with an optional tasks.BackgroundTask
+
+    def pack_journal(self, journal, task=None):
+        """Move a journal's notes out of its .notes directory into a pack. Returns False if cancelled.
+
+        The pack is built beside the directory and swapped in once complete, so an interrupted
+        conversion leaves the journal as it was.
+        """
+        if packstore.is_packed(journal):
+            return True
+        self._writable(journal)
+        self.meta.flush()
+        folder = notes_dir(journal)
+        tmp_path = packstore.pack_path(journal) + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        names = sorted(name for name in os.listdir(folder) if name.endswith(".txt"))
+        pack = packstore.Pack(tmp_path)
+        try:
+            for name in names:
+                if task is not None and task.cancelled:
+                    break
+                path = os.path.join(folder, name)
+                pack.write(name, editlog.replay(path), os.stat(path).st_mtime)
+                if task is not None:
+                    task.advance(name)
+            complete = len(pack.names()) == len(names)
+        finally:
+            pack.close()
+        if not complete:
+            os.remove(tmp_path)
+            return False
+        os.replace(tmp_path, packstore.pack_path(journal))
+        if os.path.exists(os.path.join(folder, META_FILE)):
+            os.replace(os.path.join(folder, META_FILE), folder + META_FILE)
+        shutil.rmtree(folder)
+        self.catalog.rescan(journal, "journal")
+        return True
+
+    def unpack_journal(self, journal, task=None):
+        """Write a packed journal's notes back out as files in its .notes directory. Returns False if cancelled."""
+        if not packstore.is_packed(journal):
+            return True
+        self.meta.flush()
+        folder = notes_dir(journal)
+        os.makedirs(folder, exist_ok=True)
+        pack = packstore.get_pack(journal)
+        written = []
+        for name, mtime, _ in pack.entries():
+            if task is not None and task.cancelled:
+                # Leave the pack as the only copy
+                for path in written:
+                    os.remove(path)
+                try:
+                    os.rmdir(folder)
+                except OSError:
+                    pass
+                return False
+            path = os.path.join(folder, name)
+            write_atomic(path, pack.read(name))
+            os.utime(path, (mtime, mtime))
+            written.append(path)
+            if task is not None:
+                task.advance(name)
+        if os.path.exists(folder + META_FILE):
+            os.replace(folder + META_FILE, os.path.join(folder, META_FILE))
+        packstore.release(journal)
+        os.remove(packstore.pack_path(journal))
+        self.catalog.rescan(journal, "journal")
+        return True
+
+    def archive_node(self, node, task=None):
+        """Replace a trunk or journal with a compressed, read-only archive. Returns False if cancelled.
+
+        Notes of every layout are stored as plain text with their metadata; the directory is only
+        removed once the archive is complete.
+        """
+        if self.archived(node):
+            return True
+        self.meta.flush()
+        kind = self.kind(node)
+        journals = [node] if kind == "journal" else [path for path, _, _ in self.children(node, rescan=True)]
+        notes = {journal: self.children(journal, rescan=True) for journal in journals}
+        if task is not None:
+            task.total = sum(len(rows) for rows in notes.values())
+        if not archive.create(node, self._archive_members(node, kind, notes), task):
+            return False
+        packstore.release(node)
+        archive.release(node)
+        shutil.rmtree(node)
+        self.meta.remove(node)
+        self.catalog.invalidate(node)
+        self.catalog.rescan(os.path.dirname(node), PARENT_KIND[kind])
+        return True
+
+    def _archive_members(self, node, kind, notes):
+        """Yield (path, text, mtime) archive members for the notes and metadata of each journal in notes."""
+        if kind == "trunk":
+            yield node + os.sep, None, 0
+        for journal, rows in notes.items():
+            yield notes_dir(journal) + os.sep, None, 0
+            meta = {}
+            for path, _, name in rows:
+                yield path, self.read(path), packstore.stat(path).st_mtime
+                values = self.meta.get(path)
+                if values:
+                    meta[name] = values
+            if meta:
+                yield os.path.join(notes_dir(journal), META_FILE), json.dumps(meta, sort_keys=True), time.time()
+
+    def unarchive_node(self, node, task=None):
+        """Restore an archived trunk or journal to directories and files. Returns False if cancelled."""
+        if self.archived(node) != node:
+            return True
+        if os.path.exists(node):
+            raise FileExistsError(node)
+        opened = archive.get_archive(node)
+        if task is not None:
+            task.total = len(opened.notes())
+        if opened.extract(task) is None:
+            return False
+        archive.release(node)
+        os.remove(archive.archive_path(node))
+        self.meta.remove(node)
+        self.catalog.invalidate(node)
+        self.catalog.rescan(os.path.dirname(node), PARENT_KIND[self.kind(node)])
+        return True
+
+    def note_count(self, journal):
+        """Return how many notes a journal holds, packed or not."""
+        return sum(1 for name in self.note_names(journal) if name.endswith(".txt"))
+
+    def totals(self, node):
+        """Return (words, characters, notes, counted) for the notes in a trunk or journal.
+
+        Words and characters come from the totals MetaStore keeps per journal, so neither a note
+        nor each note's metadata is read; counted is how many of the notes had counts saved.
+        """
+        if self.kind(node) == "journal":
+            journals = [node]
+        else:
+            journals = [path for path, kind, _ in self.children(node) if kind == "journal"]
+        words = chars = counted = 0
+        for journal in journals:
+            journal_words, journal_chars, journal_counted = self.meta.totals(notes_dir(journal))
+            words += journal_words
+            chars += journal_chars
+            counted += journal_counted
+        return words, chars, self.catalog.count_notes(node), counted
+
+    # Batches, run on a worker thread with a tasks.BackgroundTask for progress and cancellation
+
+    def move_notes(self, paths, journal, task=None):
+        """Move notes to a journal, numbering names taken there. Returns (moved, failed).
+
+        moved lists (old, new) pairs; notes already in the journal are skipped.
+        """
+        return self._move_many(paths, journal, True, task)
+
+    def move_journals(self, journals, trunk, task=None):
+        """Move journals to a trunk, numbering names taken there. Returns (moved, failed)."""
+        return self._move_many(journals, trunk, False, task)
+
+    def _move_many(self, paths, dest, are_notes, task):
+        # The destination is listed once and names are handed out from that listing
+        taken = self.note_names(dest) if are_notes else set(os.listdir(dest))
+        dest_dir = notes_dir(dest) if are_notes else dest
+        moved, failed = [], []
+        for path in paths:
+            if task is not None and task.cancelled:
+                break
+            if os.path.dirname(path) != dest_dir:
+                base, ext = os.path.splitext(os.path.basename(path)) if are_notes else (os.path.basename(path), "")
+                dest = os.path.join(dest_dir, unique_name(taken, base, ext))
+                try:
+                    self._writable(path, dest)
+                    if are_notes:
+                        self._move_file(path, dest)
+                    else:
+                        packstore.release(path)
+                        shutil.move(path, dest)
+                        self.moved(path, dest)
+                    moved.append((path, dest))
+                except OSError:
+                    failed.append(path)
+            if task is not None:
+                task.advance(os.path.basename(path))
+        return moved, failed
+
+    @traced
+    def delete_many(self, paths, task=None):
+        """Delete notes, journals and trunks, snapshotting their notes first. Returns (deleted, failed)."""
+        notes = []
+        for path in paths:
+            notes.extend([path] if self.kind(path) == "note" else [note for note, _, _ in self.catalog.notes(path)])
+        self.history.preserve(notes)
+        self.history.wait()
+        deleted, failed = [], []
+        for path in paths:
+            if task is not None and task.cancelled:
+                break
+            try:
+                self._remove(path)
+                self.deleted(path)
+                deleted.append(path)
+            except OSError:
+                failed.append(path)
+            if task is not None:
+                task.advance(os.path.basename(path))
+        return deleted, failed
+
+    # Bookkeeping, also for changes made outside the store
+
+    def moved(self, old, new):
+        """Carry the indexes over after a note, journal or trunk moved from old to new."""
+        old_info = classify(self.trunk_root, old)
+        new_info = classify(self.trunk_root, new)
+        if not (old_info and new_info and old_info[0] == new_info[0]):
+            return
+        if old_info[0] == "note":
+            self.catalog.remove(old, old_info[1])
+            self.catalog.add(new, "note", new_info[1])
+        else:
+            self.catalog.move(old, new, *new_info)
+        self.search_index.rename(old, new)
+        self.history.rename(old, new)
+        self.meta.rename(old, new)
+
+    def deleted(self, path):
+        """Drop a deleted note, journal or trunk from the indexes."""
+        info = classify(self.trunk_root, path)
+        if info is None:
+            return
+        self.catalog.remove(path, info[1])
+        self.search_index.remove(path)
+        self.history.deleted(path)
+        self.meta.remove(path)
@@ -0,0 +1,217 @@
+import os
+import sqlite3
+import stat as stat_module
+import threading
+import time
+
+import archive
+
+# A packed journal keeps all its notes in this SQLite file instead of a .notes directory
+PACK_FILE = ".notes.pack"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    name TEXT PRIMARY KEY,
+    text TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+# A pack is vacuumed once this share of its pages is free
+COMPACT_FREE_RATIO = 0.25
+
+
+def pack_path(journal):
+    """Return the path of a journal's pack file."""
+    return os.path.join(journal, PACK_FILE)
+
+
+def is_packed(journal):
+    """Return True if a journal keeps its notes in a pack."""
+    return os.path.isfile(pack_path(journal))
+
+
+def journal_of(path):
+    """Return the journal of a note path, packed or not."""
+    return os.path.dirname(os.path.dirname(path))
+
+
+def is_packed_note(path):
+    """Return True if a note path lives in a packed journal."""
+    return is_packed(journal_of(path))
+
+
+class Pack:
+    """The notes of one journal as rows of a SQLite file: random-access reads and in-place updates.
+
+    Rows are keyed by file name, so a packed note keeps the path it would have in the .notes
+    directory and the catalog, search index, history and metadata need not know the difference.
+    Missing notes raise FileNotFoundError and clashing creates FileExistsError, like the
+    filesystem. Safe to call from any thread.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def entries(self):
+        """Return (name, mtime, size) for every note, sorted by name."""
+        with self._lock:
+            return self._conn.execute("SELECT name, mtime, size FROM notes ORDER BY name").fetchall()
+
+    def names(self):
+        """Return the set of note file names."""
+        with self._lock:
+            return {name for (name,) in self._conn.execute("SELECT name FROM notes")}
+
+    def exists(self, name):
+        """Return True if the pack holds a note called name."""
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM notes WHERE name = ?", (name,)).fetchone() is not None
+
+    def stat(self, name):
+        """Return (mtime, size) of a note."""
+        with self._lock:
+            row = self._conn.execute("SELECT mtime, size FROM notes WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(os.path.join(self.path, name))
+        return row
+
+    def read(self, name):
+        """Return the text of a note."""
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM notes WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(os.path.join(self.path, name))
+        return row[0]
+
+    def write(self, name, text, mtime=None, create=False):
+        """Store a note, replacing its text in place. With create, fail if it already exists."""
+        row = (name, text, time.time() if mtime is None else mtime, len(text.encode("utf-8", "surrogatepass")))
+        with self._lock, self._conn:
+            try:
+                self._conn.execute(f"INSERT {'' if create else 'OR REPLACE'} INTO notes (name, text, mtime, size) VALUES (?, ?, ?, ?)", row)
+            except sqlite3.IntegrityError:
+                raise FileExistsError(os.path.join(self.path, name)) from None
+
+    def write_many(self, rows):
+        """Store (name, text, mtime) rows in one transaction."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO notes (name, text, mtime, size) VALUES (?, ?, ?, ?)",
+                [(name, text, mtime, len(text.encode("utf-8", "surrogatepass"))) for name, text, mtime in rows],
+            )
+
+    def rename(self, old, new):
+        """Rename a note within the pack."""
+        with self._lock, self._conn:
+            try:
+                changed = self._conn.execute("UPDATE notes SET name = ? WHERE name = ?", (new, old)).rowcount
+            except sqlite3.IntegrityError:
+                raise FileExistsError(os.path.join(self.path, new)) from None
+        if not changed:
+            raise FileNotFoundError(os.path.join(self.path, old))
+
+    def remove(self, name):
+        """Delete a note."""
+        with self._lock, self._conn:
+            if not self._conn.execute("DELETE FROM notes WHERE name = ?", (name,)).rowcount:
+                raise FileNotFoundError(os.path.join(self.path, name))
+
+    def compact(self, force=False):
+        """Give the space of deleted and shrunk notes back, once enough of the file is free. Returns True if it did."""
+        with self._lock:
+            free = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+            pages = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            if not force and (not free or free < pages * COMPACT_FREE_RATIO):
+                return False
+            self._conn.execute("VACUUM")
+            return True
+
+
+# Open packs, shared by every caller in the process
+_packs = {}
+_packs_lock = threading.Lock()
+
+
+def get_pack(journal):
+    """Return the open Pack of a packed journal."""
+    path = pack_path(journal)
+    with _packs_lock:
+        pack = _packs.get(path)
+        if pack is None:
+            if not os.path.isfile(path):
+                raise FileNotFoundError(path)
+            pack = _packs[path] = Pack(path)
+        return pack
+
+
+def release(path):
+    """Close the packs of journals at or below path, before it is moved or deleted."""
+    with _packs_lock:
+        for pack_file in [p for p in _packs if p.startswith(path + os.sep)]:
+            _packs.pop(pack_file).close()
+
+
+def close_all():
+    """Close every open pack."""
+    with _packs_lock:
+        for pack in _packs.values():
+            pack.close()
+        _packs.clear()
+
+
+# Note-path helpers for code that reads notes of any layout: a file, a pack row or, read-only, an
+# archive member. Files are tried first, so plain notes cost what they always did.
+
+def stat(path):
+    """Return os.stat of a note, or the equivalent built from its pack row or archive member."""
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        journal = journal_of(path)
+        if is_packed(journal):
+            mtime, size = get_pack(journal).stat(os.path.basename(path))
+        elif archive.holder(journal):
+            mtime, size = archive.get_archive(archive.holder(journal)).stat(path)
+        else:
+            raise
+    return os.stat_result((stat_module.S_IFREG | 0o644, 0, 0, 1, 0, 0, size, int(mtime), int(mtime), int(mtime), mtime, mtime, mtime))
+
+
+def exists(path):
+    """Return True if a note exists on disk, in its pack or in an archive."""
+    try:
+        stat(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def read_text(path, errors=None):
+    """Return the stored text of a note of any layout, without replaying an edit log."""
+    try:
+        with open(path, "r", encoding="utf-8", errors=errors) as f:
+            return f.read()
+    except FileNotFoundError:
+        journal = journal_of(path)
+        if is_packed(journal):
+            return get_pack(journal).read(os.path.basename(path))
+        if archive.holder(journal):
+            return archive.get_archive(archive.holder(journal)).read(path)
+        raise
+
+
+def write_text(path, text):
+    """Write a packed note in place and return text, for WriteBehindSaver.submit."""
+    get_pack(journal_of(path)).write(os.path.basename(path), text)
+    return text
@@ -0,0 +1,83 @@
+import concurrent.futures
+import threading
+import time
+
+from buffercache import stamp
+from largenote import LARGE_NOTE_BYTES
+
+# Reader threads; kept small so prefetching never competes with the editor for the disk
+PREFETCH_WORKERS = 2
+
+# Notes after and before the selected one read ahead, the usual next picks when reading through a journal
+PREFETCH_AHEAD = 3
+PREFETCH_BEHIND = 1
+
+# A read slower than this means the disk is busy: prefetching pauses, for longer each time it stays slow
+SLOW_READ_SECONDS = 0.2
+BACKOFF_SECONDS = 1.0
+MAX_BACKOFF_SECONDS = 30.0
+
+
+class Prefetcher:
+    """Read notes the user is likely to open next into a BufferCache on a small thread pool.
+
+    Each prefetch() supersedes the last, so reads still queued for a selection the user has moved
+    away from are dropped. Notes already cached, large notes and notes that cannot be read are
+    skipped. Reading a note also loads its journal's metadata into the store. digest(text) gives
+    the digest kept with each text, as the editor computes it.
+    """
+
+    def __init__(self, store, cache, digest):
+        self.store = store
+        self.cache = cache
+        self.digest = digest
+        self._pool = concurrent.futures.ThreadPoolExecutor(PREFETCH_WORKERS)
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._futures = []
+        self._backoff = 0.0
+        self._paused_until = 0.0
+        self.fetched = 0
+
+    def prefetch(self, paths):
+        """Read paths into the cache in order, cancelling what is left of the previous prefetch."""
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            for future in self._futures:
+                future.cancel()
+            self._futures = [self._pool.submit(self._fetch, generation, path) for path in paths if path not in self.cache]
+
+    def cancel(self):
+        """Drop every read not yet started."""
+        self.prefetch([])
+
+    def close(self):
+        """Cancel queued reads and stop the threads once the ones running finish."""
+        self.cancel()
+        self._pool.shutdown(wait=False)
+
+    def _fetch(self, generation, path):
+        if generation != self._generation or time.monotonic() < self._paused_until or path in self.cache:
+            return
+        start = time.monotonic()
+        try:
+            version = stamp(path)
+            if version[1] >= LARGE_NOTE_BYTES:
+                return
+            text = self.store.read(path)
+            self.store.meta.get(path)
+        except Exception:
+            return  # Gone, unreadable or with a broken edit log; opening it will say so
+        self._pace(time.monotonic() - start)
+        self.cache.put(path, version, text, self.digest(text.strip()))
+        self.fetched += 1
+
+    def _pace(self, elapsed):
+        """Pause prefetching after a slow read, doubling the pause while reads stay slow."""
+        with self._lock:
+            if elapsed > SLOW_READ_SECONDS:
+                self._backoff = min(max(self._backoff * 2, BACKOFF_SECONDS), MAX_BACKOFF_SECONDS)
+                self._paused_until = time.monotonic() + self._backoff
+            else:
+                self._backoff = 0.0
@@ -0,0 +1,68 @@
+import tkinter as tk
+
+
+class QuickOpenDialog:
+    """Palette that finds trunks, journals and notes by name as you type.
+
+    Enter or a double-click picks the highlighted row; the arrow keys move between rows. With
+    modal set, the caller waits for the choice in result; otherwise on_pick(path, kind) is called.
+    """
+
+    def __init__(self, root, index, title="Quick Open", kinds=None, on_pick=None, modal=False):
+        self.root = root
+        self.index = index
+        self.kinds = kinds
+        self.on_pick = on_pick
+        self.result = None
+        self._rows = []
+        self.dialog = tk.Toplevel(root)
+        self.dialog.title(title)
+        self.dialog.geometry("520x360")
+        self.query = tk.StringVar()
+        entry = tk.Entry(self.dialog, textvariable=self.query)
+        entry.pack(fill="x", padx=5, pady=5)
+        self.listbox = tk.Listbox(self.dialog, exportselection=False, activestyle="none")
+        self.listbox.pack(fill="both", expand=True, padx=5, pady=(0, 5))
+        self.query.trace_add("write", lambda *args: self.refresh())
+        entry.bind("<Return>", self.pick)
+        entry.bind("<Down>", lambda event: self.move(1))
+        entry.bind("<Up>", lambda event: self.move(-1))
+        self.dialog.bind("<Escape>", lambda event: self.dialog.destroy())
+        self.listbox.bind("<Double-Button-1>", self.pick)
+        self.refresh()
+        entry.focus_set()
+        if modal:
+            self.dialog.grab_set()
+            root.wait_window(self.dialog)
+
+    def refresh(self):
+        """Show the best matches for the query."""
+        self._rows = self.index.search(self.query.get(), self.kinds)
+        self.listbox.delete(0, tk.END)
+        for path, kind, display in self._rows:
+            context = self.index.context(path, kind)
+            self.listbox.insert(tk.END, f"{display}    {context}" if context else display)
+        if self._rows:
+            self.listbox.selection_set(0)
+
+    def move(self, step):
+        """Highlight the row step rows away."""
+        selection = self.listbox.curselection()
+        if not self._rows:
+            return "break"
+        index = min(max((selection[0] if selection else 0) + step, 0), len(self._rows) - 1)
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(index)
+        self.listbox.see(index)
+        return "break"
+
+    def pick(self, event=None):
+        """Close with the highlighted row as the choice."""
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        path, kind, _ = self._rows[selection[0]]
+        self.result = path
+        self.dialog.destroy()
+        if self.on_pick:
+            self.on_pick(path, kind)
@@ -0,0 +1,126 @@
+import os
+import threading
+from collections import deque
+
+# Queued writes allowed before save() and submit() block
+MAX_PENDING = 32
+
+
+def write_atomic(path, content):
+    """Write text through a temporary file and rename it over path, so a crash never leaves half a note."""
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except OSError:
+        mode = None
+    try:
+        with open(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666), "w", encoding="utf-8", errors="surrogatepass") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class WriteBehindSaver:
+    """Write notes on a background thread, coalescing saves queued for the same file.
+
+    on_saved(path, content) and on_error(path, error) run on the writer thread.
+    """
+
+    def __init__(self, on_saved=None, on_error=None, max_pending=MAX_PENDING):
+        self.on_saved = on_saved
+        self.on_error = on_error
+        self.max_pending = max_pending
+        self._cond = threading.Condition()
+        # Queued [path, content, job] entries, and the plain save per path that later saves may replace
+        self._queue = deque()
+        self._latest = {}
+        self._writing = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def save(self, path, content):
+        """Queue content to be written to path, replacing any write still waiting for that path."""
+        with self._cond:
+            entry = self._latest.get(path)
+            if entry is not None:
+                entry[1] = content
+                return
+            entry = self._latest[path] = [path, content, None]
+            self._enqueue(entry)
+
+    def submit(self, path, job):
+        """Queue job() to run in order with the writes to path; on_saved receives its result."""
+        with self._cond:
+            # Later saves must queue behind the job rather than replace an earlier write
+            self._latest.pop(path, None)
+            self._enqueue([path, None, job])
+
+    def _enqueue(self, entry):
+        if self._closed:
+            raise RuntimeError("saver is closed")
+        while len(self._queue) >= self.max_pending:
+            self._cond.wait()
+        self._queue.append(entry)
+        self._cond.notify_all()
+
+    def pending(self, path):
+        """Return True if a write or job for path is queued or in progress."""
+        with self._cond:
+            return self._busy(path)
+
+    def _busy(self, path):
+        if path is None:
+            return bool(self._queue) or self._writing is not None
+        return self._writing == path or any(entry[0] == path for entry in self._queue)
+
+    def flush(self, path=None):
+        """Block until the writes queued for path, or for every path when None, are done."""
+        with self._cond:
+            while self._busy(path):
+                self._cond.wait()
+
+    def close(self):
+        """Finish every queued write and stop the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                entry = self._queue.popleft()
+                path, content, job = entry
+                if self._latest.get(path) is entry:
+                    del self._latest[path]
+                self._writing = path
+                self._cond.notify_all()
+            try:
+                if job is None:
+                    write_atomic(path, content)
+                else:
+                    content = job()
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(path, e)
+            else:
+                if self.on_saved:
+                    self.on_saved(path, content)
+            finally:
+                with self._cond:
+                    self._writing = None
+                    self._cond.notify_all()
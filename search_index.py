@@ -0,0 +1,355 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from array import array
+from collections import defaultdict, deque
+
+import packstore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT UNIQUE NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    terms TEXT NOT NULL,
+    sequence BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT PRIMARY KEY,
+    docs BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS recent (
+    term TEXT NOT NULL,
+    note_id INTEGER NOT NULL,
+    PRIMARY KEY (term, note_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS dead (
+    id INTEGER PRIMARY KEY,
+    terms TEXT NOT NULL
+);
+"""
+
+TOKEN_RE = re.compile(r"\w+")
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+# Notes larger than this are left out of the index
+MAX_INDEXED_BYTES = 32 * 1024 * 1024
+
+# Queued updates handled in one transaction; batches this large append straight to the term lists
+BATCH_SIZE = 500
+BULK_THRESHOLD = 50
+
+# Fold recent postings and dead notes into the term lists once either grows past these
+MERGE_RECENT = 200000
+MERGE_DEAD = 2000
+
+# Candidates fetched per query when checking phrases, and the time allowed for checking them
+VERIFY_BATCH = 200
+VERIFY_BUDGET = 0.08
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens."""
+    return TOKEN_RE.findall(text.lower())
+
+
+def parse_query(query):
+    """Split a query into phrases (lists of terms); quoted text is one phrase, bare words are one each."""
+    phrases = []
+    for quoted, word in QUERY_RE.findall(query):
+        terms = tokenize(quoted if quoted else word)
+        if terms:
+            phrases.append(terms)
+    return phrases
+
+
+def term_hashes(terms, cache):
+    """Return the 32-bit hash of each term as an array, memoising in cache."""
+    hashes = array("I")
+    for term in terms:
+        value = cache.get(term)
+        if value is None:
+            value = cache[term] = zlib.crc32(term.encode("utf-8"))
+        hashes.append(value)
+    return hashes
+
+
+def contains_sequence(haystack, needle):
+    """Return True if the bytes of needle occur in haystack at a 4-byte aligned offset."""
+    start = haystack.find(needle)
+    while start != -1:
+        if start % 4 == 0:
+            return True
+        start = haystack.find(needle, start + 1)
+    return False
+
+
+class SearchIndex:
+    """Positional inverted index from terms to notes, stored in SQLite and updated incrementally.
+
+    Each term maps to a sorted array of note ids. A note gets a new, higher id every time it is
+    re-indexed, so ids double as recency and results come back newest first. Single saves go to
+    a small table of recent postings and replaced ids are masked out until a background merge
+    folds both into the term arrays. Each note also keeps its token sequence as 32-bit term
+    hashes, which is only read to check phrases (a hash collision can, very rarely, let a phrase
+    match that is not there).
+    """
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.executescript(SCHEMA)
+            self._dead = {note_id for (note_id,) in self._conn.execute("SELECT id FROM dead")}
+        self._cond = threading.Condition()
+        self._jobs = deque()
+        self._open_updates = {}
+        self._busy = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # Requests, safe to call from any thread
+
+    def update(self, path, text=None):
+        """Re-index a note from the given text, or from disk when text is None."""
+        with self._cond:
+            job = self._open_updates.get(path)
+            if job is None:
+                job = self._open_updates[path] = ["update", path, text]
+                self._jobs.append(job)
+                self._cond.notify()
+            job[2] = text
+
+    def remove(self, path):
+        """Drop a note, or every note below a directory, from the index."""
+        self._submit("remove", path)
+
+    def rename(self, old, new):
+        """Re-key a note, or every note below a directory, after a move or rename."""
+        self._submit("rename", old, new)
+
+    def sync(self, root, notes):
+        """Queue re-indexing of notes whose (mtime, size) changed and drop notes under root that are gone.
+
+        notes is an iterable of (path, mtime, size) for every note currently under root.
+        """
+        self._submit("sync", root, list(notes))
+
+    def wait(self):
+        """Block until every queued request has been applied."""
+        with self._cond:
+            while self._jobs or self._busy:
+                self._cond.wait()
+
+    def _submit(self, *job):
+        with self._cond:
+            # Later updates must queue behind this job rather than coalesce into earlier ones
+            self._open_updates.clear()
+            self._jobs.append(job)
+            self._cond.notify()
+
+    # Queries
+
+    def search(self, query, limit=100):
+        """Return paths of up to limit notes containing every word and quoted phrase, newest first.
+
+        Checking phrases stops once VERIFY_BUDGET has passed, so a phrase made of very common
+        words may return only the newest matches.
+        """
+        phrases = parse_query(query)
+        if not phrases:
+            return []
+        deadline = time.perf_counter() + VERIFY_BUDGET
+        with self._lock:
+            lists = [self._docs(term) for term in {term for phrase in phrases for term in phrase}]
+            lists.sort(key=len)
+            candidates = lists[0]
+            for docs in lists[1:]:
+                candidates = candidates.intersection(docs)
+                if not candidates:
+                    return []
+            ordered = sorted(candidates, reverse=True)
+            needles = [term_hashes(phrase, {}).tobytes() for phrase in phrases if len(phrase) > 1]
+            column = "sequence" if needles else "NULL"
+            results = []
+            for start in range(0, len(ordered), VERIFY_BATCH):
+                if needles and start and time.perf_counter() > deadline:
+                    break
+                batch = ordered[start:start + VERIFY_BATCH]
+                marks = ",".join("?" * len(batch))
+                rows = {note_id: (path, sequence) for note_id, path, sequence in self._conn.execute(
+                    f"SELECT id, path, {column} FROM notes WHERE id IN ({marks})", batch
+                )}
+                for note_id in batch:
+                    row = rows.get(note_id)
+                    if row is None:
+                        continue
+                    if needles and not all(contains_sequence(row[1], needle) for needle in needles):
+                        continue
+                    results.append(row[0])
+                    if len(results) >= limit:
+                        return results
+        return results
+
+    def _docs(self, term):
+        """Return the live note ids containing a term. Caller holds the lock."""
+        row = self._conn.execute("SELECT docs FROM terms WHERE term = ?", (term,)).fetchone()
+        ids = array("I")
+        if row is not None:
+            ids.frombytes(row[0])
+        docs = set(ids)
+        docs.update(note_id for (note_id,) in self._conn.execute("SELECT note_id FROM recent WHERE term = ?", (term,)))
+        if self._dead:
+            docs.difference_update(self._dead)
+        return docs
+
+    # Background writer
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._jobs:
+                    self._cond.wait()
+                job = self._jobs.popleft()
+                batch = [job]
+                while job[0] == "update" and self._jobs and self._jobs[0][0] == "update" and len(batch) < BATCH_SIZE:
+                    batch.append(self._jobs.popleft())
+                for queued in batch:
+                    if queued[0] == "update" and self._open_updates.get(queued[1]) is queued:
+                        del self._open_updates[queued[1]]
+                self._busy = True
+            try:
+                if job[0] == "update":
+                    self._index([(queued[1], queued[2]) for queued in batch])
+                elif job[0] == "remove":
+                    self._remove(job[1])
+                elif job[0] == "rename":
+                    self._rename(job[1], job[2])
+                else:
+                    self._sync(job[1], job[2])
+                self._maybe_merge()
+            except (OSError, sqlite3.Error):
+                pass
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _index(self, items):
+        """Replace the postings of a batch of (path, text or None) notes."""
+        prepared = []
+        gone = []
+        hash_cache = {}
+        for path, text in items:
+            try:
+                st = packstore.stat(path)
+                if st.st_size > MAX_INDEXED_BYTES:
+                    gone.append(path)
+                    continue
+                if text is None:
+                    text = packstore.read_text(path, errors="replace")
+            except OSError:
+                gone.append(path)
+                continue
+            tokens = tokenize(text)
+            prepared.append((path, st, set(tokens), term_hashes(tokens, hash_cache).tobytes()))
+        bulk = len(prepared) >= BULK_THRESHOLD
+        appended = defaultdict(lambda: array("I"))
+        with self._lock, self._conn:
+            for path in gone:
+                self._kill(path)
+            for path, st, terms, sequence in prepared:
+                self._kill(path)
+                note_id = self._conn.execute(
+                    "INSERT INTO notes (path, mtime, size, terms, sequence) VALUES (?, ?, ?, ?, ?)",
+                    (path, st.st_mtime, st.st_size, " ".join(terms), sequence),
+                ).lastrowid
+                if bulk:
+                    for term in terms:
+                        appended[term].append(note_id)
+                else:
+                    self._conn.executemany(
+                        "INSERT INTO recent (term, note_id) VALUES (?, ?)", ((term, note_id) for term in terms)
+                    )
+            # New ids are larger than any already stored, so appending keeps each array sorted
+            for term, ids in appended.items():
+                row = self._conn.execute("SELECT docs FROM terms WHERE term = ?", (term,)).fetchone()
+                docs = (row[0] if row else b"") + ids.tobytes()
+                self._conn.execute("INSERT OR REPLACE INTO terms (term, docs) VALUES (?, ?)", (term, docs))
+
+    def _kill(self, path, prefix=False):
+        """Retire the ids of a note, or of every note below a directory. Caller holds the lock."""
+        if prefix:
+            rows = self._conn.execute(
+                "SELECT id, terms FROM notes WHERE path = ? OR (path > ? AND path < ?)",
+                (path, path + os.sep, path + chr(ord(os.sep) + 1)),
+            ).fetchall()
+        else:
+            rows = self._conn.execute("SELECT id, terms FROM notes WHERE path = ?", (path,)).fetchall()
+        for note_id, terms in rows:
+            self._conn.execute("INSERT OR REPLACE INTO dead (id, terms) VALUES (?, ?)", (note_id, terms))
+            self._conn.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+            self._dead.add(note_id)
+
+    def _remove(self, path):
+        with self._lock, self._conn:
+            self._kill(path, prefix=True)
+
+    def _rename(self, old, new):
+        with self._lock, self._conn:
+            exists = self._conn.execute(
+                "SELECT 1 FROM notes WHERE path = ? OR (path > ? AND path < ?) LIMIT 1",
+                (old, old + os.sep, old + chr(ord(os.sep) + 1)),
+            ).fetchone()
+            if exists is None:
+                return
+            self._kill(new, prefix=True)
+            self._conn.execute(
+                "UPDATE notes SET path = ? || substr(path, ?) WHERE path = ? OR (path > ? AND path < ?)",
+                (new, len(old) + 1, old, old + os.sep, old + chr(ord(os.sep) + 1)),
+            )
+
+    def _sync(self, root, notes):
+        lo, hi = root + os.sep, root + chr(ord(os.sep) + 1)
+        with self._lock:
+            known = {path: (mtime, size) for path, mtime, size in self._conn.execute(
+                "SELECT path, mtime, size FROM notes WHERE path > ? AND path < ?", (lo, hi)
+            )}
+        for path, mtime, size in notes:
+            if known.pop(path, None) != (mtime, size):
+                self.update(path)
+        for path in known:
+            self.remove(path)
+
+    def _maybe_merge(self):
+        """Fold recent postings into the term arrays and purge dead ids once either has grown."""
+        with self._lock:
+            recent = self._conn.execute("SELECT count(*) FROM recent").fetchone()[0]
+            if recent < MERGE_RECENT and len(self._dead) < MERGE_DEAD:
+                return
+            affected = {term for (term,) in self._conn.execute("SELECT DISTINCT term FROM recent")}
+            for (terms,) in self._conn.execute("SELECT terms FROM dead"):
+                affected.update(terms.split())
+            dead = set(self._dead)
+        affected = sorted(affected)
+        # Each chunk leaves the index consistent, so queries can run between chunks
+        for start in range(0, len(affected), 1000):
+            with self._lock, self._conn:
+                for term in affected[start:start + 1000]:
+                    docs = self._docs(term)
+                    self._conn.execute("DELETE FROM recent WHERE term = ?", (term,))
+                    if docs:
+                        self._conn.execute(
+                            "INSERT OR REPLACE INTO terms (term, docs) VALUES (?, ?)",
+                            (term, array("I", sorted(docs)).tobytes()),
+                        )
+                    else:
+                        self._conn.execute("DELETE FROM terms WHERE term = ?", (term,))
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM dead WHERE id = ?", ((note_id,) for note_id in dead))
+            self._dead.difference_update(dead)
@@ -0,0 +1,138 @@
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+
+# The Tk thread checks in this often (seconds); a gap longer than STALL_THRESHOLD is a stall
+HEARTBEAT_INTERVAL = 0.05
+STALL_THRESHOLD = 0.2
+
+# The stall log is rotated to <log>.1 once it grows past this
+MAX_LOG_BYTES = 1024 * 1024
+
+# Upper bounds (ms) of the keystroke latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = (8, 16, 33, 50, 100, 250, 500)
+
+# Latencies kept for percentiles
+LATENCY_SAMPLES = 1000
+
+
+class StallMonitor:
+    """Watch the Tk main loop for stalls and time keystrokes until the loop is idle again.
+
+    A root.after heartbeat marks the loop as alive. A helper thread notices when it stops beating
+    for longer than the threshold, captures the Tk thread's stack while it is stuck, and appends
+    the stall to a JSON-lines log once the loop recovers. The operation is the outermost function
+    on that stack from app_file, i.e. the callback Tk was running.
+    """
+
+    def __init__(self, root, log_path, app_file=None, threshold=STALL_THRESHOLD, interval=HEARTBEAT_INTERVAL):
+        self.root = root
+        self.log_path = log_path
+        self.app_file = os.path.abspath(app_file) if app_file else None
+        self.threshold = threshold
+        self.interval = interval
+        self.stall_counts = {}
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self._tk_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stall = None
+        self._key_pending = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+
+    def start(self):
+        """Start the heartbeat and the watching thread. Call from the Tk thread."""
+        self._tk_thread = threading.get_ident()
+        self._beat()
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching."""
+        self._stop.set()
+
+    def _beat(self):
+        self._last_beat = time.monotonic()
+        if not self._stop.is_set():
+            self.root.after(int(self.interval * 1000), self._beat)
+
+    # Keystroke latency
+
+    def key_released(self, event=None):
+        """Start timing a keystroke; bind to <KeyRelease>."""
+        if not self._key_pending:
+            self._key_pending = True
+            self.root.after_idle(self._key_idle, time.perf_counter())
+
+    def _key_idle(self, start):
+        self._key_pending = False
+        latency = (time.perf_counter() - start) * 1000
+        self.latencies.append(latency)
+        bucket = 0
+        while bucket < len(LATENCY_BUCKETS) and latency > LATENCY_BUCKETS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+
+    def summary(self):
+        """Return a one-line summary of keystroke latency and stalls."""
+        if not self.latencies:
+            keys = "Key lag: -"
+        else:
+            ordered = sorted(self.latencies)
+            keys = f"Key lag p50 {ordered[len(ordered) // 2]:.0f} ms, p95 {ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]:.0f} ms"
+        total = sum(self.histogram)
+        if total:
+            labels = [f"≤{bound}" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}"]
+            keys += " [" + " ".join(f"{label}:{count * 100 // total}%" for label, count in zip(labels, self.histogram) if count) + "]"
+        stalls = sum(self.stall_counts.values())
+        if stalls:
+            worst = max(self.stall_counts, key=self.stall_counts.get)
+            return f"{keys}  Stalls {stalls} (most in {worst})"
+        return f"{keys}  Stalls 0"
+
+    # Stall detection, on the helper thread
+
+    def _watch(self):
+        while not self._stop.wait(self.interval / 2):
+            last = self._last_beat
+            if self._stall is None:
+                if time.monotonic() - last > self.threshold + self.interval:
+                    self._stall = self._capture(last)
+            elif last != self._stall["beat"]:
+                stall, self._stall = self._stall, None
+                stall["duration_ms"] = round((last - stall.pop("beat") - self.interval) * 1000)
+                self.stall_counts[stall["operation"]] = self.stall_counts.get(stall["operation"], 0) + 1
+                self._log(stall)
+
+    def _capture(self, beat):
+        """Describe what the Tk thread is doing right now."""
+        frame = sys._current_frames().get(self._tk_thread)
+        stack = traceback.format_stack(frame) if frame is not None else []
+        operation = None
+        while frame is not None:
+            code = frame.f_code
+            if code.co_name != "<module>" and (self.app_file is None or os.path.abspath(code.co_filename) == self.app_file):
+                operation = code.co_name
+                if self.app_file is None:
+                    break
+            frame = frame.f_back
+        return {
+            "beat": beat,
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "operation": operation or "idle",
+            "stack": stack,
+        }
+
+    def _log(self, stall):
+        try:
+            if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > MAX_LOG_BYTES:
+                os.replace(self.log_path, self.log_path + ".1")
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(stall) + "\n")
+        except OSError:
+            pass  # Losing a stall report must not disturb the app
@@ -0,0 +1,78 @@
+import math
+import re
+
+# Average silent reading speed the reading time is estimated from
+WORDS_PER_MINUTE = 200
+
+WORD = re.compile(r"\S+")
+
+
+def count(text):
+    """Return (words, characters) of a text, line breaks not counted as characters."""
+    return len(WORD.findall(text)), len(text) - text.count("\n")
+
+
+def reading_minutes(words):
+    """Return the whole minutes it takes to read words, at least one for any text."""
+    return math.ceil(words / WORDS_PER_MINUTE)
+
+
+def format_stats(words, chars):
+    """Return the status line text for a note's counts."""
+    return f"{words:,} words · {chars:,} characters · {reading_minutes(words)} min read"
+
+
+def format_total(words):
+    """Return the short total shown beside a row in the tree."""
+    if words >= 10000:
+        return f"{words / 1000:.0f}k words"
+    return f"{words:,} words"
+
+
+class DocumentStats:
+    """Word and character counts of a Text widget, kept per line and updated from edit deltas.
+
+    Fed by an EditRecorder through changed(); each change recounts only the lines it touched and
+    adjusts the running totals, so the cost of a keystroke does not depend on the note's length.
+    on_change, if set, is called after every update.
+    """
+
+    def __init__(self, text, on_change=None):
+        self.text = text
+        self.on_change = on_change
+        # (words, characters) per line
+        self._lines = []
+        self.words = 0
+        self.chars = 0
+        self.reset()
+
+    def reset(self):
+        """Recount the whole text, e.g. after a change the recorder could not describe."""
+        lines = self.text.get("1.0", "end - 1 chars").split("\n")
+        self._lines = [count(line) for line in lines]
+        self.words = sum(words for words, _ in self._lines)
+        self.chars = sum(chars for _, chars in self._lines)
+        self._notify()
+
+    def changed(self, change):
+        """Recount the lines an editrecorder Change touched."""
+        if change.op == "reset":
+            self.reset()
+            return
+        first = change.start[0]
+        last = change.end[0]
+        new_last = first + change.text.count("\n") if change.op == "insert" else first
+        for words, chars in self._lines[first - 1:last]:
+            self.words -= words
+            self.chars -= chars
+        lines = self.text.get(f"{first}.0", f"{new_last}.end").split("\n")
+        counts = [count(line) for line in lines]
+        self._lines[first - 1:last] = counts
+        for words, chars in counts:
+            self.words += words
+            self.chars += chars
+        self._notify()
+
+    def _notify(self):
+        if self.on_change is not None:
+            self.on_change(self)
@@ -0,0 +1,98 @@
+import threading
+import tkinter as tk
+from tkinter import ttk
+
+# How often (ms) the progress dialog checks on its task
+POLL_INTERVAL = 100
+
+
+class BackgroundTask:
+    """Run work(task) on a worker thread, with progress reporting and cooperative cancellation.
+
+    work calls task.advance() after each item and stops early once task.cancelled is set. Its
+    return value ends up in result, or the exception it raised in error.
+    """
+
+    def __init__(self, work, total):
+        self.work = work
+        self.total = total
+        self.done = 0
+        self.label = ""
+        self.result = None
+        self.error = None
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """Start the work on its thread."""
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.result = self.work(self)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._finished.set()
+
+    def advance(self, label=""):
+        """Count one item as done."""
+        self.done += 1
+        self.label = label
+
+    def cancel(self):
+        """Ask the work to stop after the current item."""
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        """True once cancel() was called."""
+        return self._cancel.is_set()
+
+    @property
+    def finished(self):
+        """True once the work has returned or raised."""
+        return self._finished.is_set()
+
+
+class ProgressDialog:
+    """Modal dialog showing the progress of a BackgroundTask, with a Cancel button.
+
+    Starts the task, and calls on_finish(task) on the Tk thread once it is over.
+    """
+
+    def __init__(self, root, task, title, on_finish):
+        self.root = root
+        self.task = task
+        self.on_finish = on_finish
+        self.dialog = tk.Toplevel(root)
+        self.dialog.title(title)
+        self.dialog.geometry("360x110")
+        self.dialog.protocol("WM_DELETE_WINDOW", self.cancel)
+        self.status = tk.Label(self.dialog, text="", anchor="w")
+        self.status.pack(fill="x", padx=10, pady=(10, 0))
+        self.bar = ttk.Progressbar(self.dialog, maximum=max(task.total, 1), length=340)
+        self.bar.pack(padx=10, pady=5)
+        self.cancel_btn = tk.Button(self.dialog, text="Cancel", command=self.cancel)
+        self.cancel_btn.pack(pady=(0, 10))
+        self.dialog.grab_set()
+        task.start()
+        self._poll()
+
+    def cancel(self):
+        """Stop the task after its current item."""
+        self.task.cancel()
+        self.cancel_btn.config(state="disabled", text="Cancelling...")
+
+    def _poll(self):
+        # The work may only learn its total once it has started
+        self.bar["maximum"] = max(self.task.total, 1)
+        self.bar["value"] = self.task.done
+        self.status.config(text=f"{self.task.done} of {self.task.total}  {self.task.label}")
+        if not self.task.finished:
+            self.root.after(POLL_INTERVAL, self._poll)
+            return
+        self.dialog.grab_release()
+        self.dialog.destroy()
+        self.on_finish(self.task)
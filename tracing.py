@@ -0,0 +1,185 @@
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Set to 1 to record traces from startup, whatever the settings say
+TRACE_ENV = "JOURNA_TRACE"
+
+# Spans kept in memory; older ones are dropped
+RING_SIZE = 10000
+
+# Process-wide I/O counters; only on Linux
+PROC_IO = "/proc/self/io"
+
+
+def _is_fs_event(event):
+    return event == "open" or event.startswith(("os.", "shutil."))
+
+
+def _read_io():
+    """Return (bytes read, bytes written) by the process so far, or None where unavailable."""
+    try:
+        with open(PROC_IO, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    counters = dict(line.split(b": ") for line in data.splitlines() if b": " in line)
+    # Leave out the read of PROC_IO itself
+    return int(counters[b"rchar"]) - len(data), int(counters[b"wchar"])
+
+
+class Tracer:
+    """Record how long traced operations take, in a ring buffer of spans.
+
+    Each span also counts the filesystem calls its thread made, as seen by audit hooks (open,
+    os.* and shutil.* events; stat is not audited), and the bytes the process read and wrote while
+    it ran. Those byte counts are process-wide, so background writes that overlap a span count
+    towards it. Nothing is recorded while disabled.
+
+    A span made by traced is named after the function. The app traces these on the Tk thread:
+    load_tree, on_select, _load_note, save_current, run_search, _load_meta, _move_note_to_journal,
+    delete_item (up to the start of the background delete), _switch_save_dir, _apply_fs_events and
+    _apply_reconcile. On worker threads it traces NoteStore's delete and delete_many, and a save
+    dir migration as "migration".
+    """
+
+    def __init__(self, size=RING_SIZE):
+        self.enabled = False
+        self.events = deque(maxlen=size)
+        self._local = threading.local()
+        self._hooked = False
+        self._origin = time.perf_counter()
+        self._profile = None
+
+    def enable(self, enabled=True):
+        """Start or stop recording."""
+        if enabled and not self._hooked:
+            # Audit hooks cannot be removed, so it is only added once tracing is first wanted
+            sys.addaudithook(self._audit)
+            self._hooked = True
+        self.enabled = enabled
+
+    def _audit(self, event, args):
+        if self.enabled and _is_fs_event(event) and not getattr(self._local, "quiet", False):
+            self._local.fs_calls = getattr(self._local, "fs_calls", 0) + 1
+
+    def _io(self):
+        """Read the process I/O counters without counting the read as a filesystem call."""
+        self._local.quiet = True
+        try:
+            return _read_io()
+        finally:
+            self._local.quiet = False
+
+    @contextmanager
+    def span(self, name):
+        """Record the block as a span called name."""
+        if not self.enabled:
+            yield
+            return
+        fs_calls = getattr(self._local, "fs_calls", 0)
+        io_before = self._io()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            io_after = self._io()
+            event = {
+                "name": name,
+                "start": start - self._origin,
+                "duration": end - start,
+                "thread": threading.get_ident(),
+                "fs_calls": getattr(self._local, "fs_calls", 0) - fs_calls,
+            }
+            if io_before and io_after:
+                event["bytes_read"] = io_after[0] - io_before[0]
+                event["bytes_written"] = io_after[1] - io_before[1]
+            self.events.append(event)
+
+    def traced(self, fn):
+        """Decorate fn so each call is recorded as a span named after it."""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return fn(*args, **kwargs)
+            with self.span(fn.__name__):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def clear(self):
+        """Drop every recorded span."""
+        self.events.clear()
+
+    def stats(self):
+        """Return {name: {count, p50_ms, p95_ms, max_ms, fs_calls, bytes_read, bytes_written}}, averages per call."""
+        grouped = {}
+        for event in list(self.events):
+            grouped.setdefault(event["name"], []).append(event)
+        out = {}
+        for name, events in grouped.items():
+            durations = sorted(event["duration"] * 1000 for event in events)
+            count = len(events)
+            out[name] = {
+                "count": count,
+                "p50_ms": durations[count // 2],
+                "p95_ms": durations[min(count - 1, int(count * 0.95))],
+                "max_ms": durations[-1],
+                "fs_calls": sum(event["fs_calls"] for event in events) / count,
+                "bytes_read": sum(event.get("bytes_read", 0) for event in events) / count,
+                "bytes_written": sum(event.get("bytes_written", 0) for event in events) / count,
+            }
+        return out
+
+    def export_chrome(self, path):
+        """Write the recorded spans as Chrome trace-event JSON, for chrome://tracing or Perfetto."""
+        pid = os.getpid()
+        trace = [
+            {
+                "name": event["name"],
+                "ph": "X",
+                "ts": event["start"] * 1e6,
+                "dur": event["duration"] * 1e6,
+                "pid": pid,
+                "tid": event["thread"],
+                "args": {key: event[key] for key in ("fs_calls", "bytes_read", "bytes_written") if key in event},
+            }
+            for event in list(self.events)
+        ]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+
+    @property
+    def profiling(self):
+        """True while a cProfile capture is running."""
+        return self._profile is not None
+
+    def start_profile(self):
+        """Start a cProfile capture of the calling thread."""
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop_profile(self, path=None, limit=30):
+        """Stop the capture, save it to path if given, and return the top functions by cumulative time."""
+        profile, self._profile = self._profile, None
+        if profile is None:
+            return ""
+        profile.disable()
+        if path:
+            profile.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+
+tracer = Tracer()
+traced = tracer.traced
@@ -0,0 +1,320 @@
+import hashlib
+import json
+import os
+import time
+import zlib
+from collections import OrderedDict
+
+# Bytes of history kept per note; the oldest steps are dropped once a note's history is larger
+UNDO_BYTES = 4 * 1024 * 1024
+
+# Notes whose history is kept in memory; the least recently open ones are written to disk if
+# that is enabled, and dropped otherwise
+UNDO_NOTES = 10
+
+# Edits further apart than this are undone separately even if they continue each other
+GROUP_SECONDS = 1.0
+
+# Rough memory cost of an op beyond its text, for the byte cap
+OP_OVERHEAD = 100
+
+# History files untouched for this long are deleted
+SPILL_MAX_AGE = 30 * 24 * 3600
+
+SPILL_SUFFIX = ".undo"
+
+
+def _end(line, col, text):
+    """Return the position after text inserted at (line, col)."""
+    newlines = text.count("\n")
+    if not newlines:
+        return line, col + len(text)
+    return line + newlines, len(text) - text.rfind("\n") - 1
+
+
+def _checksum(text):
+    return zlib.crc32(text.encode("utf-8", "surrogatepass"))
+
+
+def _size(step):
+    return sum(len(op[3]) + OP_OVERHEAD for op in step)
+
+
+class EditHistory:
+    """Undo and redo steps of one note.
+
+    A step is a list of ["i" or "d", line, column, text] ops, an insert or delete of text at a
+    position in the text as it was just before the op. Runs of typing and of backspace or delete
+    are merged into one op as they are recorded.
+    """
+
+    def __init__(self, undo=None, redo=None):
+        self.undo = undo or []
+        self.redo = redo or []
+        self.size = sum(_size(step) for step in self.undo + self.redo)
+        self._last = 0.0
+        # While the note is closed: checksums of the text the steps apply to and of that text
+        # stripped, and the step that strips it, since a saved note loses surrounding whitespace
+        self.checksum = None
+        self.stripped = None
+        self.trim = []
+
+    def clear(self):
+        self.undo, self.redo, self.size = [], [], 0
+
+    def seal(self, text):
+        """Remember the text the steps apply to, as the note is closed."""
+        stripped = text.strip()
+        self.checksum = _checksum(text)
+        self.stripped = _checksum(stripped)
+        lead = text[:len(text) - len(text.lstrip())]
+        trail = text[len(text.rstrip()):]
+        self.trim = []
+        if trail:
+            self.trim.append(["d", *_end(1, 0, text[:len(text) - len(trail)]), trail])
+        if lead:
+            self.trim.append(["d", 1, 0, lead])
+
+    def fits(self, text):
+        """Return True if the steps apply to text, the note as reopened, adding the strip of a save as a step."""
+        checksum = _checksum(text)
+        if checksum == self.checksum:
+            return True
+        if checksum != self.stripped:
+            return False
+        self.undo.append(self.trim)
+        self.size += _size(self.trim)
+        self.trim = []
+        return True
+
+    def record(self, op, now, cap):
+        """Add an op, merging it into the last one where it continues it."""
+        self.size -= sum(_size(step) for step in self.redo)
+        self.redo = []
+        step = self.undo[-1] if self.undo and now - self._last < GROUP_SECONDS else None
+        self._last = now
+        if step and self._merge(step, op):
+            if not step:
+                self.undo.pop()
+        elif step and step[-1][0] == "d" and op[0] == "i" and step[-1][1:3] == op[1:3]:
+            # Typing over a selection undoes as one step
+            step.append(op)
+            self.size += _size([op])
+        else:
+            self.undo.append([op])
+            self.size += _size([op])
+        while self.size > cap and self.undo:
+            self.size -= _size(self.undo.pop(0))
+        if self.size > cap:
+            self.clear()
+
+    def _merge(self, step, op):
+        last = step[-1]
+        kind, line, col, text = op
+        if last[0] == "i" and kind == "i":
+            if "\n" in last[3] or _end(*last[1:]) != (line, col):
+                return False
+            last[3] += text
+        elif last[0] == "d" and kind == "d" and _end(line, col, text) == (last[1], last[2]):
+            # Backspace
+            last[1], last[2], last[3] = line, col, text + last[3]
+        elif last[0] == "d" and kind == "d" and (line, col) == (last[1], last[2]):
+            # Forward delete
+            last[3] += text
+        elif last[0] == "i" and kind == "d" and _end(*last[1:]) == _end(*op[1:]) and last[3].endswith(text):
+            # Backspace over what was just typed
+            last[3] = last[3][:len(last[3]) - len(text)]
+            if not last[3]:
+                step.pop()
+            self.size -= len(text) + (0 if step and step[-1] is last else OP_OVERHEAD)
+            return True
+        else:
+            return False
+        self.size += len(text)
+        return True
+
+
+class UndoManager:
+    """Undo and redo for a Text widget whose contents are one note at a time, fed by an EditRecorder.
+
+    Edits are kept as ops rather than snapshots, so undoing in a large note costs only the text
+    the edit touched. Each note has its own history, capped at UNDO_BYTES with the oldest steps
+    dropped first. attach() starts recording for the note the widget now shows, picking up the
+    history it had when it was last open if the text still matches; detach() stops before the
+    widget is cleared for another note. Histories of the UNDO_NOTES most recently open notes are
+    kept in memory and, when spill_dir is set, older ones are written there compressed.
+    """
+
+    def __init__(self, text, recorder, spill_dir=None):
+        self.text = text
+        self.recorder = recorder
+        self.spill_dir = spill_dir
+        # Histories by note path, None for an untitled note, least recently open first
+        self._histories = OrderedDict()
+        self.key = None
+        self.history = None
+        self._applying = False
+        recorder.add_listener(self.changed)
+        if spill_dir:
+            self._prune()
+
+    # Switching notes
+
+    def attach(self, key):
+        """Record edits as the history of key, the note the widget now shows."""
+        self.detach()
+        history = self._histories.pop(key, None) or self._unspill(key)
+        if history is not None and not history.fits(self.text.get("1.0", "end - 1 chars")):
+            history = None  # Changed since it was last open
+        self.key = key
+        self.history = history or EditHistory()
+        self._histories[key] = self.history
+        self.recorder.keep_deleted = True
+        while len(self._histories) > UNDO_NOTES:
+            self._evict(*self._histories.popitem(last=False))
+
+    def detach(self):
+        """Stop recording, keeping the history for when the note is attached again."""
+        if self.history is None:
+            return
+        if self.history.undo or self.history.redo:
+            self.history.seal(self.text.get("1.0", "end - 1 chars"))
+        else:
+            self._histories.pop(self.key, None)
+        self.history = None
+        self.key = None
+        self.recorder.keep_deleted = False
+
+    def rename(self, old, new):
+        """Carry a note's history over to its new path."""
+        if self.key == old:
+            self.key = new
+        history = self._histories.pop(old, None)
+        if history is not None:
+            self._histories[new] = history
+        elif self.spill_dir and old is not None:
+            try:
+                os.replace(self._spill_path(old), self._spill_path(new))
+            except OSError:
+                pass
+
+    def forget(self, key):
+        """Drop a note's history."""
+        if self.key == key and self.history is not None:
+            self.history.clear()
+        else:
+            self._histories.pop(key, None)
+        if self.spill_dir and key is not None:
+            try:
+                os.remove(self._spill_path(key))
+            except OSError:
+                pass
+
+    def close(self):
+        """Write every history to disk if that is enabled."""
+        self.detach()
+        while self._histories:
+            self._evict(*self._histories.popitem(last=False))
+
+    # Recording
+
+    def changed(self, change):
+        """Record an editrecorder Change in the attached note's history."""
+        history = self.history
+        if history is None or self._applying:
+            return
+        if change.op == "reset" or (change.op == "delete" and change.text is None):
+            history.clear()
+            return
+        line, col = change.start
+        history.record(["i" if change.op == "insert" else "d", line, col, change.text], time.monotonic(), UNDO_BYTES)
+
+    # Undoing
+
+    def undo(self):
+        """Undo the last step. Returns False if there was none or the text no longer matches it."""
+        return self._step(self.history.undo if self.history else [], True)
+
+    def redo(self):
+        """Redo the last undone step. Returns False if there was none or the text no longer matches it."""
+        return self._step(self.history.redo if self.history else [], False)
+
+    def _step(self, stack, undoing):
+        if not stack:
+            return False
+        step = stack.pop()
+        ops = [(("d" if kind == "i" else "i"), line, col, text) for kind, line, col, text in reversed(step)] if undoing else step
+        self._applying = True
+        try:
+            ok = all(self._apply(*op) for op in ops)
+        finally:
+            self._applying = False
+        if not ok:
+            self.history.clear()
+            return False
+        (self.history.redo if undoing else self.history.undo).append(step)
+        # The next edit starts a step of its own
+        self.history._last = 0.0
+        return True
+
+    def _apply(self, kind, line, col, text):
+        """Insert or delete text at a position and move the cursor there. Returns False if a delete does not match."""
+        start = f"{line}.{col}"
+        if kind == "i":
+            self.text.insert(start, text)
+            cursor = "{}.{}".format(*_end(line, col, text))
+        else:
+            end = "{}.{}".format(*_end(line, col, text))
+            if self.text.get(start, end) != text:
+                return False
+            self.text.delete(start, end)
+            cursor = start
+        self.text.mark_set("insert", cursor)
+        self.text.see("insert")
+        return True
+
+    # Spilling to disk
+
+    def _spill_path(self, key):
+        name = hashlib.sha1(key.encode("utf-8", "surrogatepass")).hexdigest()
+        return os.path.join(self.spill_dir, name + SPILL_SUFFIX)
+
+    def _evict(self, key, history):
+        """Write a history pushed out of memory to disk, if enabled."""
+        if not self.spill_dir or key is None or not (history.undo or history.redo):
+            return
+        data = {"undo": history.undo, "redo": history.redo, "checksum": history.checksum, "stripped": history.stripped, "trim": history.trim}
+        path = self._spill_path(key)
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                f.write(zlib.compress(json.dumps(data).encode("utf-8", "surrogatepass"), 1))
+            os.replace(path + ".tmp", path)
+        except OSError:
+            pass  # The history is lost, as it would be without spilling
+
+    def _unspill(self, key):
+        """Read back and delete a history written by _evict, or return None."""
+        if not self.spill_dir or key is None:
+            return None
+        path = self._spill_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = json.loads(zlib.decompress(f.read()).decode("utf-8", "surrogatepass"))
+            os.remove(path)
+        except (OSError, ValueError, zlib.error):
+            return None
+        history = EditHistory(data["undo"], data["redo"])
+        history.checksum, history.stripped, history.trim = data["checksum"], data["stripped"], data["trim"]
+        return history
+
+    def _prune(self):
+        """Delete history files of notes not opened for SPILL_MAX_AGE."""
+        cutoff = time.time() - SPILL_MAX_AGE
+        try:
+            with os.scandir(self.spill_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(SPILL_SUFFIX) and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+        except OSError:
+            pass
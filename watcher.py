@@ -0,0 +1,278 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+
+# inotify constants from <sys/inotify.h>
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+EVENT_HEADER = struct.Struct("iIII")
+
+# Suffix of the temporary files a save writes and then renames over a note (see saver.write_atomic)
+TEMP_SUFFIX = ".tmp"
+
+
+def _load_libc():
+    """Return libc with the inotify calls, or None where inotify is unavailable."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def _without_temp_files(events):
+    """Drop events of temporary files, reporting a rename of one over a file as that file's creation."""
+    kept = []
+    for event in events:
+        if event[0] == "moved" and event[1].endswith(TEMP_SUFFIX):
+            if not event[2].endswith(TEMP_SUFFIX):
+                kept.append(("created", event[2]))
+        elif event[0] == "moved" and event[2].endswith(TEMP_SUFFIX):
+            kept.append(("deleted", event[1]))
+        elif event[0] == "overflow" or not event[1].endswith(TEMP_SUFFIX):
+            kept.append(event)
+    return kept
+
+
+class Watcher:
+    """Report external creates, deletes and renames under root.
+
+    Uses inotify on Linux and falls back to polling directory mtimes elsewhere. The callback
+    runs on the watcher thread with a list of ("created", path), ("deleted", path),
+    ("moved", old, new) or ("overflow", root) events. Temporary files of atomic saves are left
+    out: a save that renames one over a file is reported as that file being created.
+    """
+
+    def __init__(self, root, callback, max_depth=3, interval=2.0):
+        self.root = root
+        self.callback = callback
+        self.max_depth = max_depth
+        self.interval = interval
+        self.backend = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """Start watching on a background thread."""
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching."""
+        self._stop.set()
+        self._wake.set()
+
+    def poll_now(self):
+        """Ask the polling backend to scan right away. Does nothing for inotify."""
+        self._wake.set()
+
+    def _depth(self, path):
+        """Return how many levels below root a path is."""
+        rel = os.path.relpath(path, self.root)
+        return 0 if rel == "." else rel.count(os.sep) + 1
+
+    def _walk_dirs(self, top):
+        """Yield top and the directories below it, down to max_depth."""
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            yield path
+            if self._depth(path) >= self.max_depth:
+                continue
+            try:
+                with os.scandir(path) as it:
+                    stack.extend(entry.path for entry in it if entry.is_dir(follow_symlinks=False))
+            except OSError:
+                pass
+
+    def _run(self):
+        """Run the inotify backend if it can be set up, else the polling one."""
+        libc = _load_libc()
+        if libc is not None:
+            try:
+                self._run_inotify(libc)
+                return
+            except OSError:
+                pass
+        self._run_polling()
+
+    # inotify backend
+
+    def _run_inotify(self, libc):
+        """Read inotify events until stopped. Raises OSError if the watches cannot be set up."""
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        try:
+            wds = {}
+            for path in self._walk_dirs(self.root):
+                self._add_watch(libc, fd, wds, path)
+            self.backend = "inotify"
+            while not self._stop.is_set():
+                ready, _, _ = select.select([fd], [], [], 0.5)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(fd, 64 * 1024)
+                except BlockingIOError:
+                    continue
+                events = _without_temp_files(self._parse_inotify(libc, fd, wds, data))
+                if events:
+                    self.callback(events)
+        finally:
+            os.close(fd)
+
+    def _add_watch(self, libc, fd, wds, path):
+        """Add an inotify watch for one directory."""
+        wd = libc.inotify_add_watch(fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        wds[wd] = path
+
+    def _watch_new_dir(self, libc, fd, wds, top, events):
+        """Watch a directory that appeared, reporting anything created in it before the watch was added."""
+        if self._depth(top) > self.max_depth:
+            return
+        for path in self._walk_dirs(top):
+            try:
+                self._add_watch(libc, fd, wds, path)
+            except OSError:
+                events.append(("overflow", self.root))
+                return
+            if path != top:
+                events.append(("created", path))
+            try:
+                with os.scandir(path) as it:
+                    events.extend(("created", entry.path) for entry in it if not entry.is_dir(follow_symlinks=False))
+            except OSError:
+                pass
+
+    def _parse_inotify(self, libc, fd, wds, data):
+        """Turn a buffer of raw inotify events into watcher events, pairing renames by cookie."""
+        events = []
+        moved_from = {}
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                events.append(("overflow", self.root))
+                continue
+            if mask & IN_IGNORED:
+                wds.pop(wd, None)
+                continue
+            parent = wds.get(wd)
+            if parent is None:
+                continue
+            path = os.path.join(parent, os.fsdecode(name))
+            if mask & IN_CREATE:
+                events.append(("created", path))
+                if mask & IN_ISDIR:
+                    self._watch_new_dir(libc, fd, wds, path, events)
+            elif mask & IN_DELETE:
+                events.append(("deleted", path))
+            elif mask & IN_MOVED_FROM:
+                moved_from[cookie] = len(events)
+                events.append(("deleted", path))
+            elif mask & IN_MOVED_TO:
+                index = moved_from.pop(cookie, None)
+                if index is None:
+                    events.append(("created", path))
+                    if mask & IN_ISDIR:
+                        self._watch_new_dir(libc, fd, wds, path, events)
+                    continue
+                old = events[index][1]
+                events[index] = ("moved", old, path)
+                if mask & IN_ISDIR:
+                    prefix = old + os.sep
+                    for key, watched in list(wds.items()):
+                        if watched == old or watched.startswith(prefix):
+                            wds[key] = path + watched[len(old):]
+        return events
+
+    # Polling backend
+
+    def _run_polling(self):
+        """Compare directory mtimes every interval, or sooner when poll_now is called."""
+        self.backend = "polling"
+        state = {}
+        for path in self._walk_dirs(self.root):
+            self._snapshot(path, state)
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            events = _without_temp_files(self._poll(state))
+            if events:
+                self.callback(events)
+
+    def _snapshot(self, path, state):
+        """Record the mtime and {name: (inode, is_dir)} listing of a directory."""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            with os.scandir(path) as it:
+                names = {entry.name: (entry.inode(), entry.is_dir(follow_symlinks=False)) for entry in it}
+        except OSError:
+            state.pop(path, None)
+            return
+        state[path] = (mtime_ns, names)
+
+    def _poll(self, state):
+        """Re-list directories whose mtime changed and diff them against the last listing."""
+        created, deleted = [], []
+        for path in list(state):
+            if path not in state:
+                continue
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            old_mtime, old = state[path]
+            if mtime_ns == old_mtime:
+                continue
+            self._snapshot(path, state)
+            new = state.get(path, (None, {}))[1]
+            for name in old.keys() - new.keys():
+                child = os.path.join(path, name)
+                deleted.append((old[name][0], child))
+                if old[name][1]:
+                    prefix = child + os.sep
+                    for watched in [p for p in state if p == child or p.startswith(prefix)]:
+                        del state[watched]
+            for name in new.keys() - old.keys():
+                child = os.path.join(path, name)
+                created.append((new[name][0], child))
+                if new[name][1] and self._depth(child) <= self.max_depth:
+                    for sub in self._walk_dirs(child):
+                        self._snapshot(sub, state)
+                        if sub != child:
+                            created.append((0, sub))
+        events = []
+        by_inode = {inode: child for inode, child in created if inode}
+        for inode, old_path in deleted:
+            new_path = by_inode.pop(inode, None) if inode else None
+            if new_path:
+                events.append(("moved", old_path, new_path))
+            else:
+                events.append(("deleted", old_path))
+        moved_to = {event[2] for event in events if event[0] == "moved"}
+        events.extend(("created", child) for _, child in created if child not in moved_to)
+        return events